@@ -2,12 +2,16 @@ from flask import Flask
 import os
 from api.config import Config
 from api.extensions import mongo, bcrypt, cors, mail
-from api.util.common import CustomJSONEncoder
+from api.util.common import CustomJSONEncoder, init_log_buffer
 from flasgger import Swagger
+from api.services.unit_of_work import init_unit_of_work
 
 def create_app(config_class=Config):
     app = Flask(__name__, template_folder=os.path.join(os.getcwd(), 'api', 'templates'))
     app.config.from_object(config_class)
+    # Antes de mongo.init_app: el contador de consultas debe existir al crear el cliente.
+    init_unit_of_work(app)
+    init_log_buffer(app)
 
     # Initialize extensions
     mongo.init_app(app)
@@ -1,5 +1,6 @@
 from __future__ import annotations
 
+import logging
 import os
 from datetime import datetime, timezone
 from typing import Any, Dict, Optional
@@ -8,19 +9,27 @@ from bson import ObjectId
 from flask import Blueprint, jsonify, request
 
 from api.extensions import mongo
+from api.services.account_catalog_cache import AccountCatalogCache
 from api.services.accounting_service import (
     AccountCatalogService,
+    AccountHierarchyService,
+    AccountRollupService,
     AccountScopeService,
     SeedService,
     DEFAULT_YEAR,
     AccountingIndexes,
+    CHILDREN_COLUMNS,
+    columnar_payload,
+    rollup_headers_enabled,
+    stripe_states,
 )
 from api.services.project_funding_service import ProjectFundingService
-from api.util.common import agregar_log
+from api.services.unit_of_work import load_project
 from api.util.decorators import allow_cors, token_required
 
 
 accounting_bp = Blueprint("accounting", __name__)
+logger = logging.getLogger(__name__)
 
 
 def _parse_year() -> int:
@@ -76,22 +85,22 @@ def _can_access_project(user: Dict[str, Any], project_id: str):
     except Exception:
         return False, None
 
-    project = mongo.db.proyectos.find_one({"_id": project_obj_id})
+    project = load_project(project_obj_id)
     if not project:
         return False, None
+    return _project_access_allowed(user, project), project
 
+
+def _project_access_allowed(user: Dict[str, Any], project: Dict[str, Any]) -> bool:
     if _is_super_admin(user):
-        return True, project
+        return True
 
     user_dep = _user_department_id(user)
     project_dep = str(project.get("departamento_id")) if project.get("departamento_id") else None
     if user_dep and project_dep and user_dep == project_dep:
-        return True, project
-
-    if _project_member_match(project, user.get("sub")):
-        return True, project
+        return True
 
-    return False, project
+    return _project_member_match(project, user.get("sub"))
 
 
 def _allow_negative_balances() -> bool:
@@ -104,6 +113,10 @@ def _query_truthy(value: Optional[str], default: bool = False) -> bool:
     return str(value).strip().lower() in {"1", "true", "yes", "si", "on"}
 
 
+def _columnar_requested() -> bool:
+    return request.args.get("format", "").strip().lower() == "columnar"
+
+
 @accounting_bp.route("/accounts/tree", methods=["GET"])
 @accounting_bp.route("/api/accounts/tree", methods=["GET"])
 @allow_cors
@@ -111,8 +124,52 @@ def _query_truthy(value: Optional[str], default: bool = False) -> bool:
 def get_accounts_tree(user):
     year = _parse_year()
     group = request.args.get("group")
-    tree = AccountCatalogService.tree(year=year, group=group)
-    return jsonify({"year": year, "group": group, "tree": tree}), 200
+    root = request.args.get("root", "").strip() or None
+    if _columnar_requested():
+        columns = AccountCatalogService.tree_columnar(year=year, group=group, root=root)
+        return jsonify({"year": year, "group": group, "root": root, "columns": columns}), 200
+    tree = AccountCatalogService.tree(year=year, group=group, root=root)
+    return jsonify({"year": year, "group": group, "root": root, "tree": tree}), 200
+
+
+@accounting_bp.route("/accounts/tree/children", methods=["GET"])
+@accounting_bp.route("/api/accounts/tree/children", methods=["GET"])
+@allow_cors
+@token_required
+def get_accounts_tree_children(user):
+    year = _parse_year()
+    group = request.args.get("group")
+    parent = request.args.get("parent", "").strip() or None
+    scope_type = request.args.get("scopeType", "").strip()
+    scope_id = request.args.get("scopeId", "").strip()
+
+    if scope_type == "department" and scope_id and not _can_access_department(user, scope_id):
+        return _forbidden("No autorizado para consultar cuentas de este departamento")
+    if scope_type == "project" and scope_id:
+        allowed, _ = _can_access_project(user, scope_id)
+        if not allowed:
+            return _forbidden("No autorizado para consultar cuentas de este proyecto")
+    if scope_type == "global" and not _is_super_admin(user):
+        return _forbidden("Solo super_admin puede consultar cuentas globales")
+
+    try:
+        rows = AccountCatalogService.tree_children(
+            year=year,
+            parent=parent,
+            group=group,
+            scope_type=scope_type or None,
+            scope_id=scope_id or None,
+        )
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 404
+
+    payload: Dict[str, Any] = {"year": year, "group": group, "parent": parent}
+    if _columnar_requested():
+        columns = list(rows[0]) if rows else list(CHILDREN_COLUMNS)
+        payload["columns"] = columnar_payload(rows, columns)
+    else:
+        payload["children"] = rows
+    return jsonify(payload), 200
 
 
 @accounting_bp.route("/accounts/search", methods=["GET"])
@@ -170,6 +227,7 @@ def get_department_accounts(user, department_id):
         group=group,
         assigned_only=assigned_only,
         include_zero=include_zero,
+        columnar=_columnar_requested(),
     )
     return jsonify(payload), 200
 
@@ -247,6 +305,7 @@ def get_project_accounts(user, project_id):
         group=group,
         assigned_only=assigned_only,
         include_zero=include_zero,
+        columnar=_columnar_requested(),
     )
     return jsonify(payload), 200
 
@@ -299,12 +358,8 @@ def post_project_movement(user, project_id):
             reference=data.get("reference") if isinstance(data.get("reference"), dict) else {},
             created_by=str(user.get("sub")),
             allow_negative=_allow_negative_balances(),
+            logs=[(project["_id"], f"{user.get('nombre', 'Usuario')} registró movimiento contable {movement_type} {amount_value} en cuenta {account_code}")],
         )
-
-        try:
-            agregar_log(project["_id"], f"{user.get('nombre', 'Usuario')} registró movimiento contable {movement_type} {amount_value} en cuenta {account_code}")
-        except Exception:
-            pass
     except ValueError as exc:
         return jsonify({"message": str(exc)}), 400
 
@@ -335,7 +390,16 @@ def get_project_funding_timeline(user, project_id):
 
     page = int(request.args.get("page", "0"))
     limit = int(request.args.get("limit", "20"))
-    payload = ProjectFundingService.timeline_response(project, year=_parse_year(), page=page, limit=limit)
+    try:
+        payload = ProjectFundingService.timeline_response(
+            project,
+            year=_parse_year(),
+            page=page,
+            limit=limit,
+            cursor=request.args.get("cursor") or None,
+        )
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
     return jsonify(payload), 200
 
 
@@ -368,6 +432,54 @@ def create_project_funding_allocations(user, project_id):
     return jsonify(result), 201
 
 
+@accounting_bp.route("/projects/funding-allocations/bulk", methods=["POST"])
+@accounting_bp.route("/api/projects/funding-allocations/bulk", methods=["POST"])
+@allow_cors
+@token_required
+def create_bulk_project_funding_allocations(user):
+    data = request.get_json(silent=True) or {}
+    entries = data.get("projects") or []
+    if not isinstance(entries, list) or not entries:
+        return jsonify({"message": "projects es requerido"}), 400
+
+    allocations_by_project: Dict[str, Any] = {}
+    project_ids = []
+    for entry in entries:
+        project_id = str((entry or {}).get("projectId", "")).strip()
+        try:
+            project_ids.append(ObjectId(project_id))
+        except Exception:
+            return jsonify({"message": f"projectId inválido: {project_id}"}), 400
+        if project_id in allocations_by_project:
+            return jsonify({"message": f"Proyecto repetido en la solicitud: {project_id}"}), 400
+        allocations_by_project[project_id] = entry.get("allocations") or []
+
+    found = {row["_id"]: row for row in mongo.db.proyectos.find({"_id": {"$in": project_ids}})}
+    projects = []
+    for project_id in project_ids:
+        project = found.get(project_id)
+        if not project:
+            return jsonify({"message": f"Proyecto no encontrado: {project_id}"}), 404
+        if not _project_access_allowed(user, project):
+            return _forbidden(f"No autorizado para gestionar el proyecto {project_id}")
+        projects.append(project)
+
+    try:
+        result = ProjectFundingService.allocate_funds_bulk(
+            projects,
+            year=int(data.get("year", _parse_year())),
+            source_scope_type=str(data.get("sourceScopeType", "")).strip(),
+            source_scope_id=str(data.get("sourceScopeId", "")).strip(),
+            allocations_by_project=allocations_by_project,
+            user=user,
+            allow_negative=_allow_negative_balances(),
+        )
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+
+    return jsonify(result), 201
+
+
 @accounting_bp.route("/projects/<string:project_id>/funding-migration", methods=["POST"])
 @accounting_bp.route("/api/projects/<string:project_id>/funding-migration", methods=["POST"])
 @allow_cors
@@ -464,16 +576,10 @@ def admin_list_accounts(user):
     limit = int(request.args.get("limit", "20"))
     skip = page * limit
 
-    query = {"year": year}
-    if group:
-        query["group"] = group
-    if q:
-        query["$or"] = [{"code": {"$regex": q}}, {"description": {"$regex": q, "$options": "i"}}]
-
-    total = mongo.db.master_accounts.count_documents(query)
-    rows = list(
-        mongo.db.master_accounts.find(query, {"_id": 0}).sort("code", 1).skip(skip).limit(limit)
-    )
+    catalog = AccountCatalogCache.get(mongo.db, year)
+    codes = catalog.search_codes(q, group=group or None)
+    total = len(codes)
+    rows = [catalog.get(code).as_dict() for code in codes[skip:skip + limit]]
 
     if not rows:
         return jsonify({"request_list": [], "count": total}), 200
@@ -494,6 +600,8 @@ def admin_list_accounts(user):
         )
     )
     balance_by_code = {row["_id"]: float(row.get("balance", 0)) for row in balances}
+    for (_type, _id, code), entry in stripe_states(year, {k: v for k, v in state_match.items() if k != "year"}).items():
+        balance_by_code[code] = balance_by_code.get(code, 0.0) + entry["balance"]
 
     response_rows = []
     for row in rows:
@@ -535,6 +643,10 @@ def admin_create_account(user):
     if existing:
         return jsonify({"message": "Ya existe una cuenta con ese código para el año"}), 409
 
+    if parent_code == code:
+        return jsonify({"message": "Una cuenta no puede ser su propio padre"}), 400
+
+    ancestors, root_code = AccountHierarchyService.path_for(year, code, parent_code)
     now = datetime.now(timezone.utc)
     mongo.db.master_accounts.insert_one(
         {
@@ -545,10 +657,16 @@ def admin_create_account(user):
             "is_header": is_header,
             "level": level,
             "parent_code": parent_code,
+            "ancestors": ancestors,
+            "root_code": root_code,
             "createdAt": now,
             "updatedAt": now,
         }
     )
+    # Cuentas existentes que ya apuntaban a este código pasan a colgar de la nueva cuenta.
+    if mongo.db.master_accounts.count_documents({"year": year, "parent_code": code}) > 0:
+        AccountHierarchyService.on_account_created(year, code)
+    AccountCatalogCache.bump(mongo.db, year)
     return jsonify({"message": "Cuenta creada", "code": code, "year": year}), 201
 
 
@@ -580,14 +698,34 @@ def admin_update_account(user, code):
         if parent_code and (len(parent_code) != 12 or not parent_code.isdigit()):
             return jsonify({"message": "parent_code debe ser string numérico de 12 dígitos"}), 400
         update_fields["parent_code"] = parent_code or None
+        try:
+            AccountHierarchyService.validate_parent(year, code, update_fields["parent_code"])
+        except ValueError as exc:
+            return jsonify({"message": str(exc)}), 400
 
     if not update_fields:
         return jsonify({"message": "No hay campos para actualizar"}), 400
 
-    update_fields["updatedAt"] = datetime.now(timezone.utc)
-    result = mongo.db.master_accounts.update_one({"year": year, "code": code}, {"$set": update_fields})
-    if result.matched_count == 0:
+    current = mongo.db.master_accounts.find_one({"year": year, "code": code}, {"_id": 0, "parent_code": 1})
+    if not current:
         return jsonify({"message": "Cuenta no encontrada"}), 404
+
+    update_fields["updatedAt"] = datetime.now(timezone.utc)
+    mongo.db.master_accounts.update_one({"year": year, "code": code}, {"$set": update_fields})
+
+    # Re-parentar reescribe ancestors/root_code de la cuenta y de todo su subárbol.
+    if "parent_code" in update_fields and update_fields["parent_code"] != current.get("parent_code"):
+        try:
+            AccountHierarchyService.refresh_subtree(year, code)
+        except ValueError as exc:
+            # Una edición concurrente cerró un ciclo después de validar: se restaura el padre.
+            mongo.db.master_accounts.update_one(
+                {"year": year, "code": code},
+                {"$set": {"parent_code": current.get("parent_code")}},
+            )
+            AccountCatalogCache.bump(mongo.db, year)
+            return jsonify({"message": str(exc)}), 400
+    AccountCatalogCache.bump(mongo.db, year)
     return jsonify({"message": "Cuenta actualizada", "code": code, "year": year}), 200
 
 
@@ -613,6 +751,18 @@ def admin_delete_account(user, code):
     result = mongo.db.master_accounts.delete_one({"year": year, "code": code})
     if result.deleted_count == 0:
         return jsonify({"message": "Cuenta no encontrada"}), 404
+    AccountCatalogCache.bump(mongo.db, year)
+
+    # Filas con una ruta materializada vieja que aún pasa por la cuenta borrada: se recalculan
+    # desde su parent_code para no repartir totales entre raíces distintas.
+    stale = {
+        row["code"]: row.get("ancestors") or []
+        for row in mongo.db.master_accounts.find({"year": year, "ancestors": code}, {"_id": 0, "code": 1, "ancestors": 1})
+    }
+    for stale_code, ancestors in stale.items():
+        # Basta con la cima de cada subárbol; refresh_subtree reescribe a sus descendientes.
+        if not any(ancestor in stale for ancestor in ancestors):
+            AccountHierarchyService.refresh_subtree(year, stale_code)
     return jsonify({"message": "Cuenta eliminada", "code": code, "year": year}), 200
 
 
@@ -731,3 +881,120 @@ def admin_create_movement(user):
         return jsonify({"message": str(exc)}), 400
 
     return jsonify(result), 201
+
+
+@accounting_bp.route("/admin/accounts/movements/batch", methods=["POST"])
+@accounting_bp.route("/api/admin/accounts/movements/batch", methods=["POST"])
+@allow_cors
+@token_required
+def admin_create_movements_batch(user):
+    if not _is_super_admin(user):
+        return _forbidden("Solo super_admin puede registrar movimientos en lote")
+
+    data = request.get_json(silent=True) or {}
+    movements = data.get("movements")
+    if not isinstance(movements, list) or not movements:
+        return jsonify({"message": "movements es requerido y debe ser una lista"}), 400
+
+    try:
+        result = AccountScopeService.create_movements_batch(
+            year=int(data.get("year", _parse_year())),
+            items=movements,
+            created_by=str(user.get("sub")),
+            allow_negative=_allow_negative_balances(),
+        )
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+
+    if not result["applied"]:
+        return jsonify({"message": "El lote contiene movimientos inválidos; no se registró ninguno", **result}), 400
+    return jsonify(result), 201
+
+
+@accounting_bp.route("/admin/accounts/rollups/rebuild", methods=["POST"])
+@accounting_bp.route("/api/admin/accounts/rollups/rebuild", methods=["POST"])
+@allow_cors
+@token_required
+def admin_rebuild_account_rollups(user):
+    if not _is_super_admin(user):
+        return _forbidden("Solo super_admin puede recalcular saldos acumulados")
+
+    data = request.get_json(silent=True) or {}
+    scope_type = str(data.get("scopeType", "")).strip() or None
+    scope_id = str(data.get("scopeId", "")).strip() or None
+    if scope_type and scope_type not in {"department", "project", "global"}:
+        return jsonify({"message": "scopeType debe ser department, project o global"}), 400
+
+    result = AccountRollupService.rebuild(
+        year=int(data.get("year", _parse_year())),
+        scope_type=scope_type,
+        scope_id=scope_id,
+    )
+    return jsonify({**result, "rollupEnabled": rollup_headers_enabled()}), 200
+
+
+def _init_job_payload(job: dict) -> dict:
+    job = dict(job)
+    job.pop("scopeIds", None)
+    job.pop("lockedUntil", None)
+    return job
+
+
+@accounting_bp.route("/admin/accounts/init-bulk", methods=["POST"])
+@accounting_bp.route("/api/admin/accounts/init-bulk", methods=["POST"])
+@allow_cors
+@token_required
+def admin_init_scopes_bulk(user):
+    data = request.get_json(silent=True) or {}
+    target = str(data.get("target", "")).strip()
+    mode = str(data.get("mode", "detail_only")).strip() or "detail_only"
+    year = int(data.get("year", _parse_year()))
+
+    if target == "departments":
+        if not _is_super_admin(user):
+            return _forbidden("Solo super_admin puede inicializar todos los departamentos")
+        scope_type = "department"
+        scope_ids = [str(row["_id"]) for row in mongo.db.departamentos.find({}, {"_id": 1})]
+    elif target == "department_projects":
+        department_id = str(data.get("departmentId", "")).strip()
+        if not department_id:
+            return jsonify({"message": "departmentId es requerido"}), 400
+        if not _can_access_department(user, department_id):
+            return _forbidden("No autorizado para inicializar proyectos de este departamento")
+        dep_values: list = [department_id]
+        if ObjectId.is_valid(department_id):
+            dep_values.append(ObjectId(department_id))
+        scope_type = "project"
+        scope_ids = [
+            str(row["_id"])
+            for row in mongo.db.proyectos.find({"departamento_id": {"$in": dep_values}}, {"_id": 1})
+        ]
+    else:
+        return jsonify({"message": "target debe ser departments o department_projects"}), 400
+
+    try:
+        job = AccountScopeService.create_init_job(year, scope_type, scope_ids, mode, created_by=str(user.get("sub")))
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
+
+    # Sin hilos: el POST procesa un primer tramo acotado y el resto lo completa
+    # scripts/run_init_scopes_jobs.py (en serverless un hilo puede congelarse). Un fallo queda
+    # en el estado del job (``failed`` + ``error``).
+    job = AccountScopeService.advance_init_job(job["_id"]) or job
+    if job.get("status") == "failed":
+        logger.error("Fallo la inicializacion masiva de cuentas (job %s): %s", job.get("jobId"), job.get("error"))
+    job_id = job.get("jobId", job.get("_id"))
+    return jsonify({"jobId": job_id, "status": job["status"], "total": job["total"], "processed": job.get("processed", 0), "scopeType": scope_type}), 202
+
+
+@accounting_bp.route("/admin/accounts/init-bulk/<string:job_id>", methods=["GET"])
+@accounting_bp.route("/api/admin/accounts/init-bulk/<string:job_id>", methods=["GET"])
+@allow_cors
+@token_required
+def admin_init_scopes_bulk_status(user, job_id):
+    job = AccountScopeService.get_job(job_id)
+    if not job or job.get("kind") != "init_scopes":
+        return jsonify({"message": "Proceso no encontrado"}), 404
+    if not _is_super_admin(user) and str(job.get("createdBy")) != str(user.get("sub")):
+        return _forbidden("No autorizado para consultar este proceso")
+    return jsonify(_init_job_payload(job)), 200
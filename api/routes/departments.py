@@ -328,7 +328,7 @@ def listar_proyectos_departamento(user, departamento_id):
     projection = {"miembros.usuario.password": 0}
     projects = mongo.db.proyectos.find(query, projection=projection).skip(skip).limit(limit)
     count = mongo.db.proyectos.count_documents(query)
-    payload = _serialize_cursor([ProjectFundingService.decorate_project(project) for project in list(projects)])
+    payload = _serialize_cursor(ProjectFundingService.decorate_projects(projects))
     for item in payload:
         dep_id = item.get("departamento_id")
         if isinstance(dep_id, dict):
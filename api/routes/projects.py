@@ -1,10 +1,13 @@
 from flask import Blueprint, request, jsonify, Response, current_app
 from bson import ObjectId, json_util
+import base64
 import json
 import math
+import re
 from datetime import datetime, timezone
 from io import BytesIO
 
+from pymongo.errors import OperationFailure
 from api.extensions import mongo
 from api.util.decorators import token_required, allow_cors, validar_datos
 from api.util.common import agregar_log
@@ -12,6 +15,9 @@ from api.util.utils import string_to_int, int_to_string, int_to_float, actualiza
 from api.util.generar_acta_finalizacion import generar_acta_finalizacion_pdf
 from api.util.backblaze import upload_file
 from api.services.project_funding_service import ProjectFundingService
+from api.services.audit_log_service import AuditLogService
+from api.services.project_members_service import ProjectMembersService
+from api.services.unit_of_work import load_project
 from api.util.access import (
     can_access_project,
     is_super_admin,
@@ -23,6 +29,29 @@ from api.util.access import (
 
 projects_bp = Blueprint('projects', __name__)
 PLACEHOLDER = "(POR DEFINIR)"
+_project_indexes_ready = False
+_project_text_index_ready = False
+# IndexOptionsConflict / IndexKeySpecsConflict: ya existe un índice equivalente con otro nombre u opciones.
+INDEX_CONFLICT_CODES = {85, 86}
+# IndexNotFound: ``$text`` sin índice de texto (p. ej. borrado después de arrancar).
+INDEX_NOT_FOUND_CODE = 27
+# Campos del modo listado: sin ``miembros`` ni el payload ``user`` del creador.
+PROJECT_LIST_PROJECTION = {
+    "nombre": 1,
+    "descripcion": 1,
+    "departamento_id": 1,
+    "categoria": 1,
+    "status": 1,
+    "show": 1,
+    "owner": 1,
+    "fecha_inicio": 1,
+    "fecha_fin": 1,
+    "balance": 1,
+    "balance_inicial": 1,
+    "fundingModel": 1,
+    "fundingTotals": 1,
+    "legacyLedger.status": 1,
+}
 
 
 def _sanitize_filename(value):
@@ -95,12 +124,152 @@ def _get_project_or_404(project_id):
     if not object_id:
         return None, (jsonify({"message": "ID de proyecto inválido"}), 400)
 
-    project = mongo.db.proyectos.find_one({"_id": object_id})
+    project = load_project(object_id)
     if not project:
         return None, (jsonify({"message": "Proyecto no encontrado"}), 404)
     return project, None
 
 
+def _safe_create_index(spec, **kwargs):
+    """Crea el índice; devuelve ``False`` si Mongo lo rechazó. Los errores de conexión se propagan."""
+    try:
+        mongo.db.proyectos.create_index(spec, **kwargs)
+    except OperationFailure as exc:
+        if exc.code in INDEX_CONFLICT_CODES:
+            return True
+        current_app.logger.warning("No se pudo crear índice de proyectos: %s", exc)
+        return False
+    return True
+
+
+def _ensure_project_indexes():
+    global _project_indexes_ready, _project_text_index_ready
+    if _project_indexes_ready:
+        return
+    _safe_create_index([("departamento_id", 1), ("_id", -1)])
+    _safe_create_index([("departamento_id", 1), ("categoria", 1), ("status.actual", 1)])
+    _project_text_index_ready = _safe_create_index(
+        [("nombre", "text"), ("descripcion", "text")],
+        name="proyectos_texto",
+        default_language="spanish",
+        weights={"nombre": 3, "descripcion": 1},
+    )
+    _project_indexes_ready = True
+
+
+def _project_text_filter(text):
+    # Sin índice de texto ``$text`` falla: se busca por subcadena (sin acentos ni relevancia).
+    if _project_text_index_ready:
+        return {"$text": {"$search": text}}
+    pattern = {"$regex": re.escape(text), "$options": "i"}
+    return {"$or": [{"nombre": pattern}, {"descripcion": pattern}]}
+
+
+def _project_list_scope(user):
+    if is_super_admin(user) and not user.get("_using_dept_context"):
+        return {}
+    department_object_id = parse_object_id(user_department_id(user))
+    return {"departamento_id": department_object_id} if department_object_id else {"_id": {"$exists": False}}
+
+
+def _project_list_json(rows):
+    list_cursor = ProjectFundingService.decorate_projects(rows)
+    list_dump = json_util.dumps(list_cursor, default=json_util.default, ensure_ascii=False)
+    list_json = json.loads(list_dump)
+    for project in list_json:
+        departamento_id = project.get("departamento_id")
+        if isinstance(departamento_id, dict):
+            departamento_id = departamento_id.get("$oid")
+            project["departamento_id"] = departamento_id
+        if departamento_id:
+            project["departmentId"] = departamento_id
+    return list_json
+
+
+def _project_search_filters(user, params):
+    """Arma el ``$match`` de la búsqueda; devuelve ``(match, error)``."""
+    match = dict(_project_list_scope(user))
+    text = (params.get("q") or "").strip()
+    if text:
+        match.update(_project_text_filter(text))
+
+    department = params.get("departamento_id") or params.get("departmentId")
+    if department:
+        department_object_id = parse_object_id(department)
+        if not department_object_id:
+            return None, "departamento_id inválido"
+        if "departamento_id" in match and match["departamento_id"] != department_object_id:
+            return {"_id": {"$exists": False}}, None
+        match["departamento_id"] = department_object_id
+
+    categoria = params.get("categoria")
+    if categoria:
+        categoria_object_id = parse_object_id(categoria)
+        if not categoria_object_id:
+            return None, "categoria inválida"
+        match["categoria"] = categoria_object_id
+
+    status = params.get("status")
+    if status not in (None, ""):
+        try:
+            match["status.actual"] = int(status)
+        except (TypeError, ValueError):
+            return None, "status inválido"
+
+    finished = params.get("finalizado")
+    if finished not in (None, ""):
+        if str(finished).lower() in {"1", "true", "si", "sí"}:
+            match["status.finished"] = True
+        else:
+            match["status.finished"] = {"$ne": True}
+
+    # fecha_inicio se guarda como texto YYYY-MM-DD: el rango es lexicográfico.
+    date_range = {}
+    if params.get("desde"):
+        date_range["$gte"] = str(params.get("desde")).strip()
+    if params.get("hasta"):
+        date_range["$lte"] = str(params.get("hasta")).strip()
+    if date_range:
+        match["fecha_inicio"] = date_range
+    return match, None
+
+
+def _project_search_pipeline(match, skip, limit):
+    sort = {"score": {"$meta": "textScore"}, "_id": -1} if "$text" in match else {"_id": -1}
+    return [
+        {"$match": match},
+        {
+            "$facet": {
+                "rows": [
+                    {"$sort": sort},
+                    {"$skip": skip},
+                    {"$limit": limit},
+                    {"$project": PROJECT_LIST_PROJECTION},
+                ],
+                "total": [{"$count": "count"}],
+                "categorias": [{"$group": {"_id": "$categoria", "count": {"$sum": 1}}}, {"$sort": {"count": -1}}],
+                "status": [{"$group": {"_id": "$status.actual", "count": {"$sum": 1}}}, {"$sort": {"_id": 1}}],
+                "departamentos": [{"$group": {"_id": "$departamento_id", "count": {"$sum": 1}}}, {"$sort": {"count": -1}}],
+            }
+        },
+    ]
+
+
+def _facet_counts(rows):
+    return [{"value": str(row["_id"]) if isinstance(row.get("_id"), ObjectId) else row.get("_id"), "count": row["count"]} for row in rows]
+
+
+def _encode_list_cursor(project_id):
+    return base64.urlsafe_b64encode(str(project_id).encode("ascii")).decode("ascii")
+
+
+def _decode_list_cursor(cursor):
+    try:
+        return ObjectId(base64.urlsafe_b64decode(str(cursor).encode("ascii")).decode("ascii"))
+    except Exception:
+        return None
+
+
 def _allow_legacy_project_balance() -> bool:
     value = current_app.config.get("ALLOW_LEGACY_PROJECT_BALANCE")
     if value is None:
@@ -475,6 +644,7 @@ def asignar_usuario_proyecto(user):
         query["$set"] = {"status": new_status}
 
     mongo.db.proyectos.update_one({"_id": project_object_id}, query)
+    ProjectMembersService.add_member(proyecto, member_payload)
     message_log = f'{usuario["nombre"]} fue asignado al proyecto por {user["nombre"]} con el rol {data["role"]["label"]}'
     agregar_log(proyecto_id, message_log)
     return jsonify({"message": "Usuario asignado al proyecto con éxito"}), 200
@@ -540,6 +710,7 @@ def eliminar_usuario_proyecto(user):
         {"_id": project_object_id},
         {"$pull": {"miembros": {"usuario._id.$oid": usuario_id}}},
     )
+    ProjectMembersService.remove_member(project_object_id, usuario_id)
     message_log = f'{usuario["nombre"]} fue eliminado del proyecto por {user["nombre"]}'
     agregar_log(proyecto_id, message_log)
     return jsonify({"message": "Usuario eliminado del proyecto con éxito"}), 200
@@ -671,7 +842,11 @@ def asignar_balance(user):
     if int(proyecto.get("balance_inicial", 0) or 0) == 0:
         new_changes["fundingModel.legacyInitialBalanceSnapshot"] = balance
 
-    mongo.db.proyectos.update_one({"_id": proyecto_object_id}, {"$set": new_changes})
+    update = {"$set": new_changes}
+    if proyecto.get("fundingTotals"):
+        # Mantiene el total legacy materializado sin recorrer acciones en la próxima lectura.
+        update["$inc"] = {"fundingTotals.legacyFunding": round(float(data_balance) / 100, 2)}
+    mongo.db.proyectos.update_one({"_id": proyecto_object_id}, update)
     data_acciones = {
         "project_id": proyecto_object_id,
         "user": "Prueba", # TODO: Fix user name
@@ -681,6 +856,7 @@ def asignar_balance(user):
         "created_at": datetime.utcnow()
     }
     mongo.db.acciones.insert_one(data_acciones)
+    ProjectFundingService.record_legacy_action(data_acciones, proyecto)
     message_log = f'{user["nombre"]} agrego balance al proyecto por un monto de: Bs. {int_to_string(data_balance)}'
     agregar_log(proyecto_object_id, message_log)
 
@@ -708,6 +884,15 @@ def mostrar_proyectos(user):
         type: integer
         default: 10
         description: Cantidad de resultados por página
+      - in: query
+        name: view
+        type: string
+        enum: [list]
+        description: Modo listado con campos reducidos y paginación por cursor
+      - in: query
+        name: cursor
+        type: string
+        description: nextCursor de la página anterior (implica view=list)
     responses:
       200:
         description: Lista de proyectos
@@ -720,37 +905,204 @@ def mostrar_proyectos(user):
                 type: object
             count:
               type: integer
+            nextCursor:
+              type: string
+            hasMore:
+              type: boolean
+      400:
+        description: Cursor inválido
     """
     params = request.args
     page = int(params.get("page")) if params.get("page") else 0
     limit = int(params.get("limit")) if params.get("limit") else 10
     skip = page * limit  # Calcular skip basado en page y limit
-    
-    if is_super_admin(user):
-        if user.get("_using_dept_context"):
-            department_object_id = parse_object_id(user_department_id(user))
-            query = {"departamento_id": department_object_id} if department_object_id else {"_id": {"$exists": False}}
-        else:
-            query = {}
+    cursor = params.get("cursor")
+    list_mode = params.get("view") == "list" or bool(cursor)
+    query = _project_list_scope(user)
+    _ensure_project_indexes()
+
+    next_cursor = None
+    has_more = False
+    if list_mode:
+        after = None
+        if cursor:
+            after = _decode_list_cursor(cursor)
+            if after is None:
+                return jsonify({"message": "cursor inválido"}), 400
+        page_query = {"$and": [query, {"_id": {"$lt": after}}]} if after else query
+        # Orden por _id descendente: con departamento usa el índice (departamento_id, _id).
+        rows = list(
+            mongo.db.proyectos.find(page_query, projection=PROJECT_LIST_PROJECTION)
+            .sort("_id", -1)
+            .limit(limit + 1)
+        )
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        if has_more and rows:
+            next_cursor = _encode_list_cursor(rows[-1]["_id"])
+        # Con cursor no se vuelve a contar la colección.
+        quantity = None if cursor else mongo.db.proyectos.count_documents(query)
     else:
-        department_object_id = parse_object_id(user_department_id(user))
-        query = {"departamento_id": department_object_id} if department_object_id else {"_id": {"$exists": False}}
+        projection = {"miembros.usuario.password": 0}
+        rows = mongo.db.proyectos.find(query, projection=projection).skip(skip).limit(limit)
+        quantity = mongo.db.proyectos.count_documents(query)
+    list_json = _project_list_json(rows)
+    if list_mode:
+        return jsonify(request_list=list_json, count=quantity, nextCursor=next_cursor, hasMore=has_more)
+    return jsonify(request_list=list_json, count=quantity)
+
+@projects_bp.route("/proyectos/search", methods=["GET"])
+@projects_bp.route("/api/proyectos/search", methods=["GET"])
+@allow_cors
+@token_required
+def buscar_proyectos(user):
+    """
+    Buscar proyectos con filtros y conteos por faceta
+    ---
+    tags:
+      - Proyectos
+    security:
+      - Bearer: []
+    parameters:
+      - in: query
+        name: q
+        type: string
+        description: Texto a buscar en nombre y descripción
+      - in: query
+        name: categoria
+        type: string
+      - in: query
+        name: status
+        type: integer
+        description: Paso actual (status.actual)
+      - in: query
+        name: departamento_id
+        type: string
+      - in: query
+        name: finalizado
+        type: boolean
+      - in: query
+        name: desde
+        type: string
+        description: fecha_inicio mínima (YYYY-MM-DD)
+      - in: query
+        name: hasta
+        type: string
+        description: fecha_inicio máxima (YYYY-MM-DD)
+      - in: query
+        name: page
+        type: integer
+        default: 0
+      - in: query
+        name: limit
+        type: integer
+        default: 10
+    responses:
+      200:
+        description: Proyectos y conteos por categoría, status y departamento
+        schema:
+          type: object
+          properties:
+            request_list:
+              type: array
+              items:
+                type: object
+            count:
+              type: integer
+            facets:
+              type: object
+      400:
+        description: Filtro inválido
+    """
+    global _project_text_index_ready
+    params = request.args
+    try:
+        page = max(int(params.get("page") or 0), 0)
+        limit = min(max(int(params.get("limit") or 10), 1), 100)
+    except ValueError:
+        return jsonify({"message": "Paginación inválida"}), 400
 
-    projection = {"miembros.usuario.password": 0}
+    _ensure_project_indexes()
+    match, error = _project_search_filters(user, params)
+    if error:
+        return jsonify({"message": error}), 400
 
-    list_verification_request = mongo.db.proyectos.find(query, projection=projection).skip(skip).limit(limit)
-    quantity = mongo.db.proyectos.count_documents(query)
-    list_cursor = [ProjectFundingService.decorate_project(project) for project in list(list_verification_request)]
-    list_dump = json_util.dumps(list_cursor, default=json_util.default, ensure_ascii=False)
-    list_json = json.loads(list_dump)
+    # Un solo round-trip: filas de la página y conteos para la barra de filtros.
+    try:
+        result = next(iter(mongo.db.proyectos.aggregate(_project_search_pipeline(match, page * limit, limit))), None) or {}
+    except OperationFailure as exc:
+        if exc.code != INDEX_NOT_FOUND_CODE or "$text" not in match:
+            raise
+        _project_text_index_ready = False
+        match, _ = _project_search_filters(user, params)
+        result = next(iter(mongo.db.proyectos.aggregate(_project_search_pipeline(match, page * limit, limit))), None) or {}
+    total = result.get("total") or []
+    return jsonify(
+        request_list=_project_list_json(result.get("rows") or []),
+        count=total[0]["count"] if total else 0,
+        facets={
+            "categorias": _facet_counts(result.get("categorias") or []),
+            "status": _facet_counts(result.get("status") or []),
+            "departamentos": _facet_counts(result.get("departamentos") or []),
+        },
+    )
+
+@projects_bp.route("/mis_proyectos", methods=["GET"])
+@projects_bp.route("/api/mis_proyectos", methods=["GET"])
+@allow_cors
+@token_required
+def mis_proyectos(user):
+    """
+    Listar los proyectos donde el usuario es miembro
+    ---
+    tags:
+      - Proyectos
+    security:
+      - Bearer: []
+    parameters:
+      - in: query
+        name: page
+        type: integer
+        default: 0
+      - in: query
+        name: limit
+        type: integer
+        default: 10
+    responses:
+      200:
+        description: Proyectos del usuario con su rol, del ingreso más reciente al más antiguo
+        schema:
+          type: object
+          properties:
+            request_list:
+              type: array
+              items:
+                type: object
+            count:
+              type: integer
+    """
+    params = request.args
+    try:
+        page = max(int(params.get("page") or 0), 0)
+        limit = min(max(int(params.get("limit") or 10), 1), 100)
+    except ValueError:
+        return jsonify({"message": "Paginación inválida"}), 400
+
+    memberships = ProjectMembersService.memberships_for_user(user.get("sub"), skip=page * limit, limit=limit)
+    project_ids = [row["project_id"] for row in memberships["rows"]]
+    projects = {
+        project["_id"]: project
+        for project in mongo.db.proyectos.find({"_id": {"$in": project_ids}}, projection=PROJECT_LIST_PROJECTION)
+    } if project_ids else {}
+    rows = [projects[project_id] for project_id in project_ids if project_id in projects]
+    list_json = _project_list_json(rows)
+    roles = {str(row["project_id"]): {"value": row.get("role"), "label": row.get("roleLabel")} for row in memberships["rows"]}
     for project in list_json:
-        departamento_id = project.get("departamento_id")
-        if isinstance(departamento_id, dict):
-            departamento_id = departamento_id.get("$oid")
-            project["departamento_id"] = departamento_id
-        if departamento_id:
-            project["departmentId"] = departamento_id
-    return jsonify(request_list=list_json, count=quantity)
+        project_id = project.get("_id")
+        if isinstance(project_id, dict):
+            project_id = project_id.get("$oid")
+        project["memberRole"] = roles.get(str(project_id))
+    return jsonify(request_list=list_json, count=memberships["count"])
 
 @projects_bp.route('/proyecto/<string:proyecto_id>/objetivos', methods=['GET'])
 @token_required
@@ -885,7 +1237,7 @@ def proyecto(user, id):
     if not project_object_id:
         return {"message": "ID de proyecto inválido"}, 400
 
-    proyecto = mongo.db.proyectos.find_one({"_id": project_object_id})
+    proyecto = load_project(project_object_id)
     if not proyecto:
         return jsonify({"error": "proyecto no encontrado"}), 404
 
@@ -976,6 +1328,7 @@ def eliminar_proyecto(user):
 
     result = mongo.db.proyectos.delete_one({"_id": project_object_id})
     if result.deleted_count == 1:
+        ProjectMembersService.remove_project(project_object_id)
         return jsonify({"message": "Proyecto eliminado con éxito"}), 200
     else:
         return jsonify({"message": "No se pudo eliminar la regla"}), 400
@@ -1027,7 +1380,7 @@ def finalizar_proyecto(user):
     movimientos = ProjectFundingService.build_timeline(proyecto)
     movimientos_simple = [{"type": m.get("title"), "amount": m.get("amount", 0), "user": m.get("actorName", "N/A")} for m in movimientos]
 
-    logs = list(mongo.db.logs.find({"$or": [{"proyecto_id": project_object_id}, {"id_proyecto": project_object_id}]}))
+    logs = AuditLogService.project_logs(project_object_id)
     logs_simple = [{"fecha": str(ls.get("fecha_creacion")), "mensaje": ls.get("mensaje")} for ls in logs]
 
     presupuestos = list(mongo.db.documentos.find({"$or": [{"project_id": project_object_id}, {"proyecto_id": project_object_id}]}))
@@ -1082,6 +1435,10 @@ def obtener_logs(user, id):
         name: limit
         type: integer
         default: 10
+      - in: query
+        name: cursor
+        type: string
+        description: Paginación por keyset (más reciente primero); vacío para la primera página
     responses:
       200:
         description: Lista de logs
@@ -1092,6 +1449,12 @@ def obtener_logs(user, id):
               type: array
             count:
               type: integer
+            nextCursor:
+              type: string
+            hasMore:
+              type: boolean
+      400:
+        description: Cursor inválido
     """
     project_object_id = parse_object_id(id)
     if not project_object_id:
@@ -1108,6 +1471,23 @@ def obtener_logs(user, id):
     params = request.args
     page = int(params.get("page")) if params.get("page") else 0
     limit = int(params.get("limit")) if params.get("limit") else 10
+    if "cursor" in params:
+        cursor = params.get("cursor")
+        try:
+            result = AuditLogService.page(project_object_id, limit=max(limit, 1), cursor=cursor or None)
+        except ValueError as exc:
+            return jsonify({"message": str(exc)}), 400
+        list_json = json.loads(json_util.dumps(result["rows"], default=json_util.default, ensure_ascii=False))
+        # El total (vigentes + archivados) solo se calcula en la primera página.
+        total_items = None if cursor else AuditLogService.count(project_object_id)
+        return jsonify(
+            request_list=list_json,
+            count=math.ceil(total_items / limit) if total_items is not None and limit > 0 else None,
+            total=total_items,
+            nextCursor=result["nextCursor"],
+            hasMore=result["hasMore"],
+        ), 200
+
     skip = page * limit  # Calcular skip basado en page y limit
     acciones = mongo.db.logs.find({"id_proyecto": project_object_id}).skip(skip).limit(limit)
     total_items = mongo.db.logs.count_documents({"id_proyecto": project_object_id})
@@ -1205,7 +1585,7 @@ def mostrar_finalizacion(user, id):
 
     movs = ProjectFundingService.build_timeline(proyecto)
     docs = mongo.db.documentos.find({"project_id": project_object_id})
-    logs = mongo.db.logs.find({"id_proyecto": project_object_id})
+    logs = AuditLogService.project_logs(project_object_id)
 
     movs_json = json.loads(json_util.dumps(list(movs), default=json_util.default, ensure_ascii=False))
     docs_json = json.loads(json_util.dumps(list(docs), default=json_util.default, ensure_ascii=False))
@@ -7,6 +7,7 @@ from collections import defaultdict
 from api.extensions import mongo
 from api.util.decorators import token_required
 from api.services.project_funding_service import ProjectFundingService
+from api.services.unit_of_work import load_project
 from api.util.access import (
     can_access_project,
     is_super_admin,
@@ -26,7 +27,7 @@ def _get_project_with_access(user, project_id):
     if not project_object_id:
         return None, (jsonify({"message": "ID de proyecto inválido"}), 400)
 
-    project = mongo.db.proyectos.find_one({"_id": project_object_id})
+    project = load_project(project_object_id)
     if not project:
         return None, (jsonify({"message": "Proyecto no encontrado"}), 404)
 
@@ -166,7 +167,7 @@ def obtener_reporte_proyecto(user, id):
           properties:
             balance_history:
               type: array
-              description: Historia de balance del proyecto
+              description: Historia de balance del proyecto (último saldo de cada día, semana o mes)
               items:
                 type: object
                 properties:
@@ -177,6 +178,10 @@ def obtener_reporte_proyecto(user, id):
                   saldo:
                     type: number
                     description: Saldo en el momento
+            balance_bucket:
+              type: string
+              enum: [day, week, month]
+              description: Periodo de agrupación de balance_history según el rango de fechas
             egresos_tipo:
               type: array
               description: Egresos agrupados por tipo
@@ -226,6 +231,7 @@ def obtener_reporte_proyecto(user, id):
     report_payload = ProjectFundingService.report_payload(proyecto, year=year)
     return jsonify({
         "balance_history": report_payload["balance_history"],
+        "balance_bucket": report_payload["balance_bucket"],
         "egresos_tipo": report_payload["egresos_tipo"],
         "resumen": report_payload["resumen"],
     }), 200
@@ -1,6 +1,7 @@
 from flask import Blueprint, request, jsonify
 from bson import ObjectId, json_util
 import json
+from copy import deepcopy
 from datetime import datetime, timezone
 
 from api.extensions import mongo
@@ -8,6 +9,7 @@ from api.util.decorators import token_required, allow_cors
 from api.util.common import agregar_log
 from api.util.utils import int_to_string, actualizar_pasos
 from api.services.project_funding_service import ProjectFundingService
+from api.services.unit_of_work import load_project
 from api.util.access import can_access_project, parse_object_id
 
 rules_bp = Blueprint('rules', __name__)
@@ -231,7 +233,7 @@ def asignar_regla_fija(user):
     if not regla_object_id:
         return jsonify({"message": "ruleId inválido"}), 400
 
-    proyecto = mongo.db.proyectos.find_one({"_id": proyecto_object_id})
+    proyecto = load_project(proyecto_object_id)
     if proyecto is None:
         return jsonify({"message": "Proyecto no encontrado"}), 404
 
@@ -259,24 +261,32 @@ def asignar_regla_fija(user):
         grouped_amounts[account_code] = round(grouped_amounts.get(account_code, 0) + amount_units, 2)
         normalized_items.append({"item": item, "accountCode": account_code, "amountUnits": amount_units})
 
+    balances = {
+        row["accountCode"]: float(row.get("balance", 0) or 0)
+        for row in mongo.db.account_scope_state.find(
+            {
+                "year": 2025,
+                "scopeType": "project",
+                "scopeId": str(proyecto_object_id),
+                "accountCode": {"$in": list(grouped_amounts)},
+            },
+            {"accountCode": 1, "balance": 1},
+        )
+    }
     for account_code, total_amount in grouped_amounts.items():
-        balance = ProjectFundingService._project_balance_for_account(proyecto_id, account_code, year=2025)
-        if (balance - total_amount) < 0:
+        if (balances.get(account_code, 0.0) - total_amount) < 0:
             return jsonify({"message": f"Saldo insuficiente en la partida {account_code} para aplicar la regla fija"}), 400
 
+    consumptions = []
     for item_data in normalized_items:
         item = item_data["item"]
         account_code = item_data["accountCode"]
-        amount_units = item_data["amountUnits"]
-        try:
-            ProjectFundingService.consume_project_account(
-                proyecto,
-                year=2025,
-                account_code=account_code,
-                amount=amount_units,
-                user=user,
-                description=f"Regla fija {regla['nombre']} - {item['nombre_regla']}",
-                reference={
+        consumptions.append(
+            {
+                "accountCode": account_code,
+                "amount": item_data["amountUnits"],
+                "description": f"Regla fija {regla['nombre']} - {item['nombre_regla']}",
+                "reference": {
                     "kind": "fixed_rule",
                     "ruleId": str(regla_object_id),
                     "projectId": str(proyecto_object_id),
@@ -286,21 +296,26 @@ def asignar_regla_fija(user):
                     "ruleName": regla["nombre"],
                     "ruleItemName": item["nombre_regla"],
                 },
-                allow_negative=False,
-                log_message=(
+                "logMessage": (
                     f'{user["nombre"]} asigno la regla {regla["nombre"]} con el item {item["nombre_regla"]} '
                     f'en la partida {account_code} por Bs. {int_to_string(item["monto"])}'
                 ),
-            )
-        except ValueError as exc:
-            return jsonify({"message": str(exc)}), 400
-
-    new_status, _ = actualizar_pasos(proyecto["status"], 5)
-
-    mongo.db.proyectos.update_one(
-        {"_id": proyecto_object_id},
-        {"$set": {"regla_fija": {**regla, "accountMappings": account_mappings}, "status": new_status}},
-    )
+            }
+        )
+    new_status, _ = actualizar_pasos(deepcopy(proyecto["status"]), 5)
+    try:
+        # Un solo asiento para todos los items: o se aplica la regla completa o ninguna partida.
+        # La regla y el paso del proyecto se guardan en la misma transacción que el asiento.
+        ProjectFundingService.consume_project_accounts(
+            proyecto,
+            year=2025,
+            consumptions=consumptions,
+            user=user,
+            allow_negative=False,
+            project_fields={"regla_fija": {**regla, "accountMappings": account_mappings}, "status": new_status},
+        )
+    except ValueError as exc:
+        return jsonify({"message": str(exc)}), 400
 
     return jsonify({"message": "La regla se asigno correctamente"}), 200
 
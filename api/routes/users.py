@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from bson import ObjectId, json_util
 import json
 from api.extensions import mongo, bcrypt
+from api.services.project_members_service import ProjectMembersService
 from api.util.decorators import token_required, allow_cors, validar_datos
 from api.util.access import (
     ROLE_ADMIN_DEPARTAMENTO,
@@ -123,6 +124,7 @@ def editar_usuario(actor, id_usuario):
         return jsonify({"message": "El usuario debe tener un departamento asociado"}), 400
 
     mongo.db.usuarios.update_one({"_id": usuario["_id"]}, {"$set": update_data})
+    ProjectMembersService.rename_user(usuario["_id"], update_data)
     return jsonify({"message": "Información de usuario actualizada con éxito"}), 200
 
 @users_bp.route("/eliminar_usuario", methods=["POST"])
@@ -180,6 +182,7 @@ def eliminar_usuario(user):
     result = mongo.db.usuarios.delete_one({"_id": usuario["_id"]})
 
     if result.deleted_count == 1:
+        ProjectMembersService.remove_user(usuario["_id"])
         return jsonify({"message": "Usuario eliminado éxitosamente"}), 200
     else:
         return jsonify({"message": "No se pudo eliminar el usuario"}), 400
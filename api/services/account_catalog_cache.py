@@ -0,0 +1,290 @@
+"""Caché en proceso del catálogo ``master_accounts`` por año.
+
+El catálogo solo cambia con el seed o con el CRUD admin de cuentas. Cada cambio
+actualiza un documento de versión en ``accounting_versions``; los workers comparan
+esa versión (una lectura por ``_id``, memorizada por request) y recargan su copia
+solo cuando no coincide.
+"""
+
+from __future__ import annotations
+
+import re
+import threading
+import unicodedata
+import uuid
+from bisect import bisect_left, bisect_right
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from flask import g, has_request_context
+
+
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+_CODE_TERM_RE = re.compile(r"^[\d.\-]+$")
+
+
+def _version_id(year: int) -> str:
+    return f"master_accounts:{int(year)}"
+
+
+def fold_text(value: Any) -> str:
+    """Minúsculas sin acentos: ``"Ejecución"`` → ``"ejecucion"``."""
+    normalized = unicodedata.normalize("NFKD", str(value or ""))
+    return "".join(ch for ch in normalized if not unicodedata.combining(ch)).lower()
+
+
+def tokenize(value: Any) -> List[str]:
+    return _TOKEN_RE.findall(fold_text(value))
+
+
+class CatalogAccount:
+    __slots__ = (
+        "year",
+        "code",
+        "description",
+        "group",
+        "is_header",
+        "level",
+        "parent_code",
+        "ancestors",
+        "root_code",
+        "createdAt",
+        "updatedAt",
+    )
+
+    def __init__(self, row: Dict[str, Any]):
+        self.year = row.get("year")
+        self.code = row["code"]
+        self.description = row.get("description")
+        self.group = row.get("group")
+        self.is_header = bool(row.get("is_header", False))
+        self.level = row.get("level")
+        self.parent_code = row.get("parent_code")
+        self.ancestors = tuple(row.get("ancestors") or ())
+        self.root_code = row.get("root_code")
+        self.createdAt = row.get("createdAt")
+        self.updatedAt = row.get("updatedAt")
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = {slot: getattr(self, slot) for slot in self.__slots__}
+        data["ancestors"] = list(self.ancestors)
+        return data
+
+
+class CatalogSearchIndex:
+    """Índice de búsqueda del catálogo: rangos por prefijo de código e índice invertido de tokens.
+
+    Los códigos son cadenas jerárquicas de ancho fijo (12 dígitos), así que un prefijo
+    se resuelve con dos ``bisect`` sobre la lista ordenada. Las descripciones se indexan
+    por tokens normalizados (sin acentos, minúsculas); un término parcial se resuelve
+    como rango de prefijo sobre la lista ordenada de tokens.
+    """
+
+    __slots__ = ("codes", "postings", "tokens", "folded")
+
+    def __init__(self, accounts: Dict[str, "CatalogAccount"], codes: List[str]):
+        self.codes = codes
+        self.postings: Dict[str, Set[str]] = {}
+        self.folded: Dict[str, str] = {}
+        for code in codes:
+            description = fold_text(accounts[code].description)
+            self.folded[code] = description
+            for token in _TOKEN_RE.findall(description):
+                self.postings.setdefault(token, set()).add(code)
+        self.tokens: List[str] = sorted(self.postings)
+
+    def _code_prefix(self, prefix: str) -> List[str]:
+        start = bisect_left(self.codes, prefix)
+        end = bisect_right(self.codes, prefix + "\uffff")
+        return self.codes[start:end]
+
+    def _token_prefix(self, prefix: str) -> Tuple[Set[str], Set[str]]:
+        exact = set(self.postings.get(prefix, ()))
+        matched = set(exact)
+        start = bisect_left(self.tokens, prefix)
+        end = bisect_right(self.tokens, prefix + "\uffff")
+        for token in self.tokens[start:end]:
+            matched.update(self.postings[token])
+        return matched, exact
+
+    def search(self, q: str) -> List[str]:
+        """Códigos que cumplen todos los términos de ``q``, ordenados por relevancia."""
+        raw_terms = str(q or "").split()
+        if not raw_terms:
+            return list(self.codes)
+
+        candidates: Optional[Set[str]] = None
+        scores: Dict[str, float] = {}
+        for raw in raw_terms:
+            if _CODE_TERM_RE.match(raw) and any(ch.isdigit() for ch in raw):
+                prefix = re.sub(r"\D", "", raw)
+                matched = set(self._code_prefix(prefix))
+                for code in matched:
+                    # Código exacto primero; luego los prefijos más cercanos (menos niveles por debajo).
+                    scores[code] = scores.get(code, 0.0) + (100.0 if code == prefix else 50.0 + len(prefix) / 12.0)
+            else:
+                terms = tokenize(raw)
+                if not terms:
+                    continue
+                matched = None
+                for term in terms:
+                    term_matches, exact = self._token_prefix(term)
+                    for code in term_matches:
+                        scores[code] = scores.get(code, 0.0) + (10.0 if code in exact else 5.0)
+                    matched = term_matches if matched is None else matched & term_matches
+                matched = matched or set()
+            candidates = matched if candidates is None else candidates & matched
+            if not candidates:
+                return []
+
+        folded_q = fold_text(q).strip()
+        for code in candidates or ():
+            if folded_q and self.folded.get(code, "").startswith(folded_q):
+                scores[code] = scores.get(code, 0.0) + 3.0
+        return sorted(candidates or (), key=lambda code: (-scores.get(code, 0.0), code))
+
+
+class CatalogIndex:
+    __slots__ = ("year", "version", "by_code", "children", "codes", "roots", "_search")
+
+    def __init__(self, year: int, version: Optional[str], rows: Iterable[Dict[str, Any]]):
+        self.year = int(year)
+        self.version = version
+        self.by_code: Dict[str, CatalogAccount] = {}
+        for row in rows:
+            account = CatalogAccount(row)
+            self.by_code[account.code] = account
+
+        self.codes: List[str] = sorted(self.by_code)
+        self.children: Dict[str, List[str]] = {}
+        self.roots: List[str] = []
+        self._search: Optional[CatalogSearchIndex] = None
+        for code in self.codes:
+            parent_code = self.by_code[code].parent_code
+            if parent_code and parent_code in self.by_code and parent_code != code:
+                self.children.setdefault(parent_code, []).append(code)
+            else:
+                self.roots.append(code)
+
+    def search_index(self) -> CatalogSearchIndex:
+        # Se construye en el primer uso: el árbol y la validación de movimientos no lo necesitan.
+        if self._search is None:
+            self._search = CatalogSearchIndex(self.by_code, self.codes)
+        return self._search
+
+    def search_codes(self, q: str = "", group: Optional[str] = None, within: Optional[Set[str]] = None) -> List[str]:
+        group_value = group.upper() if group else None
+        return [
+            code
+            for code in self.search_index().search(q)
+            if (group_value is None or self.by_code[code].group == group_value) and (within is None or code in within)
+        ]
+
+    def get(self, code: str) -> Optional[CatalogAccount]:
+        return self.by_code.get(code)
+
+    def __contains__(self, code: str) -> bool:
+        return code in self.by_code
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def children_of(self, code: Optional[str]) -> List[str]:
+        if not code:
+            return list(self.roots)
+        return list(self.children.get(code, ()))
+
+    def ancestors_of(self, code: str) -> List[str]:
+        """Cadena raíz → padre usando solo cuentas existentes (tolera ciclos)."""
+        chain: List[str] = []
+        seen = {code}
+        account = self.by_code.get(code)
+        parent_code = account.parent_code if account else None
+        while parent_code and parent_code in self.by_code and parent_code not in seen:
+            chain.append(parent_code)
+            seen.add(parent_code)
+            parent_code = self.by_code[parent_code].parent_code
+        chain.reverse()
+        return chain
+
+    def root_of(self, code: str) -> str:
+        chain = self.ancestors_of(code)
+        return chain[0] if chain else code
+
+    def subtree_codes(self, code: str) -> List[str]:
+        if code not in self.by_code:
+            return []
+        out: List[str] = []
+        stack = [code]
+        seen = set()
+        while stack:
+            current = stack.pop()
+            if current in seen:
+                continue
+            seen.add(current)
+            out.append(current)
+            stack.extend(self.children.get(current, ()))
+        return sorted(out)
+
+    def accounts(self, codes: Optional[Iterable[str]] = None, group: Optional[str] = None) -> List[Dict[str, Any]]:
+        selected = self.codes if codes is None else sorted(c for c in set(codes) if c in self.by_code)
+        group_value = group.upper() if group else None
+        return [
+            self.by_code[code].as_dict()
+            for code in selected
+            if group_value is None or self.by_code[code].group == group_value
+        ]
+
+
+class AccountCatalogCache:
+    _indexes: Dict[int, CatalogIndex] = {}
+    _lock = threading.Lock()
+
+    @staticmethod
+    def current_version(db, year: int) -> Optional[str]:
+        memo: Optional[Dict[int, Optional[str]]] = None
+        if has_request_context():
+            memo = g.setdefault("_catalog_versions", {})
+            if int(year) in memo:
+                return memo[int(year)]
+
+        doc = db.accounting_versions.find_one({"_id": _version_id(year)}, {"version": 1})
+        version = doc.get("version") if doc else None
+        if memo is not None:
+            memo[int(year)] = version
+        return version
+
+    @classmethod
+    def get(cls, db, year: int) -> CatalogIndex:
+        version = cls.current_version(db, year)
+        index = cls._indexes.get(int(year))
+        if index is not None and index.version == version:
+            return index
+
+        with cls._lock:
+            index = cls._indexes.get(int(year))
+            if index is not None and index.version == version:
+                return index
+            rows = db.master_accounts.find({"year": int(year)}, {"_id": 0})
+            index = CatalogIndex(int(year), version, rows)
+            cls._indexes[int(year)] = index
+            return index
+
+    @classmethod
+    def bump(cls, db, year: int) -> str:
+        version = uuid.uuid4().hex
+        db.accounting_versions.update_one(
+            {"_id": _version_id(year)},
+            {"$set": {"version": version, "updatedAt": datetime.now(timezone.utc)}},
+            upsert=True,
+        )
+        with cls._lock:
+            cls._indexes.pop(int(year), None)
+        if has_request_context():
+            g.setdefault("_catalog_versions", {})[int(year)] = version
+        return version
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._indexes.clear()
@@ -3,21 +3,40 @@ from __future__ import annotations
 import csv
 import json
 import os
+import random
 import shutil
+import threading
+import time
 import uuid
 from dataclasses import dataclass
-from datetime import datetime, timezone
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
 
 from bson import ObjectId
-from pymongo import UpdateOne
+from pymongo import ReturnDocument, UpdateOne
+from pymongo.errors import OperationFailure, PyMongoError
 
 from api.extensions import mongo
+from api.services.account_catalog_cache import AccountCatalogCache, CatalogIndex
+from api.util.common import documentos_log
 
 
 DEFAULT_YEAR = 2025
 DEFAULT_CURRENCY = "VES"
+VALID_SCOPE_TYPES = {"department", "project", "global"}
+MAX_BATCH_MOVEMENTS = 1000
+INIT_BULK_CHUNK = 50
+# Bloques por llamada a advance_init_job (acotado para terminar dentro de una request).
+INIT_JOB_STEP_CHUNKS = 4
+INIT_JOB_LEASE_SECONDS = 120
+PROJECT_TOTALS_FIELD = "fundingTotals"
+LEGACY_ACTION_SOURCE = "legacy_action"
+STRIPE_SCOPE_TYPES = ("global", "department")
+DEFAULT_STRIPES = 8
+BALANCE_CONFLICT_MESSAGE = "El saldo de una cuenta cambió durante la operación y la política actual prohíbe saldos negativos"
+# Código de Mongo para "Transaction numbers are only allowed on a replica set member or mongos".
+ILLEGAL_OPERATION_CODE = 20
 
 
 def _now_utc() -> datetime:
@@ -45,6 +64,889 @@ def _clean_str(value: Any) -> str:
     return str(value).strip()
 
 
+def _catalog(year: int) -> CatalogIndex:
+    return AccountCatalogCache.get(mongo.db, int(year))
+
+
+def _ledger_field(scope_type: str, scope_id: str) -> str:
+    return f"byScope.{scope_type}:{str(scope_id).replace('.', '_')}"
+
+
+def _ledger_version(year: int, scope_type: Optional[str] = None, scope_id: Optional[str] = None) -> int:
+    """Contador de escrituras del ledger que afectan al filtro (año / tipo de scope / scope)."""
+    if scope_type and scope_id:
+        field = _ledger_field(scope_type, scope_id)
+    elif scope_type:
+        field = f"byType.{scope_type}"
+    else:
+        field = "total"
+    doc = mongo.db.accounting_versions.find_one({"_id": f"ledger:{int(year)}"}, {field: 1}) or {}
+    value: Any = doc
+    for part in field.split("."):
+        value = value.get(part, {}) if isinstance(value, dict) else {}
+    return int(value) if isinstance(value, (int, float)) else 0
+
+
+def _bump_ledger_versions(year: int, scopes: Iterable[Tuple[str, str]]) -> None:
+    inc: Dict[str, int] = {"total": 1}
+    for scope_type, scope_id in set(scopes):
+        inc[f"byType.{scope_type}"] = 1
+        inc[_ledger_field(scope_type, scope_id)] = 1
+    mongo.db.accounting_versions.update_one(
+        {"_id": f"ledger:{int(year)}"},
+        {"$inc": inc, "$set": {"updatedAt": _now_utc()}},
+        upsert=True,
+    )
+
+
+class ConsolidatedTotalsCache:
+    """Resultados de ``consolidated_totals`` por (año, scopeType, scopeId) en memoria del worker.
+
+    Cada entrada guarda la versión del catálogo y el contador del ledger con que se calculó;
+    una escritura en un scope que coincide con el filtro cambia el contador y la invalida.
+    """
+
+    MAX_ENTRIES = 256
+    _entries: Dict[Tuple[int, Optional[str], Optional[str]], Tuple[Tuple[Any, int], Dict[str, Any]]] = {}
+    _lock = threading.Lock()
+
+    @classmethod
+    def get(cls, key, token) -> Optional[Dict[str, Any]]:
+        entry = cls._entries.get(key)
+        if entry is None or entry[0] != token:
+            return None
+        return entry[1]
+
+    @classmethod
+    def put(cls, key, token, value: Dict[str, Any]) -> None:
+        with cls._lock:
+            if key not in cls._entries and len(cls._entries) >= cls.MAX_ENTRIES:
+                cls._entries.pop(next(iter(cls._entries)))
+            cls._entries[key] = (token, value)
+
+    @classmethod
+    def clear(cls) -> None:
+        with cls._lock:
+            cls._entries.clear()
+
+
+def _elapsed_ms(started: float) -> float:
+    return round((time.perf_counter() - started) * 1000, 2)
+
+
+_transactions_unsupported = False
+
+
+def _run_in_transaction(callback) -> None:
+    # Intento transaccional (si el clúster lo soporta). Si falla, fallback lógico sin sesión.
+    # Los ValueError son errores de negocio (p. ej. saldo insuficiente) y abortan sin reintento.
+    # Un servidor standalone se recuerda para no gastar un comando fallido en cada escritura.
+    global _transactions_unsupported
+    if _transactions_unsupported:
+        callback(None)
+        return
+    client = mongo.cx
+    try:
+        with client.start_session() as session:
+            session.with_transaction(callback)
+    except ValueError:
+        raise
+    except OperationFailure as exc:
+        if exc.code == ILLEGAL_OPERATION_CODE:
+            _transactions_unsupported = True
+        callback(None)
+    except Exception:
+        callback(None)
+
+
+def _inc_scope_state(
+    state_filter: Dict[str, Any],
+    *,
+    delta: float,
+    now: datetime,
+    min_balance: Optional[float] = None,
+    session=None,
+) -> Optional[Dict[str, Any]]:
+    """Aplica ``delta`` al estado del scope y devuelve el post-image.
+
+    Con ``min_balance`` la actualización solo se aplica si ``balance >= min_balance``
+    (sin upsert); si la condición no se cumple devuelve ``None``.
+    """
+    update: Dict[str, Any] = {
+        "$inc": {"balance": delta, "movementsCount": 1},
+        "$set": {"lastMovementAt": now, "updatedAt": now},
+    }
+    if min_balance is None:
+        update["$setOnInsert"] = {"createdAt": now}
+        return mongo.db.account_scope_state.find_one_and_update(
+            state_filter,
+            update,
+            projection={"_id": 0},
+            upsert=True,
+            return_document=ReturnDocument.AFTER,
+            session=session,
+        )
+    return mongo.db.account_scope_state.find_one_and_update(
+        {**state_filter, "balance": {"$gte": float(min_balance)}},
+        update,
+        projection={"_id": 0},
+        return_document=ReturnDocument.AFTER,
+        session=session,
+    )
+
+
+def rollup_headers_enabled() -> bool:
+    return _is_truthy(os.getenv("ACCOUNTING_ROLLUP_HEADERS", "false"))
+
+
+def striped_scope_types() -> Set[str]:
+    """Scopes cuyos saldos se reparten en stripes (``ACCOUNTING_STRIPED_SCOPES=global,department``)."""
+    raw = os.getenv("ACCOUNTING_STRIPED_SCOPES", "")
+    return {value.strip() for value in raw.split(",") if value.strip() in STRIPE_SCOPE_TYPES}
+
+
+def stripe_count() -> int:
+    try:
+        return max(1, int(os.getenv("ACCOUNTING_STRIPES", DEFAULT_STRIPES)))
+    except ValueError:
+        return DEFAULT_STRIPES
+
+
+def _stripe_id(year: int, key: Tuple[str, str, str], stripe: int) -> str:
+    return f"{int(year)}:{key[0]}:{key[1]}:{key[2]}:{int(stripe)}"
+
+
+def _state_filter(year: int, key: Tuple[str, str, str]) -> Dict[str, Any]:
+    return {"year": int(year), "scopeType": key[0], "scopeId": key[1], "accountCode": key[2]}
+
+
+def stripe_states(year: int, match: Optional[Dict[str, Any]] = None) -> Dict[Tuple[str, str, str], Dict[str, Any]]:
+    """Stripes de ``account_scope_stripes`` sumados por (scope, cuenta).
+
+    Cada entrada trae ``balance``, ``movementsCount``, ``lastMovementAt`` y ``stripes``
+    (``{n: (balance, movementsCount)}``). Un filtro por un scope sin stripes no consulta Mongo.
+    """
+    match = dict(match or {})
+    scope_type = match.get("scopeType")
+    if isinstance(scope_type, str) and scope_type not in STRIPE_SCOPE_TYPES:
+        return {}
+    out: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    rows = mongo.db.account_scope_stripes.find(
+        {"year": int(year), **match},
+        {"_id": 0, "scopeType": 1, "scopeId": 1, "accountCode": 1, "stripe": 1, "balance": 1, "movementsCount": 1, "lastMovementAt": 1},
+    )
+    for row in rows:
+        key = (row["scopeType"], row["scopeId"], row["accountCode"])
+        entry = out.setdefault(key, {"balance": 0.0, "movementsCount": 0, "lastMovementAt": None, "stripes": {}})
+        balance = float(row.get("balance", 0) or 0)
+        count = int(row.get("movementsCount", 0) or 0)
+        entry["balance"] += balance
+        entry["movementsCount"] += count
+        entry["stripes"][int(row.get("stripe", 0) or 0)] = (balance, count)
+        last = row.get("lastMovementAt")
+        if last and (entry["lastMovementAt"] is None or last > entry["lastMovementAt"]):
+            entry["lastMovementAt"] = last
+    return out
+
+
+def fold_stripe_state(state: Dict[str, Any], entry: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Suma al estado de ``account_scope_state`` lo acumulado en sus stripes (modifica ``state``)."""
+    if not entry:
+        return state
+    state["balance"] = float(state.get("balance", 0) or 0) + entry["balance"]
+    state["movementsCount"] = int(state.get("movementsCount", 0) or 0) + entry["movementsCount"]
+    last = entry["lastMovementAt"]
+    if last and (not state.get("lastMovementAt") or last > state["lastMovementAt"]):
+        state["lastMovementAt"] = last
+    return state
+
+
+def _stripe_op(
+    year: int,
+    key: Tuple[str, str, str],
+    stripe: int,
+    delta: float,
+    count: int,
+    now: datetime,
+    min_balance: Optional[float] = None,
+) -> Tuple[Dict[str, Any], Dict[str, Any], bool]:
+    update: Dict[str, Any] = {
+        "$inc": {"balance": delta, "movementsCount": count},
+        "$set": {"lastMovementAt": now, "updatedAt": now},
+    }
+    if min_balance is not None:
+        return {"_id": _stripe_id(year, key, stripe), "balance": {"$gte": float(min_balance)}}, update, False
+    update["$setOnInsert"] = {**_state_filter(year, key), "stripe": int(stripe), "createdAt": now}
+    return {"_id": _stripe_id(year, key, stripe)}, update, True
+
+
+def _undo_balance_writes(applied: List[Tuple[Any, Dict[str, Any], Dict[str, Any]]], now: datetime) -> None:
+    # Compensa en orden inverso los ``$inc`` ya aplicados (sin la guardia de saldo del filtro).
+    for collection, filt, update in reversed(applied):
+        inverse = {field: -value for field, value in update["$inc"].items()}
+        unguarded = {field: value for field, value in filt.items() if field != "balance"}
+        collection.update_one(unguarded, {"$inc": inverse, "$set": {"updatedAt": now}})
+
+
+def _apply_balance_writes(
+    writes: List[Tuple[Any, Dict[str, Any], Dict[str, Any], bool]],
+    now: datetime,
+    session=None,
+) -> List[Tuple[Any, Dict[str, Any], Dict[str, Any]]]:
+    """Aplica los ``$inc`` de saldo ``(colección, filtro, update, upsert)``; devuelve los aplicados.
+
+    En transacción va un ``bulk_write`` ordenado por colección y una guardia ``$gte`` que no
+    coincide aborta todo. Sin sesión (servidor sin replica set) un update que no coincide no es
+    un error para Mongo y los siguientes se aplicarían igual: se aplican uno a uno, primero los
+    que llevan guardia, y al primer fallo se revierten los ya aplicados antes de lanzar el error.
+    """
+    if session is not None:
+        for collection in {id(w[0]): w[0] for w in writes}.values():
+            ops = [UpdateOne(filt, update, upsert=upsert) for coll, filt, update, upsert in writes if coll is collection]
+            result = collection.bulk_write(ops, ordered=True, session=session)
+            if (result.matched_count or 0) + (result.upserted_count or 0) != len(ops):
+                raise ValueError(BALANCE_CONFLICT_MESSAGE)
+        return []
+
+    applied: List[Tuple[Any, Dict[str, Any], Dict[str, Any]]] = []
+    try:
+        for collection, filt, update, upsert in sorted(writes, key=lambda w: w[3]):
+            result = collection.update_one(filt, update, upsert=upsert)
+            if not upsert and not result.matched_count:
+                raise ValueError(BALANCE_CONFLICT_MESSAGE)
+            applied.append((collection, filt, update))
+    except Exception:
+        _undo_balance_writes(applied, now)
+        raise
+    return applied
+
+
+def _compact_key(year: int, key: Tuple[str, str, str], entry: Dict[str, Any], now: datetime) -> float:
+    """Pasa lo acumulado en los stripes de ``key`` al documento principal; devuelve el saldo movido.
+
+    Cada stripe se descuenta con guardia ``$gte`` antes de sumar en el principal: si un retiro
+    concurrente lo redujo, ese stripe se salta y queda para la próxima compactación.
+    """
+    moved = {"balance": 0.0, "count": 0}
+
+    def _txn(sess):
+        moved.update(balance=0.0, count=0)
+        applied: List[Tuple[Any, Dict[str, Any], Dict[str, Any]]] = []
+        for stripe, (balance, count) in entry["stripes"].items():
+            if not balance and not count:
+                continue
+            stripe_filter: Dict[str, Any] = {"_id": _stripe_id(year, key, stripe)}
+            if balance > 0:
+                stripe_filter["balance"] = {"$gte": balance}
+            stripe_update = {"$inc": {"balance": -balance, "movementsCount": -count}, "$set": {"updatedAt": now}}
+            result = mongo.db.account_scope_stripes.update_one(stripe_filter, stripe_update, session=sess)
+            if result.matched_count:
+                moved["balance"] += balance
+                moved["count"] += count
+                if sess is None:
+                    applied.append((mongo.db.account_scope_stripes, stripe_filter, stripe_update))
+        if not moved["balance"] and not moved["count"]:
+            return
+        update: Dict[str, Any] = {
+            "$inc": {"balance": moved["balance"], "movementsCount": moved["count"]},
+            "$set": {"updatedAt": now},
+            "$setOnInsert": {"createdAt": now},
+        }
+        if entry.get("lastMovementAt"):
+            update["$max"] = {"lastMovementAt": entry["lastMovementAt"]}
+        try:
+            mongo.db.account_scope_state.update_one(_state_filter(year, key), update, upsert=True, session=sess)
+        except Exception:
+            # Sin transacción: si el principal no recibe el saldo, los stripes lo recuperan.
+            _undo_balance_writes(applied, now)
+            raise
+
+    _run_in_transaction(_txn)
+    return moved["balance"]
+
+
+def _plan_striped_write(
+    year: int,
+    key: Tuple[str, str, str],
+    delta: float,
+    now: datetime,
+    *,
+    allow_negative: bool,
+) -> Tuple[Optional[Tuple[Any, Dict[str, Any], Dict[str, Any], bool]], Optional[float]]:
+    """``_striped_write`` de un movimiento suelto; devuelve ``(escritura, saldo total)``.
+
+    Fuera de los scopes con stripes no lee nada y devuelve ``(None, None)``.
+    """
+    if key[0] not in striped_scope_types():
+        return None, None
+    stripes: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+    balances = _read_state_balances(year, [{"scopeType": key[0], "scopeId": key[1], "accountCode": key[2]}], stripes)
+    if key not in balances:
+        return None, None
+    total = balances[key]
+    write = _striped_write(
+        year, key, delta, 1, now, allow_negative=allow_negative, total=total, entry=stripes.get(key)
+    )
+    return write, total
+
+
+def _striped_write(
+    year: int,
+    key: Tuple[str, str, str],
+    delta: float,
+    count: int,
+    now: datetime,
+    *,
+    allow_negative: bool,
+    total: float,
+    entry: Optional[Dict[str, Any]],
+) -> Optional[Tuple[Any, Dict[str, Any], Dict[str, Any], bool]]:
+    """Escritura de saldo para una cuenta con stripes; ``None`` si va al documento principal.
+
+    ``total`` es el saldo principal más los stripes (ver ``_read_state_balances``). Un abono va a
+    un stripe al azar, sin compactar. Un descuento va a un stripe que lo cubra (con guardia);
+    si ninguno lo cubre va al principal, y solo si el saldo alcanza en total pero está
+    repartido se consolida antes.
+    """
+    entry = entry or {"balance": 0.0, "stripes": {}}
+    needed = -delta
+    if allow_negative or needed <= 0:
+        return (mongo.db.account_scope_stripes, *_stripe_op(year, key, random.randrange(stripe_count()), delta, count, now))
+    candidates = [stripe for stripe, (balance, _count) in entry["stripes"].items() if balance >= needed]
+    if candidates:
+        return (
+            mongo.db.account_scope_stripes,
+            *_stripe_op(year, key, random.choice(candidates), delta, count, now, min_balance=needed),
+        )
+    if total - entry["balance"] < needed <= total and entry["stripes"]:
+        _compact_key(year, key, entry, now)
+    return None
+
+
+def _is_assigned_state(row: Dict[str, Any]) -> bool:
+    # Los estados creados solo para acumular rollups de cuentas titular no cuentan como asignados.
+    return not (row.get("rollupOnly") and not row.get("movementsCount"))
+
+
+CATALOG_COLUMNS = ("code", "description", "group", "level", "is_header", "parent_code")
+SCOPE_COLUMNS = CATALOG_COLUMNS + ("balance", "movementsCount", "hasState")
+CHILDREN_COLUMNS = CATALOG_COLUMNS + ("childCount",)
+
+
+def columnar_payload(rows: List[Dict[str, Any]], columns: Iterable[str]) -> Dict[str, Any]:
+    """Codifica filas como arreglos paralelos: una lista por columna en lugar de un dict por fila."""
+    names = list(columns)
+    return {
+        "format": "columnar",
+        "count": len(rows),
+        "columns": names,
+        "data": {name: [row.get(name) for row in rows] for name in names},
+    }
+
+
+def _state_has_activity(row: Dict[str, Any]) -> bool:
+    return (
+        float(row.get("balance", 0) or 0) != 0
+        or float(row.get("movementsCount", 0) or 0) > 0
+        or float(row.get("rollupBalance", 0) or 0) != 0
+    )
+
+
+def _rollup_state_op(key: Tuple[str, str, str], year: int, delta: float, now: datetime) -> UpdateOne:
+    scope_type, scope_id, code = key
+    return UpdateOne(
+        {"year": int(year), "scopeType": scope_type, "scopeId": scope_id, "accountCode": code},
+        {
+            "$inc": {"rollupBalance": delta},
+            "$set": {"updatedAt": now},
+            "$setOnInsert": {
+                "balance": 0.0,
+                "movementsCount": 0,
+                "lastMovementAt": None,
+                "rollupOnly": True,
+                "createdAt": now,
+            },
+        },
+        upsert=True,
+    )
+
+
+def _header_rollup_ops(year: int, deltas: Dict[Tuple[str, str, str], float], now: datetime) -> List[UpdateOne]:
+    """Operaciones ``$inc rollupBalance`` para las cuentas titular ancestro de cada (scope, cuenta).
+
+    ``rollupBalance`` es un campo aparte de ``balance`` para que las sumas existentes por
+    cuenta no cuenten dos veces el mismo movimiento. Vacío si el modo rollup está apagado.
+    """
+    if not deltas or not rollup_headers_enabled():
+        return []
+
+    catalog = _catalog(year)
+    rollups: Dict[Tuple[str, str, str], float] = {}
+    for (scope_type, scope_id, code), delta in deltas.items():
+        for ancestor in catalog.ancestors_of(code):
+            if catalog.by_code[ancestor].is_header:
+                key = (scope_type, scope_id, ancestor)
+                rollups[key] = rollups.get(key, 0.0) + float(delta)
+
+    return [_rollup_state_op(key, year, delta, now) for key, delta in sorted(rollups.items()) if delta]
+
+
+def _init_scope_match(year: int, mode_value: str) -> Dict[str, Any]:
+    match: Dict[str, Any] = {"year": int(year)}
+    if mode_value == "detail_only":
+        match["is_header"] = False
+    elif mode_value.startswith("group:"):
+        group = mode_value.split(":", 1)[1].strip().upper()
+        if group:
+            match["group"] = group
+    elif mode_value == "all":
+        pass
+    else:
+        raise ValueError("mode inválido. Use detail_only, all o group:EGRESO")
+    return match
+
+
+def _merge_scope_states(year: int, match: Dict[str, Any], scope_type: str, scope_ids: List[str]) -> int:
+    """Crea en el servidor los estados en 0 de ``scope_ids`` con ``$match``/``$project``/``$merge``.
+
+    Los estados existentes conservan saldo y contadores (solo se refresca ``updatedAt``).
+    Devuelve cuántos estados nuevos se insertaron.
+    """
+    if not scope_ids:
+        return 0
+    state_filter = {"year": int(year), "scopeType": scope_type, "scopeId": {"$in": list(scope_ids)}}
+    before = mongo.db.account_scope_state.count_documents(state_filter)
+
+    now = _now_utc()
+    pipeline = [
+        {"$match": match},
+        {
+            "$project": {
+                "_id": 0,
+                "year": 1,
+                "accountCode": "$code",
+                "scopeType": {"$literal": scope_type},
+                "scopeId": {"$literal": list(scope_ids)},
+                "balance": {"$literal": 0},
+                "movementsCount": {"$literal": 0},
+                "lastMovementAt": {"$literal": None},
+                "createdAt": {"$literal": now},
+                "updatedAt": {"$literal": now},
+            }
+        },
+        {"$unwind": "$scopeId"},
+        {
+            "$merge": {
+                "into": "account_scope_state",
+                "on": ["year", "scopeType", "scopeId", "accountCode"],
+                "whenMatched": [{"$set": {"updatedAt": "$$new.updatedAt"}}, {"$unset": "rollupOnly"}],
+                "whenNotMatched": "insert",
+            }
+        },
+    ]
+    list(mongo.db.master_accounts.aggregate(pipeline))
+    inserted = max(0, mongo.db.account_scope_state.count_documents(state_filter) - before)
+    if inserted:
+        _bump_ledger_versions(year, [(scope_type, scope_id) for scope_id in scope_ids])
+    return inserted
+
+
+def is_funding_debit(movement_type: str, reference: Optional[Dict[str, Any]]) -> bool:
+    """Débitos que cuentan como fondeo histórico del proyecto (asignaciones, migraciones, transferencias)."""
+    if movement_type != "debit":
+        return False
+    reference = reference or {}
+    funding_type = _clean_str(reference.get("fundingType")).lower()
+    kind = _clean_str(reference.get("kind")).lower()
+    return funding_type in {"funding", "migration"} or kind == "transfer"
+
+
+def _track_project_totals(
+    changes: Dict[str, Dict[str, Any]],
+    *,
+    scope_type: str,
+    scope_id: str,
+    before: float,
+    after: float,
+    funding_debit: float,
+    at: datetime,
+) -> None:
+    if scope_type != "project":
+        return
+    bucket = changes.setdefault(str(scope_id), {"delta": 0.0, "funded": 0, "debits": 0.0, "at": at})
+    bucket["delta"] += float(after) - float(before)
+    bucket["funded"] += int(after > 0) - int(before > 0)
+    bucket["debits"] += float(funding_debit)
+    bucket["at"] = max(bucket["at"], at)
+
+
+def _apply_project_totals(year: int, changes: Dict[str, Dict[str, Any]], session=None) -> None:
+    """Aplica los deltas a ``proyectos.fundingTotals.<year>`` en la misma sesión del ledger.
+
+    Solo toca proyectos cuyo resumen ya fue materializado (``rebuiltAt``); el resto se
+    materializa en su primera lectura o con ``scripts.rebuild_project_funding_totals``.
+    """
+    prefix = f"{PROJECT_TOTALS_FIELD}.{int(year)}"
+    ops = []
+    for project_id, bucket in changes.items():
+        project_oid = _to_object_id(project_id)
+        if not project_oid:
+            continue
+        ops.append(
+            UpdateOne(
+                {"_id": project_oid, f"{prefix}.rebuiltAt": {"$exists": True}},
+                {
+                    "$inc": {
+                        f"{prefix}.currentAvailable": round(bucket["delta"], 2),
+                        f"{prefix}.fundedAccountsCount": int(bucket["funded"]),
+                        f"{prefix}.fundingDebits": round(bucket["debits"], 2),
+                    },
+                    "$max": {f"{prefix}.lastMovementAt": bucket["at"]},
+                    "$set": {f"{prefix}.updatedAt": bucket["at"]},
+                },
+            )
+        )
+    if ops:
+        mongo.db.proyectos.bulk_write(ops, ordered=False, session=session)
+
+
+def timeline_event_type(movement_type: str, reference: Optional[Dict[str, Any]]) -> str:
+    """Tipo normalizado del movimiento para la línea de tiempo del proyecto."""
+    reference = reference or {}
+    if reference.get("fundingType") == "migration":
+        return "migration"
+    if reference.get("kind") == "fixed_rule":
+        return "rule"
+    if reference.get("kind") == "project_expense":
+        return "expense"
+    if movement_type == "debit":
+        return "funding"
+    return "adjustment"
+
+
+def _signed_amount(doc: Dict[str, Any]) -> float:
+    amount = float(doc.get("amount", 0) or 0)
+    return -amount if doc.get("type") == "credit" else amount
+
+
+def _project_balance_id(year: int, project_id: str) -> str:
+    return f"{int(year)}:{project_id}"
+
+
+def _ledger_project_base(year: int, project_id: str, session=None) -> Tuple[float, int]:
+    rows = list(
+        mongo.db.ledger_movements.aggregate(
+            [
+                {
+                    "$match": {
+                        "year": int(year),
+                        "scopeType": "project",
+                        "scopeId": project_id,
+                        "source": {"$ne": LEGACY_ACTION_SOURCE},
+                    }
+                },
+                {
+                    "$group": {
+                        "_id": None,
+                        "balance": {"$sum": {"$cond": [{"$eq": ["$type", "credit"]}, {"$multiply": ["$amount", -1]}, "$amount"]}},
+                        "count": {"$sum": 1},
+                    }
+                },
+            ],
+            session=session,
+        )
+    )
+    if not rows:
+        return 0.0, 0
+    return round(float(rows[0].get("balance", 0) or 0), 2), int(rows[0].get("count", 0) or 0)
+
+
+def _inc_project_balance(year: int, project_id: str, delta: float, now: datetime, session=None) -> Dict[str, Any]:
+    """``$inc`` del saldo acumulado del proyecto en ``project_ledger_balances``; devuelve el post-image.
+
+    Si el contador no existe se inicializa con la suma del ledger previo. ``stamped`` queda en
+    ``False`` cuando ya había movimientos sin ``projectBalanceAfter`` (ver ``stamp_project_timeline``).
+    """
+    balance_id = _project_balance_id(year, project_id)
+    update = {"$inc": {"balance": round(delta, 2)}, "$set": {"updatedAt": now}}
+    counter = mongo.db.project_ledger_balances.find_one_and_update(
+        {"_id": balance_id}, update, return_document=ReturnDocument.AFTER, session=session
+    )
+    if counter is not None:
+        return counter
+
+    base, count = _ledger_project_base(year, project_id, session=session)
+    mongo.db.project_ledger_balances.update_one(
+        {"_id": balance_id},
+        {
+            "$setOnInsert": {
+                "year": int(year),
+                "scopeId": project_id,
+                "balance": base,
+                "stamped": count == 0,
+                "createdAt": now,
+            }
+        },
+        upsert=True,
+        session=session,
+    )
+    return mongo.db.project_ledger_balances.find_one_and_update(
+        {"_id": balance_id}, update, return_document=ReturnDocument.AFTER, session=session
+    )
+
+
+def _stamp_ledger_docs(
+    year: int,
+    docs: List[Dict[str, Any]],
+    now: datetime,
+    session=None,
+    applied: Optional[List[Tuple[Any, Dict[str, Any], Dict[str, Any]]]] = None,
+) -> None:
+    """Sella ``eventType`` en cada movimiento y ``projectBalanceAfter`` en los de proyecto antes del insert.
+
+    Un solo ``$inc`` por proyecto; los saldos intermedios se derivan en el orden de ``docs``,
+    que es el orden de inserción (y de ``_id``). El ``$inc`` va antes del insert porque el sello
+    sale de su post-image; sin sesión se agrega a ``applied`` para que ``_undo_balance_writes``
+    lo revierta si el insert falla.
+    """
+    deltas: Dict[str, float] = {}
+    for doc in docs:
+        doc["eventType"] = timeline_event_type(doc.get("type"), doc.get("reference"))
+        if doc.get("scopeType") == "project":
+            deltas[doc["scopeId"]] = deltas.get(doc["scopeId"], 0.0) + _signed_amount(doc)
+
+    for project_id, delta in deltas.items():
+        counter = _inc_project_balance(year, project_id, delta, now, session=session)
+        if session is None and applied is not None:
+            applied.append(
+                (mongo.db.project_ledger_balances, {"_id": _project_balance_id(year, project_id)}, {"$inc": {"balance": round(delta, 2)}})
+            )
+        running = float(counter.get("balance", 0) or 0) - delta
+        for doc in docs:
+            if doc.get("scopeType") == "project" and doc["scopeId"] == project_id:
+                running += _signed_amount(doc)
+                doc["projectBalanceAfter"] = round(running, 2)
+
+
+def _parse_movement_item(raw: Dict[str, Any]) -> Dict[str, Any]:
+    if not isinstance(raw, dict):
+        raise ValueError("Cada movimiento debe ser un objeto")
+
+    scope_type = _clean_str(raw.get("scopeType"))
+    scope_id = _clean_str(raw.get("scopeId"))
+    account_code = _clean_str(raw.get("accountCode"))
+    movement_type = _clean_str(raw.get("type")).lower()
+
+    if scope_type not in VALID_SCOPE_TYPES:
+        raise ValueError("scopeType debe ser department, project o global")
+    if not scope_id:
+        if scope_type != "global":
+            raise ValueError("scopeId es requerido")
+        scope_id = "global"
+    if not account_code:
+        raise ValueError("accountCode es requerido")
+    if movement_type not in {"debit", "credit"}:
+        raise ValueError("type debe ser debit o credit")
+    try:
+        amount = float(raw.get("amount"))
+    except (TypeError, ValueError):
+        raise ValueError("amount debe ser numérico")
+    if amount <= 0:
+        raise ValueError("amount debe ser mayor que 0")
+
+    return {
+        "scopeType": scope_type,
+        "scopeId": scope_id,
+        "accountCode": account_code,
+        "type": movement_type,
+        "amount": amount,
+        "delta": amount if movement_type == "debit" else -amount,
+        "description": _clean_str(raw.get("description")),
+        "reference": raw.get("reference") if isinstance(raw.get("reference"), dict) else {},
+    }
+
+
+def _read_state_balances(
+    year: int,
+    items: Iterable[Dict[str, Any]],
+    stripes: Optional[Dict[Tuple[str, str, str], Dict[str, Any]]] = None,
+) -> Dict[Tuple[str, str, str], float]:
+    """Saldos actuales de los (scope, cuenta) que tocan ``items``, en una sola lectura ``$or``.
+
+    Incluye lo acumulado en stripes; si se pasa ``stripes`` se completa con su detalle.
+    """
+    keys = sorted({(item["scopeType"], item["scopeId"], item["accountCode"]) for item in items})
+    balances: Dict[Tuple[str, str, str], float] = {}
+    if not keys:
+        return balances
+    state_rows = mongo.db.account_scope_state.find(
+        {
+            "year": int(year),
+            "$or": [
+                {"scopeType": scope_type, "scopeId": scope_id, "accountCode": code}
+                for scope_type, scope_id, code in keys
+            ],
+        },
+        {"_id": 0, "scopeType": 1, "scopeId": 1, "accountCode": 1, "balance": 1},
+    )
+    for row in state_rows:
+        balances[(row["scopeType"], row["scopeId"], row["accountCode"])] = float(row.get("balance", 0) or 0)
+
+    stripe_keys = [key for key in keys if key[0] in STRIPE_SCOPE_TYPES]
+    if stripe_keys:
+        found = stripe_states(
+            year,
+            {
+                "$or": [
+                    {"scopeType": scope_type, "scopeId": scope_id, "accountCode": code}
+                    for scope_type, scope_id, code in stripe_keys
+                ]
+            },
+        )
+        for key, entry in found.items():
+            balances[key] = balances.get(key, 0.0) + entry["balance"]
+        if stripes is not None:
+            stripes.update(found)
+    return balances
+
+
+def _persist_movements(
+    year: int,
+    items: List[Dict[str, Any]],
+    initial_balances: Dict[Tuple[str, str, str], float],
+    *,
+    created_by: str,
+    allow_negative: bool,
+    tag: Dict[str, Any],
+    stripes: Optional[Dict[Tuple[str, str, str], Dict[str, Any]]] = None,
+    logs: Optional[Iterable[Tuple[Any, str]]] = None,
+    project_fields: Optional[Dict[Any, Dict[str, Any]]] = None,
+) -> List[Dict[str, Any]]:
+    """Persiste movimientos ya validados en una transacción: los ``$inc`` sobre ``account_scope_state``
+    (con guardia ``$gte`` si no se admiten negativos, ver ``_apply_balance_writes``) y un ``insert_many``.
+
+    ``tag`` se copia en cada documento del ledger (``batchId``/``journalId``). En scopes con
+    stripes el ``$inc`` va a un stripe al azar; un descuento va a un stripe (o al principal) con
+    saldo suficiente según ``stripes`` (ver ``_read_state_balances``). Las cuentas de proyecto se
+    actualizan con ``find_one_and_update`` para derivar ``fundingTotals`` de su post-image. Los
+    ``logs`` ``(id_proyecto, mensaje)`` y los ``$set`` de ``project_fields`` (``{_id del proyecto:
+    campos}``) se escriben en la misma transacción.
+    """
+    now = _now_utc()
+    log_docs = documentos_log(logs or [], fecha=now)
+    movement_docs = []
+    grouped: Dict[Tuple[str, str, str], Dict[str, float]] = {}
+    for item in items:
+        key = (item["scopeType"], item["scopeId"], item["accountCode"])
+        movement_docs.append(
+            {
+                "year": int(year),
+                "scopeType": item["scopeType"],
+                "scopeId": item["scopeId"],
+                "accountCode": item["accountCode"],
+                "type": item["type"],
+                "amount": item["amount"],
+                "currency": DEFAULT_CURRENCY,
+                "description": item["description"],
+                "reference": item["reference"],
+                **tag,
+                "createdBy": created_by,
+                "createdAt": now,
+            }
+        )
+        bucket = grouped.setdefault(key, {"delta": 0.0, "count": 0, "fundingDebits": 0.0})
+        bucket["delta"] += item["delta"]
+        bucket["count"] += 1
+        if is_funding_debit(item["type"], item["reference"]):
+            bucket["fundingDebits"] += item["amount"]
+
+    striped = striped_scope_types()
+    stripes = stripes or {}
+    balance_writes = []
+    project_writes = []
+    for key, bucket in grouped.items():
+        if key[0] in striped and key in initial_balances:
+            write = _striped_write(
+                year,
+                key,
+                bucket["delta"],
+                bucket["count"],
+                now,
+                allow_negative=allow_negative,
+                total=initial_balances[key],
+                entry=stripes.get(key),
+            )
+            if write is not None:
+                balance_writes.append(write)
+                continue
+
+        state_filter: Dict[str, Any] = _state_filter(year, key)
+        update: Dict[str, Any] = {
+            "$inc": {"balance": bucket["delta"], "movementsCount": bucket["count"]},
+            "$set": {"lastMovementAt": now, "updatedAt": now},
+        }
+        upsert = allow_negative or bucket["delta"] >= 0
+        if upsert:
+            update["$setOnInsert"] = {"createdAt": now}
+        else:
+            # Re-valida en el propio update por si otro proceso movió el saldo tras la lectura.
+            state_filter["balance"] = {"$gte": -bucket["delta"]}
+        if key[0] == "project":
+            project_writes.append((key, state_filter, update, upsert))
+        else:
+            balance_writes.append((mongo.db.account_scope_state, state_filter, update, upsert))
+
+    rollup_ops = _header_rollup_ops(year, {key: bucket["delta"] for key, bucket in grouped.items()}, now)
+
+    def _txn(sess):
+        applied = _apply_balance_writes(balance_writes, now, session=sess)
+        project_changes: Dict[str, Dict[str, Any]] = {}
+        try:
+            for key, state_filter, update, upsert in project_writes:
+                # Los cruces por cero de fundedAccountsCount salen del post-image del propio update,
+                # no de la lectura previa a la transacción.
+                state = mongo.db.account_scope_state.find_one_and_update(
+                    state_filter,
+                    update,
+                    projection={"_id": 0, "balance": 1},
+                    upsert=upsert,
+                    return_document=ReturnDocument.AFTER,
+                    session=sess,
+                )
+                if state is None:
+                    raise ValueError(BALANCE_CONFLICT_MESSAGE)
+                if sess is None:
+                    applied.append((mongo.db.account_scope_state, state_filter, update))
+                after = float(state.get("balance", 0) or 0)
+                _track_project_totals(
+                    project_changes,
+                    scope_type=key[0],
+                    scope_id=key[1],
+                    before=after - grouped[key]["delta"],
+                    after=after,
+                    funding_debit=grouped[key]["fundingDebits"],
+                    at=now,
+                )
+            _stamp_ledger_docs(year, movement_docs, now, session=sess, applied=applied)
+            mongo.db.ledger_movements.insert_many(movement_docs, session=sess)
+        except Exception:
+            # Sin transacción: si el ledger no se escribe, los saldos no deben quedar movidos.
+            _undo_balance_writes(applied, now)
+            raise
+        if rollup_ops:
+            mongo.db.account_scope_state.bulk_write(rollup_ops, ordered=False, session=sess)
+        _apply_project_totals(year, project_changes, session=sess)
+        for project_id, fields in (project_fields or {}).items():
+            if fields:
+                mongo.db.proyectos.update_one({"_id": project_id}, {"$set": fields}, session=sess)
+        if log_docs:
+            mongo.db.logs.insert_many(log_docs, session=sess)
+
+    _run_in_transaction(_txn)
+    _bump_ledger_versions(year, [(scope_type, scope_id) for scope_type, scope_id, _code in grouped])
+    return movement_docs
+
+
 @dataclass
 class SeedStats:
     accounts: int = 0
@@ -72,6 +974,8 @@ class AccountingIndexes:
         db.master_accounts.create_index([("year", 1), ("code", 1)], unique=True)
         db.master_accounts.create_index([("year", 1), ("group", 1)])
         db.master_accounts.create_index([("year", 1), ("parent_code", 1)])
+        db.master_accounts.create_index([("year", 1), ("ancestors", 1)])
+        db.master_accounts.create_index([("year", 1), ("root_code", 1)])
 
         db.master_units.create_index([("year", 1), ("code", 1)], unique=True)
 
@@ -83,15 +987,137 @@ class AccountingIndexes:
         )
         db.account_scope_state.create_index([("year", 1), ("scopeType", 1), ("scopeId", 1)])
         db.account_scope_state.create_index([("year", 1), ("accountCode", 1)])
+        db.account_scope_stripes.create_index([("year", 1), ("scopeType", 1), ("scopeId", 1), ("accountCode", 1)])
 
         db.ledger_movements.create_index([("year", 1), ("scopeType", 1), ("scopeId", 1), ("createdAt", -1)])
+        db.ledger_movements.create_index([("scopeType", 1), ("scopeId", 1), ("createdAt", -1), ("_id", -1)])
         db.ledger_movements.create_index([("year", 1), ("accountCode", 1)])
+        db.ledger_movements.create_index([("legacyActionId", 1)], unique=True, sparse=True)
         db.ledger_movements.create_index([("year", 1), ("reference.kind", 1), ("reference.id", 1)])
 
         db.departamentos.create_index([("accountingUnitCode", 1)], sparse=True)
         cls._created = True
 
 
+class AccountHierarchyService:
+    """Mantiene ``ancestors`` (raíz → padre) y ``root_code`` materializados en ``master_accounts``.
+
+    Solo se materializan ancestros existentes en el catálogo del año: una cuenta cuyo
+    ``parent_code`` no existe se trata como raíz, igual que en ``_build_tree``.
+    """
+
+    @staticmethod
+    def path_for(year: int, code: str, parent_code: Optional[str]) -> Tuple[List[str], str]:
+        if not parent_code:
+            return [], code
+        parent = mongo.db.master_accounts.find_one(
+            {"year": int(year), "code": parent_code}, {"_id": 0, "code": 1, "ancestors": 1, "root_code": 1}
+        )
+        if not parent:
+            return [], code
+        ancestors = list(parent.get("ancestors") or []) + [parent_code]
+        return ancestors, parent.get("root_code") or ancestors[0]
+
+    @staticmethod
+    def rebuild_year(year: int) -> Dict[str, Any]:
+        """Recalcula la jerarquía completa del año. Solo escribe las cuentas que cambian."""
+        AccountingIndexes.ensure_indexes()
+        accounts = list(
+            mongo.db.master_accounts.find(
+                {"year": int(year)}, {"_id": 0, "code": 1, "parent_code": 1, "ancestors": 1, "root_code": 1}
+            )
+        )
+        by_code = {acc["code"]: acc for acc in accounts}
+        paths: Dict[str, List[str]] = {}
+
+        def resolve(code: str) -> List[str]:
+            chain: List[str] = []
+            seen = {code}
+            current = by_code[code].get("parent_code")
+            while current and current in by_code and current not in seen:
+                if current in paths:
+                    chain = paths[current] + [current] + chain
+                    break
+                chain.insert(0, current)
+                seen.add(current)
+                current = by_code[current].get("parent_code")
+            return chain
+
+        ops = []
+        for acc in accounts:
+            ancestors = resolve(acc["code"])
+            paths[acc["code"]] = ancestors
+            root_code = ancestors[0] if ancestors else acc["code"]
+            if acc.get("ancestors") == ancestors and acc.get("root_code") == root_code:
+                continue
+            ops.append(
+                UpdateOne(
+                    {"year": int(year), "code": acc["code"]},
+                    {"$set": {"ancestors": ancestors, "root_code": root_code}},
+                )
+            )
+
+        if ops:
+            mongo.db.master_accounts.bulk_write(ops, ordered=False)
+            AccountCatalogCache.bump(mongo.db, int(year))
+        return {"year": int(year), "accounts": len(accounts), "updated": len(ops)}
+
+    @staticmethod
+    def refresh_subtree(year: int, code: str) -> int:
+        """Recalcula la ruta de ``code`` desde su padre y reescribe todo su subárbol.
+
+        Devuelve la cantidad de cuentas actualizadas (nodo + descendientes).
+        """
+        node = mongo.db.master_accounts.find_one(
+            {"year": int(year), "code": code}, {"_id": 0, "code": 1, "parent_code": 1, "ancestors": 1}
+        )
+        if not node:
+            return 0
+
+        ancestors, root_code = AccountHierarchyService.path_for(year, code, node.get("parent_code"))
+        if code in ancestors:
+            raise ValueError("La jerarquía resultante contiene un ciclo")
+
+        ops = [UpdateOne({"year": int(year), "code": code}, {"$set": {"ancestors": ancestors, "root_code": root_code}})]
+        prefix = ancestors + [code]
+        descendants = mongo.db.master_accounts.find(
+            {"year": int(year), "ancestors": code}, {"_id": 0, "code": 1, "ancestors": 1}
+        )
+        for row in descendants:
+            old = list(row.get("ancestors") or [])
+            tail = old[old.index(code) + 1:] if code in old else []
+            ops.append(
+                UpdateOne(
+                    {"year": int(year), "code": row["code"]},
+                    {"$set": {"ancestors": prefix + tail, "root_code": root_code}},
+                )
+            )
+
+        mongo.db.master_accounts.bulk_write(ops, ordered=False)
+        AccountCatalogCache.bump(mongo.db, int(year))
+        return len(ops)
+
+    @staticmethod
+    def on_account_created(year: int, code: str) -> int:
+        # Una cuenta nueva puede "adoptar" cuentas huérfanas cuyo parent_code ya apuntaba a ella.
+        updated = AccountHierarchyService.refresh_subtree(year, code)
+        orphans = mongo.db.master_accounts.find({"year": int(year), "parent_code": code}, {"_id": 0, "code": 1})
+        for child in orphans:
+            updated += AccountHierarchyService.refresh_subtree(year, child["code"])
+        return updated
+
+    @staticmethod
+    def validate_parent(year: int, code: str, parent_code: Optional[str]) -> None:
+        if not parent_code:
+            return
+        if parent_code == code:
+            raise ValueError("Una cuenta no puede ser su propio padre")
+        # La cadena sale del catálogo (parent_code), no de ``ancestors`` materializado, que
+        # puede estar desactualizado.
+        if code in _catalog(year).ancestors_of(parent_code):
+            raise ValueError("parent_code no puede ser un descendiente de la cuenta")
+
+
 class AccountCatalogService:
     @staticmethod
     def search(
@@ -105,14 +1131,10 @@ class AccountCatalogService:
         include_zero: bool = True,
     ) -> List[Dict[str, Any]]:
         AccountingIndexes.ensure_indexes()
-        query: Dict[str, Any] = {"year": int(year)}
-        if group:
-            query["group"] = group.upper()
-        if q:
-            safe_q = str(q).strip()
-            query["$or"] = [{"code": {"$regex": safe_q}}, {"description": {"$regex": safe_q, "$options": "i"}}]
+        catalog = _catalog(year)
 
         states_by_code: Dict[str, Dict[str, Any]] = {}
+        within: Optional[Set[str]] = None
         if scope_type and scope_id:
             state_rows = list(
                 mongo.db.account_scope_state.find(
@@ -121,6 +1143,8 @@ class AccountCatalogService:
                 )
             )
             states_by_code = {row["accountCode"]: row for row in state_rows}
+            for (_type, _id, code), entry in stripe_states(year, {"scopeType": scope_type, "scopeId": scope_id}).items():
+                fold_stripe_state(states_by_code.setdefault(code, {"accountCode": code}), entry)
             if assigned_only:
                 visible_codes = set(states_by_code.keys())
                 if not include_zero:
@@ -131,10 +1155,10 @@ class AccountCatalogService:
                     }
                 if not visible_codes:
                     return []
-                query["code"] = {"$in": sorted(visible_codes)}
+                within = visible_codes
 
-        cursor = mongo.db.master_accounts.find(query, {"_id": 0}).sort("code", 1).limit(max(1, min(limit, 500)))
-        rows = list(cursor)
+        codes = catalog.search_codes(str(q or "").strip(), group=group, within=within)
+        rows = [catalog.get(code).as_dict() for code in codes[: max(1, min(limit, 500))]]
 
         if scope_type and scope_id:
             enriched = []
@@ -154,24 +1178,89 @@ class AccountCatalogService:
         return rows
 
     @staticmethod
-    def tree(year: int, group: Optional[str] = None) -> List[Dict[str, Any]]:
+    def tree(year: int, group: Optional[str] = None, root: Optional[str] = None) -> List[Dict[str, Any]]:
         AccountingIndexes.ensure_indexes()
-        query: Dict[str, Any] = {"year": int(year)}
-        if group:
-            query["group"] = group.upper()
+        catalog = _catalog(year)
+        codes = catalog.subtree_codes(root) if root else None
+        return _build_tree(catalog.accounts(codes, group=group))
 
-        accounts = list(mongo.db.master_accounts.find(query, {"_id": 0}).sort("code", 1))
-        return _build_tree(accounts)
+    @staticmethod
+    def tree_columnar(year: int, group: Optional[str] = None, root: Optional[str] = None) -> Dict[str, Any]:
+        """Catálogo plano en orden de código; el cliente arma el árbol con ``parent_code``."""
+        catalog = _catalog(year)
+        codes = catalog.subtree_codes(root) if root else None
+        return columnar_payload(catalog.accounts(codes, group=group), CATALOG_COLUMNS)
+
+    @staticmethod
+    def tree_children(
+        year: int,
+        parent: Optional[str] = None,
+        group: Optional[str] = None,
+        scope_type: Optional[str] = None,
+        scope_id: Optional[str] = None,
+    ) -> List[Dict[str, Any]]:
+        """Un solo nivel del árbol (raíces si ``parent`` es vacío) con ``childCount`` por nodo."""
+        catalog = _catalog(year)
+        if parent and parent not in catalog:
+            raise ValueError("La cuenta padre no existe para el año indicado")
+
+        rows = []
+        for account in catalog.accounts(catalog.children_of(parent), group=group):
+            rows.append(
+                {
+                    "code": account["code"],
+                    "description": account["description"],
+                    "group": account["group"],
+                    "level": account["level"],
+                    "is_header": account["is_header"],
+                    "parent_code": account["parent_code"],
+                    "childCount": len(catalog.children.get(account["code"], ())),
+                }
+            )
+
+        if scope_type and scope_id and rows:
+            states = mongo.db.account_scope_state.find(
+                {
+                    "year": int(year),
+                    "scopeType": scope_type,
+                    "scopeId": scope_id,
+                    "accountCode": {"$in": [row["code"] for row in rows]},
+                },
+                {"_id": 0, "accountCode": 1, "balance": 1, "movementsCount": 1, "rollupBalance": 1, "rollupOnly": 1},
+            )
+            state_by_code = {row["accountCode"]: row for row in states}
+            stripes = stripe_states(
+                year, {"scopeType": scope_type, "scopeId": scope_id, "accountCode": {"$in": [row["code"] for row in rows]}}
+            )
+            for (_type, _id, code), entry in stripes.items():
+                fold_stripe_state(state_by_code.setdefault(code, {"accountCode": code}), entry)
+            with_rollups = rollup_headers_enabled()
+            for row in rows:
+                state = state_by_code.get(row["code"], {})
+                row["balance"] = float(state.get("balance", 0) or 0)
+                row["movementsCount"] = int(state.get("movementsCount", 0) or 0)
+                row["hasState"] = bool(state) and _is_assigned_state(state)
+                if with_rollups and row["is_header"]:
+                    row["rollupBalance"] = float(state.get("rollupBalance", 0) or 0)
+        return rows
 
     @staticmethod
     def consolidated_totals(year: int, scope_type: Optional[str] = None, scope_id: Optional[str] = None) -> Dict[str, Any]:
         AccountingIndexes.ensure_indexes()
+        token = (AccountCatalogCache.current_version(mongo.db, year), _ledger_version(year, scope_type, scope_id))
+        cached = ConsolidatedTotalsCache.get((int(year), scope_type, scope_id), token)
+        if cached is not None:
+            return {**cached, "cached": True}
+
         match: Dict[str, Any] = {"year": int(year)}
         if scope_type:
             match["scopeType"] = scope_type
         if scope_id:
             match["scopeId"] = scope_id
 
+        # Una sola agregación: suma por cuenta, une la raíz materializada (root_code) y suma por raíz.
+        # Las cuentas sin root_code (catálogo sin materializar) salen aparte en ``unrooted`` y se
+        # agrupan abajo con ``catalog.root_of``; la lectura nunca escribe el catálogo.
         pipeline = [
             {"$match": match},
             {
@@ -179,47 +1268,143 @@ class AccountCatalogService:
                     "_id": "$accountCode",
                     "totalBalance": {"$sum": "$balance"},
                     "totalMovements": {"$sum": "$movementsCount"},
+                    "totalRollup": {"$sum": {"$ifNull": ["$rollupBalance", 0]}},
                 }
             },
-            {"$sort": {"_id": 1}},
-        ]
-
-        totals_rows = list(mongo.db.account_scope_state.aggregate(pipeline))
-        rows = [
             {
-                "accountCode": row["_id"],
-                "balance": row.get("totalBalance", 0),
-                "movementsCount": row.get("totalMovements", 0),
-            }
-            for row in totals_rows
+                "$lookup": {
+                    "from": "master_accounts",
+                    "let": {"code": "$_id"},
+                    "pipeline": [
+                        {"$match": {"$expr": {"$and": [{"$eq": ["$year", int(year)]}, {"$eq": ["$code", "$$code"]}]}}},
+                        {"$project": {"_id": 0, "root_code": 1}},
+                    ],
+                    "as": "account",
+                }
+            },
+            {"$set": {"rootCode": {"$ifNull": [{"$arrayElemAt": ["$account.root_code", 0]}, None]}}},
+            {
+                "$facet": {
+                    "byAccount": [
+                        {"$sort": {"_id": 1}},
+                        {
+                            "$project": {
+                                "_id": 0,
+                                "accountCode": "$_id",
+                                "balance": "$totalBalance",
+                                "movementsCount": "$totalMovements",
+                                "rollupBalance": "$totalRollup",
+                            }
+                        },
+                    ],
+                    "byRoot": [
+                        {"$match": {"rootCode": {"$ne": None}}},
+                        {
+                            "$group": {
+                                "_id": "$rootCode",
+                                "balance": {"$sum": "$totalBalance"},
+                                "rootTotal": {
+                                    "$sum": {
+                                        "$cond": [
+                                            {"$eq": ["$_id", "$rootCode"]},
+                                            {"$add": ["$totalBalance", "$totalRollup"]},
+                                            0,
+                                        ]
+                                    }
+                                },
+                                "hasRootRow": {"$max": {"$eq": ["$_id", "$rootCode"]}},
+                            }
+                        },
+                        {
+                            "$lookup": {
+                                "from": "master_accounts",
+                                "let": {"code": "$_id"},
+                                "pipeline": [
+                                    {"$match": {"$expr": {"$and": [{"$eq": ["$year", int(year)]}, {"$eq": ["$code", "$$code"]}]}}},
+                                    {"$project": {"_id": 0, "description": 1}},
+                                ],
+                                "as": "root",
+                            }
+                        },
+                        {"$sort": {"_id": 1}},
+                    ],
+                    "unrooted": [
+                        {"$match": {"rootCode": None}},
+                        {"$project": {"totalBalance": 1, "totalRollup": 1}},
+                    ],
+                }
+            },
         ]
 
-        accounts = list(mongo.db.master_accounts.find({"year": int(year)}, {"_id": 0, "code": 1, "parent_code": 1, "description": 1}))
-        by_code = {acc["code"]: acc for acc in accounts}
-
-        def find_root(code: str) -> str:
-            current = by_code.get(code)
-            seen = set()
-            while current and current.get("parent_code") and current["parent_code"] in by_code and current["code"] not in seen:
-                seen.add(current["code"])
-                current = by_code[current["parent_code"]]
-            return current["code"] if current else code
+        with_rollups = rollup_headers_enabled()
+        facets = next(iter(mongo.db.account_scope_state.aggregate(pipeline)), None) or {}
+
+        # Saldos en stripes: se suman por cuenta y por raíz sobre el resultado de la agregación.
+        catalog = _catalog(year)
+        stripe_by_code: Dict[str, Dict[str, float]] = {}
+        stripe_by_root: Dict[str, Dict[str, float]] = {}
+        for (_type, _id, code), entry in stripe_states(year, {k: v for k, v in match.items() if k != "year"}).items():
+            # Misma raíz que la agregación (root_code materializado = primer ancestro existente).
+            root_code = catalog.root_of(code)
+            for target, group_key in ((stripe_by_code, code), (stripe_by_root, root_code)):
+                bucket = target.setdefault(group_key, {"balance": 0.0, "movementsCount": 0, "own": 0.0})
+                bucket["balance"] += entry["balance"]
+                bucket["movementsCount"] += entry["movementsCount"]
+                if code == root_code:
+                    bucket["own"] += entry["balance"]
 
-        root_agg: Dict[str, float] = {}
-        for row in rows:
-            root_code = find_root(row["accountCode"])
-            root_agg[root_code] = root_agg.get(root_code, 0) + float(row.get("balance", 0))
-
-        totals_by_root = [
-            {
-                "rootCode": code,
-                "description": by_code.get(code, {}).get("description", "N/A"),
-                "balance": balance,
-            }
-            for code, balance in sorted(root_agg.items())
-        ]
+        rows = []
+        for row in facets.get("byAccount", []):
+            if not with_rollups:
+                row.pop("rollupBalance", None)
+            extra = stripe_by_code.get(row.get("accountCode"))
+            if extra:
+                row["balance"] = row.get("balance", 0) + extra["balance"]
+                row["movementsCount"] = row.get("movementsCount", 0) + extra["movementsCount"]
+            rows.append(row)
+
+        by_root = {row["_id"]: row for row in facets.get("byRoot", [])}
+        for row in facets.get("unrooted", []):
+            code = row["_id"]
+            root_code = catalog.root_of(code)
+            bucket = by_root.get(root_code)
+            if bucket is None:
+                account = catalog.get(root_code)
+                bucket = {
+                    "_id": root_code,
+                    "balance": 0,
+                    "rootTotal": 0,
+                    "hasRootRow": False,
+                    "root": [{"description": account.description if account else None}],
+                }
+                by_root[root_code] = bucket
+            bucket["balance"] = bucket.get("balance", 0) + row.get("totalBalance", 0)
+            if code == root_code:
+                bucket["rootTotal"] = bucket.get("rootTotal", 0) + row.get("totalBalance", 0) + row.get("totalRollup", 0)
+                bucket["hasRootRow"] = True
+
+        totals_by_root = []
+        for _root_code, row in sorted(by_root.items()):
+            extra = stripe_by_root.get(row["_id"])
+            if extra:
+                row["balance"] = row.get("balance", 0) + extra["balance"]
+                # En modo rollup los detalles ya llegan a la raíz por rollupBalance; solo falta su propio stripe.
+                row["rootTotal"] = row.get("rootTotal", 0) + extra["own"]
+            # En modo rollup la raíz ya acumula a sus descendientes: no se re-suman detalles.
+            if with_rollups and not row.get("hasRootRow"):
+                continue
+            root = (row.get("root") or [{}])[0]
+            totals_by_root.append(
+                {
+                    "rootCode": row["_id"],
+                    "description": root.get("description") or "N/A",
+                    "balance": row.get("rootTotal", 0) if with_rollups else row.get("balance", 0),
+                }
+            )
 
-        return {"year": int(year), "totalsByAccount": rows, "totalsByRoot": totals_by_root}
+        result = {"year": int(year), "totalsByAccount": rows, "totalsByRoot": totals_by_root}
+        ConsolidatedTotalsCache.put((int(year), scope_type, scope_id), token, result)
+        return {**result, "cached": False}
 
 
 class AccountScopeService:
@@ -231,19 +1416,40 @@ class AccountScopeService:
         group: Optional[str] = None,
         assigned_only: bool = False,
         include_zero: bool = True,
+        columnar: bool = False,
     ) -> Dict[str, Any]:
         AccountingIndexes.ensure_indexes()
-        accounts_query: Dict[str, Any] = {"year": int(year)}
-        if group:
-            accounts_query["group"] = group.upper()
-
-        accounts = list(mongo.db.master_accounts.find(accounts_query, {"_id": 0}).sort("code", 1))
+        catalog = _catalog(year)
         states_cursor = mongo.db.account_scope_state.find(
             {"year": int(year), "scopeType": scope_type, "scopeId": scope_id},
-            {"_id": 0, "accountCode": 1, "balance": 1, "movementsCount": 1, "lastMovementAt": 1},
+            {
+                "_id": 0,
+                "accountCode": 1,
+                "balance": 1,
+                "movementsCount": 1,
+                "lastMovementAt": 1,
+                "rollupBalance": 1,
+                "rollupOnly": 1,
+            },
         )
         state_by_code = {row["accountCode"]: row for row in states_cursor}
-        all_assigned_codes = set(state_by_code.keys())
+        for (_type, _id, code), entry in stripe_states(year, {"scopeType": scope_type, "scopeId": scope_id}).items():
+            fold_stripe_state(state_by_code.setdefault(code, {"accountCode": code}), entry)
+        all_assigned_codes = {code for code, row in state_by_code.items() if _is_assigned_state(row)}
+        with_rollups = rollup_headers_enabled()
+
+        if assigned_only:
+            # Modo disperso: solo las cuentas asignadas y su cadena de ancestros, sin recorrer
+            # el catálogo completo; costo y payload escalan con las cuentas del scope.
+            seed_codes = {code for code in all_assigned_codes if code in catalog}
+            if not include_zero:
+                seed_codes = {code for code in seed_codes if _state_has_activity(state_by_code[code])}
+            visible_codes = set(seed_codes)
+            for code in seed_codes:
+                visible_codes.update(catalog.ancestors_of(code))
+            accounts = catalog.accounts(visible_codes, group=group)
+        else:
+            accounts = catalog.accounts(group=group)
 
         by_code: Dict[str, Dict[str, Any]] = {}
 
@@ -258,23 +1464,17 @@ class AccountScopeService:
                 "lastMovementAt": state.get("lastMovementAt"),
                 "hasState": has_state,
             }
+            if with_rollups and account.get("is_header"):
+                item["rollupBalance"] = float(state.get("rollupBalance", 0) or 0)
             by_code[item["code"]] = item
             merged.append(
                 item
             )
 
-        if assigned_only:
-            visible_codes = set(all_assigned_codes)
-        else:
-            visible_codes = set(by_code.keys())
-
-        if not include_zero:
-            non_zero_codes = {
-                code
-                for code in visible_codes
-                if float(by_code.get(code, {}).get("balance", 0) or 0) != 0
-                or float(by_code.get(code, {}).get("movementsCount", 0) or 0) > 0
-            }
+        visible_codes = set(by_code.keys())
+
+        if not include_zero and not assigned_only:
+            non_zero_codes = {code for code in visible_codes if _state_has_activity(by_code[code])}
 
             # Preserve parent chain so the tree remains navigable.
             with_ancestors = set(non_zero_codes)
@@ -293,14 +1493,21 @@ class AccountScopeService:
         total_visible = len(filtered_items)
         total_balance_visible = sum(float(item.get("balance", 0) or 0) for item in filtered_items)
 
+        if columnar:
+            columns = SCOPE_COLUMNS + (("rollupBalance",) if with_rollups else ())
+            body: Dict[str, Any] = {"columns": columnar_payload(filtered_items, columns)}
+        else:
+            body = {"tree": _build_tree(filtered_items)}
+
         return {
             "year": int(year),
             "scopeType": scope_type,
             "scopeId": scope_id,
-            "tree": _build_tree(filtered_items),
+            **body,
             "meta": {
                 "assignedOnly": bool(assigned_only),
                 "includeZero": bool(include_zero),
+                "sparse": bool(assigned_only),
                 "totalAssigned": len(all_assigned_codes),
                 "totalVisible": total_visible,
                 "totalBalanceVisible": total_balance_visible,
@@ -311,50 +1518,130 @@ class AccountScopeService:
     def init_scope(year: int, scope_type: str, scope_id: str, mode: str = "detail_only") -> Dict[str, Any]:
         AccountingIndexes.ensure_indexes()
         mode_value = (mode or "detail_only").strip()
+        match = _init_scope_match(year, mode_value)
+        inserted = _merge_scope_states(year, match, scope_type, [scope_id])
+        return {"inserted": int(inserted), "mode": mode_value, "scopeType": scope_type, "scopeId": scope_id, "year": int(year)}
 
-        query: Dict[str, Any] = {"year": int(year)}
-        if mode_value == "detail_only":
-            query["is_header"] = False
-        elif mode_value.startswith("group:"):
-            group = mode_value.split(":", 1)[1].strip().upper()
-            if group:
-                query["group"] = group
-        elif mode_value == "all":
-            pass
-        else:
-            raise ValueError("mode inválido. Use detail_only, all o group:EGRESO")
+    @staticmethod
+    def init_scopes_bulk(
+        year: int,
+        scope_type: str,
+        scope_ids: List[str],
+        mode: str = "detail_only",
+    ) -> Dict[str, Any]:
+        """Inicializa muchos scopes con un pipeline ``$merge`` por bloque de ``INIT_BULK_CHUNK`` scopes."""
+        AccountingIndexes.ensure_indexes()
+        mode_value = (mode or "detail_only").strip()
+        match = _init_scope_match(year, mode_value)
+        ids = [str(scope_id) for scope_id in scope_ids]
+
+        inserted = 0
+        for start in range(0, len(ids), INIT_BULK_CHUNK):
+            inserted += _merge_scope_states(year, match, scope_type, ids[start:start + INIT_BULK_CHUNK])
+        return {
+            "year": int(year),
+            "mode": mode_value,
+            "scopeType": scope_type,
+            "total": len(ids),
+            "processed": len(ids),
+            "inserted": inserted,
+        }
 
-        accounts = list(mongo.db.master_accounts.find(query, {"_id": 0, "code": 1}))
-        if not accounts:
-            return {"inserted": 0, "mode": mode_value, "scopeType": scope_type, "scopeId": scope_id, "year": int(year)}
+    @staticmethod
+    def create_init_job(year: int, scope_type: str, scope_ids: List[str], mode: str, created_by: str) -> Dict[str, Any]:
+        _init_scope_match(year, (mode or "detail_only").strip())
+        now = _now_utc()
+        job = {
+            "_id": str(uuid.uuid4()),
+            "kind": "init_scopes",
+            "status": "pending",
+            "year": int(year),
+            "scopeType": scope_type,
+            "scopeIds": [str(scope_id) for scope_id in scope_ids],
+            "mode": (mode or "detail_only").strip(),
+            "total": len(scope_ids),
+            "processed": 0,
+            "inserted": 0,
+            "lockedUntil": None,
+            "createdBy": created_by,
+            "createdAt": now,
+            "updatedAt": now,
+        }
+        mongo.db.accounting_jobs.insert_one(job)
+        return job
 
+    @staticmethod
+    def advance_init_job(job_id: str, max_chunks: int = INIT_JOB_STEP_CHUNKS) -> Optional[Dict[str, Any]]:
+        """Procesa hasta ``max_chunks`` bloques pendientes del job y guarda el avance en ``accounting_jobs``.
+
+        Cada llamada es acotada y retoma desde ``processed`` (el ``$merge`` es idempotente), así que
+        el job avanza desde el POST que lo crea y desde ``scripts/run_init_scopes_jobs.py`` sin
+        depender de un hilo que sobreviva a la respuesta. ``lockedUntil`` evita que dos llamadas
+        procesen el mismo bloque a la vez. Un error de Mongo deja el job ``failed`` con ``error``
+        y se devuelve en su estado; cualquier otro error se propaga y el job se retoma al vencer
+        el lease.
+        """
         now = _now_utc()
-        ops = []
-        for account in accounts:
-            ops.append(
-                UpdateOne(
-                    {
-                        "year": int(year),
-                        "scopeType": scope_type,
-                        "scopeId": scope_id,
-                        "accountCode": account["code"],
-                    },
-                    {
-                        "$setOnInsert": {
-                            "balance": 0,
-                            "movementsCount": 0,
-                            "lastMovementAt": None,
-                            "createdAt": now,
-                        },
-                        "$set": {"updatedAt": now},
-                    },
-                    upsert=True,
+        job = mongo.db.accounting_jobs.find_one_and_update(
+            {
+                "_id": str(job_id),
+                "kind": "init_scopes",
+                "status": {"$in": ["pending", "running"]},
+                "$or": [{"lockedUntil": None}, {"lockedUntil": {"$lt": now}}],
+            },
+            {"$set": {"status": "running", "lockedUntil": now + timedelta(seconds=INIT_JOB_LEASE_SECONDS), "updatedAt": now}},
+            return_document=ReturnDocument.AFTER,
+        )
+        if job is None:
+            return AccountScopeService.get_job(job_id)
+
+        ids = job.get("scopeIds")
+        if ids is None:
+            # Jobs creados por la versión con hilo en segundo plano: no guardaban los scopes.
+            mongo.db.accounting_jobs.update_one(
+                {"_id": job["_id"]},
+                {"$set": {"status": "failed", "error": "El job no guarda sus scopes; vuelve a lanzarlo", "lockedUntil": None, "finishedAt": now}},
+            )
+            return AccountScopeService.get_job(job_id)
+
+        AccountingIndexes.ensure_indexes()
+        match = _init_scope_match(job["year"], job["mode"])
+        processed = int(job.get("processed", 0) or 0)
+        inserted = int(job.get("inserted", 0) or 0)
+        try:
+            for _ in range(max(int(max_chunks), 1)):
+                chunk = ids[processed:processed + INIT_BULK_CHUNK]
+                if not chunk:
+                    break
+                inserted += _merge_scope_states(job["year"], match, job["scopeType"], chunk)
+                processed += len(chunk)
+                mongo.db.accounting_jobs.update_one(
+                    {"_id": job["_id"]},
+                    {"$set": {"processed": processed, "inserted": inserted, "updatedAt": _now_utc()}},
                 )
+        except PyMongoError as exc:
+            mongo.db.accounting_jobs.update_one(
+                {"_id": job["_id"]},
+                {"$set": {"status": "failed", "error": str(exc), "lockedUntil": None, "updatedAt": _now_utc(), "finishedAt": _now_utc()}},
             )
+            return AccountScopeService.get_job(job_id)
 
-        result = mongo.db.account_scope_state.bulk_write(ops, ordered=False)
-        inserted = (result.upserted_count or 0)
-        return {"inserted": int(inserted), "mode": mode_value, "scopeType": scope_type, "scopeId": scope_id, "year": int(year)}
+        fields: Dict[str, Any] = {"lockedUntil": None, "updatedAt": _now_utc()}
+        if processed >= len(ids):
+            fields.update({"status": "done", "finishedAt": _now_utc()})
+        mongo.db.accounting_jobs.update_one({"_id": job["_id"]}, {"$set": fields})
+        return AccountScopeService.get_job(job_id)
+
+    @staticmethod
+    def pending_init_job_ids() -> List[str]:
+        return [row["_id"] for row in mongo.db.accounting_jobs.find({"kind": "init_scopes", "status": {"$in": ["pending", "running"]}}, {"_id": 1})]
+
+    @staticmethod
+    def get_job(job_id: str) -> Optional[Dict[str, Any]]:
+        job = mongo.db.accounting_jobs.find_one({"_id": str(job_id)})
+        if job:
+            job["jobId"] = job.pop("_id")
+        return job
 
     @staticmethod
     def create_movement(
@@ -369,7 +1656,9 @@ class AccountScopeService:
         reference: Optional[Dict[str, Any]],
         created_by: str,
         allow_negative: bool,
+        logs: Optional[Iterable[Tuple[Any, str]]] = None,
     ) -> Dict[str, Any]:
+        """Registra un movimiento suelto; los ``logs`` ``(id_proyecto, mensaje)`` van en su transacción."""
         AccountingIndexes.ensure_indexes()
         if amount <= 0:
             raise ValueError("amount debe ser mayor que 0")
@@ -378,15 +1667,16 @@ class AccountScopeService:
         if movement_type not in {"debit", "credit"}:
             raise ValueError("type debe ser debit o credit")
 
-        account = mongo.db.master_accounts.find_one({"year": int(year), "code": account_code})
+        account = _catalog(year).get(account_code)
         if not account:
             raise ValueError("La cuenta contable no existe para el año indicado")
 
         # En alcance global se permite cargar saldo en cuentas titular para consolidado base.
-        if account.get("is_header") and scope_type != "global":
+        if account.is_header and scope_type != "global":
             raise ValueError("No se permiten movimientos sobre cuentas titular. Use cuentas detalle")
 
         delta = float(amount) if movement_type == "debit" else -float(amount)
+        now = _now_utc()
         movement_doc = {
             "year": int(year),
             "scopeType": scope_type,
@@ -398,7 +1688,7 @@ class AccountScopeService:
             "description": description or "",
             "reference": reference or {},
             "createdBy": created_by,
-            "createdAt": _now_utc(),
+            "createdAt": now,
         }
 
         state_filter = {
@@ -408,47 +1698,55 @@ class AccountScopeService:
             "accountCode": account_code,
         }
 
-        existing = mongo.db.account_scope_state.find_one(state_filter, {"balance": 1})
-        current_balance = float(existing.get("balance", 0)) if existing else 0.0
-        new_balance = current_balance + delta
-        if not allow_negative and new_balance < 0:
+        # La política de saldo negativo se evalúa dentro del propio update (balance >= amount),
+        # así dos movimientos concurrentes no pueden dejar la cuenta en negativo.
+        min_balance = float(amount) if (not allow_negative and delta < 0) else None
+        key = (scope_type, scope_id, account_code)
+        striped_write, total = _plan_striped_write(year, key, delta, now, allow_negative=allow_negative)
+        if total is not None and min_balance is not None and total < min_balance:
             raise ValueError("El movimiento deja saldo negativo y la política actual lo prohíbe")
-
-        now = _now_utc()
-
-        # Intento transaccional (si el clúster lo soporta). Si falla, fallback lógico.
-        client = mongo.cx
-        try:
-            with client.start_session() as session:
-                def _txn(sess):
-                    mongo.db.ledger_movements.insert_one(movement_doc, session=sess)
-                    mongo.db.account_scope_state.update_one(
-                        state_filter,
-                        {
-                            "$setOnInsert": {"createdAt": now},
-                            "$inc": {"balance": delta, "movementsCount": 1},
-                            "$set": {"lastMovementAt": now, "updatedAt": now},
-                        },
-                        upsert=True,
-                        session=sess,
-                    )
-
-                session.with_transaction(_txn)
-        except Exception:
-            mongo.db.ledger_movements.insert_one(movement_doc)
-            mongo.db.account_scope_state.update_one(
-                state_filter,
-                {
-                    "$setOnInsert": {"createdAt": now},
-                    "$inc": {"balance": delta, "movementsCount": 1},
-                    "$set": {"lastMovementAt": now, "updatedAt": now},
-                },
-                upsert=True,
+        rollup_ops = _header_rollup_ops(year, {key: delta}, now)
+        log_docs = documentos_log(logs or [], fecha=now)
+        outcome: Dict[str, Any] = {}
+
+        def _txn(sess):
+            if striped_write is not None:
+                applied = _apply_balance_writes([striped_write], now, session=sess)
+                state = {**state_filter, "balance": round(total + delta, 2)}
+            else:
+                state = _inc_scope_state(state_filter, delta=delta, now=now, min_balance=min_balance, session=sess)
+                if state is None:
+                    raise ValueError("El movimiento deja saldo negativo y la política actual lo prohíbe")
+                applied = [] if sess is not None else [(mongo.db.account_scope_state, state_filter, {"$inc": {"balance": delta, "movementsCount": 1}})]
+            try:
+                _stamp_ledger_docs(year, [movement_doc], now, session=sess, applied=applied)
+                mongo.db.ledger_movements.insert_one(movement_doc, session=sess)
+            except Exception:
+                _undo_balance_writes(applied, now)
+                raise
+            if rollup_ops:
+                mongo.db.account_scope_state.bulk_write(rollup_ops, ordered=False, session=sess)
+            project_changes: Dict[str, Dict[str, Any]] = {}
+            after = float(state.get("balance", 0) or 0)
+            _track_project_totals(
+                project_changes,
+                scope_type=scope_type,
+                scope_id=scope_id,
+                before=after - delta,
+                after=after,
+                funding_debit=float(amount) if is_funding_debit(movement_type, reference) else 0.0,
+                at=now,
             )
+            _apply_project_totals(year, project_changes, session=sess)
+            if log_docs:
+                mongo.db.logs.insert_many(log_docs, session=sess)
+            outcome["state"] = state
+
+        _run_in_transaction(_txn)
+        _bump_ledger_versions(year, [(scope_type, scope_id)])
 
-        state = mongo.db.account_scope_state.find_one(state_filter, {"_id": 0}) or {}
         movement_doc.pop("_id", None)
-        return {"movement": movement_doc, "state": state}
+        return {"movement": movement_doc, "state": outcome.get("state") or {}}
 
     @staticmethod
     def transfer_between_accounts(
@@ -493,11 +1791,12 @@ class AccountScopeService:
         ):
             raise ValueError("La cuenta origen y destino deben ser distintas")
 
-        source = mongo.db.master_accounts.find_one({"year": int(year), "code": from_account_code})
-        target = mongo.db.master_accounts.find_one({"year": int(year), "code": to_account_code})
+        catalog = _catalog(year)
+        source = catalog.get(from_account_code)
+        target = catalog.get(to_account_code)
         if not source or not target:
             raise ValueError("La cuenta origen o destino no existe para el año indicado")
-        if source.get("is_header") or target.get("is_header"):
+        if source.is_header or target.is_header:
             raise ValueError("Las transferencias requieren cuentas detalle, no cuentas titular")
 
         source_filter = {
@@ -513,13 +1812,14 @@ class AccountScopeService:
             "accountCode": to_account_code,
         }
 
-        source_state = mongo.db.account_scope_state.find_one(source_filter, {"balance": 1}) or {"balance": 0}
-        source_balance = float(source_state.get("balance", 0))
-        if not allow_negative and (source_balance - float(amount)) < 0:
-            raise ValueError("Saldo insuficiente en la cuenta origen")
-
         transfer_id = str(uuid.uuid4())
         now = _now_utc()
+        source_key = (resolved_from_scope_type, resolved_from_scope_id, from_account_code)
+        target_key = (resolved_to_scope_type, resolved_to_scope_id, to_account_code)
+        source_write, source_total = _plan_striped_write(year, source_key, -float(amount), now, allow_negative=allow_negative)
+        if source_total is not None and not allow_negative and source_total < float(amount):
+            raise ValueError("Saldo insuficiente en la cuenta origen")
+        target_write, target_total = _plan_striped_write(year, target_key, float(amount), now, allow_negative=allow_negative)
         transfer_ref = {
             "kind": "transfer",
             "id": transfer_id,
@@ -558,56 +1858,79 @@ class AccountScopeService:
             "createdAt": now,
         }
 
-        client = mongo.cx
-        try:
-            with client.start_session() as session:
-                def _txn(sess):
-                    mongo.db.ledger_movements.insert_many([source_movement, target_movement], session=sess)
-                    mongo.db.account_scope_state.update_one(
-                        source_filter,
-                        {
-                            "$setOnInsert": {"createdAt": now},
-                            "$inc": {"balance": -float(amount), "movementsCount": 1},
-                            "$set": {"lastMovementAt": now, "updatedAt": now},
-                        },
-                        upsert=True,
-                        session=sess,
-                    )
-                    mongo.db.account_scope_state.update_one(
-                        target_filter,
-                        {
-                            "$setOnInsert": {"createdAt": now},
-                            "$inc": {"balance": float(amount), "movementsCount": 1},
-                            "$set": {"lastMovementAt": now, "updatedAt": now},
-                        },
-                        upsert=True,
-                        session=sess,
-                    )
-
-                session.with_transaction(_txn)
-        except Exception:
-            mongo.db.ledger_movements.insert_many([source_movement, target_movement])
-            mongo.db.account_scope_state.update_one(
-                source_filter,
-                {
-                    "$setOnInsert": {"createdAt": now},
-                    "$inc": {"balance": -float(amount), "movementsCount": 1},
-                    "$set": {"lastMovementAt": now, "updatedAt": now},
-                },
-                upsert=True,
+        rollup_deltas: Dict[Tuple[str, str, str], float] = {}
+        for key, leg_delta in (
+            ((resolved_from_scope_type, resolved_from_scope_id, from_account_code), -float(amount)),
+            ((resolved_to_scope_type, resolved_to_scope_id, to_account_code), float(amount)),
+        ):
+            rollup_deltas[key] = rollup_deltas.get(key, 0.0) + leg_delta
+        rollup_ops = _header_rollup_ops(year, rollup_deltas, now)
+        outcome: Dict[str, Any] = {}
+
+        def _txn(sess):
+            if source_write is not None:
+                applied = _apply_balance_writes([source_write], now, session=sess)
+                source_new = {**source_filter, "balance": round(source_total - float(amount), 2)}
+            else:
+                source_new = _inc_scope_state(
+                    source_filter,
+                    delta=-float(amount),
+                    now=now,
+                    min_balance=None if allow_negative else float(amount),
+                    session=sess,
+                )
+                if source_new is None:
+                    raise ValueError("Saldo insuficiente en la cuenta origen")
+                # Sin transacción, un fallo posterior revierte los ``$inc`` ya aplicados.
+                applied = [] if sess is not None else [(mongo.db.account_scope_state, source_filter, {"$inc": {"balance": -float(amount), "movementsCount": 1}})]
+            try:
+                if target_write is not None:
+                    applied.extend(_apply_balance_writes([target_write], now, session=sess))
+                    target_new = {**target_filter, "balance": round(target_total + float(amount), 2)}
+                else:
+                    target_new = _inc_scope_state(target_filter, delta=float(amount), now=now, session=sess)
+                    if sess is None:
+                        applied.append((mongo.db.account_scope_state, target_filter, {"$inc": {"balance": float(amount), "movementsCount": 1}}))
+                _stamp_ledger_docs(year, [source_movement, target_movement], now, session=sess, applied=applied)
+                mongo.db.ledger_movements.insert_many([source_movement, target_movement], session=sess)
+            except Exception:
+                _undo_balance_writes(applied, now)
+                raise
+            if rollup_ops:
+                mongo.db.account_scope_state.bulk_write(rollup_ops, ordered=False, session=sess)
+            project_changes: Dict[str, Dict[str, Any]] = {}
+            source_after = float(source_new.get("balance", 0) or 0)
+            target_after = float(target_new.get("balance", 0) or 0)
+            _track_project_totals(
+                project_changes,
+                scope_type=resolved_from_scope_type,
+                scope_id=resolved_from_scope_id,
+                before=source_after + float(amount),
+                after=source_after,
+                funding_debit=0.0,
+                at=now,
             )
-            mongo.db.account_scope_state.update_one(
-                target_filter,
-                {
-                    "$setOnInsert": {"createdAt": now},
-                    "$inc": {"balance": float(amount), "movementsCount": 1},
-                    "$set": {"lastMovementAt": now, "updatedAt": now},
-                },
-                upsert=True,
+            _track_project_totals(
+                project_changes,
+                scope_type=resolved_to_scope_type,
+                scope_id=resolved_to_scope_id,
+                before=target_after - float(amount),
+                after=target_after,
+                funding_debit=float(amount),
+                at=now,
             )
+            _apply_project_totals(year, project_changes, session=sess)
+            outcome["source"] = source_new
+            outcome["target"] = target_new
+
+        _run_in_transaction(_txn)
+        _bump_ledger_versions(
+            year,
+            [(resolved_from_scope_type, resolved_from_scope_id), (resolved_to_scope_type, resolved_to_scope_id)],
+        )
 
-        source_new = mongo.db.account_scope_state.find_one(source_filter, {"_id": 0}) or {}
-        target_new = mongo.db.account_scope_state.find_one(target_filter, {"_id": 0}) or {}
+        source_new = outcome.get("source") or {}
+        target_new = outcome.get("target") or {}
         return {
             "transferId": transfer_id,
             "fromScopeType": resolved_from_scope_type,
@@ -622,6 +1945,367 @@ class AccountScopeService:
         }
 
 
+    @staticmethod
+    def create_movements_batch(
+        *,
+        year: int,
+        items: Iterable[Dict[str, Any]],
+        created_by: str,
+        allow_negative: bool,
+        logs: Optional[Iterable[Tuple[Any, str]]] = None,
+        project_fields: Optional[Dict[Any, Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        """Registra un lote de movimientos de forma atómica (todo o nada).
+
+        Valida todas las cuentas contra el catálogo en memoria, aplica la política de saldo
+        negativo en memoria por (scope, cuenta) y persiste con un ``insert_many`` y un
+        ``bulk_write`` de ``$inc`` dentro de una misma transacción. Sin replica set los ``$inc``
+        se aplican uno a uno y se revierten si una guardia de saldo falla (``_apply_balance_writes``).
+        """
+        AccountingIndexes.ensure_indexes()
+        started = time.perf_counter()
+        raw_items = list(items or [])
+        if not raw_items:
+            raise ValueError("movements es requerido")
+        if len(raw_items) > MAX_BATCH_MOVEMENTS:
+            raise ValueError(f"El lote admite como máximo {MAX_BATCH_MOVEMENTS} movimientos")
+
+        parsed: List[Optional[Dict[str, Any]]] = []
+        results: List[Dict[str, Any]] = []
+        for index, raw in enumerate(raw_items):
+            try:
+                parsed.append(_parse_movement_item(raw))
+                results.append({"index": index, "ok": True})
+            except ValueError as exc:
+                parsed.append(None)
+                results.append({"index": index, "ok": False, "message": str(exc)})
+
+        valid_items = [item for item in parsed if item]
+        catalog = _catalog(year)
+
+        stripes: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        balances = _read_state_balances(year, valid_items, stripes)
+        initial_balances = dict(balances)
+
+        for index, item in enumerate(parsed):
+            if item is None:
+                continue
+            account = catalog.get(item["accountCode"])
+            if not account:
+                results[index] = {"index": index, "ok": False, "message": "La cuenta contable no existe para el año indicado"}
+                continue
+            if account.is_header and item["scopeType"] != "global":
+                results[index] = {
+                    "index": index,
+                    "ok": False,
+                    "message": "No se permiten movimientos sobre cuentas titular. Use cuentas detalle",
+                }
+                continue
+
+            key = (item["scopeType"], item["scopeId"], item["accountCode"])
+            new_balance = balances.get(key, 0.0) + item["delta"]
+            if not allow_negative and new_balance < 0:
+                results[index] = {
+                    "index": index,
+                    "ok": False,
+                    "message": "El movimiento deja saldo negativo y la política actual lo prohíbe",
+                }
+                continue
+            balances[key] = new_balance
+            results[index].update(
+                {
+                    "scopeType": item["scopeType"],
+                    "scopeId": item["scopeId"],
+                    "accountCode": item["accountCode"],
+                    "type": item["type"],
+                    "amount": item["amount"],
+                    "balanceAfter": round(new_balance, 2),
+                }
+            )
+
+        validate_ms = _elapsed_ms(started)
+        failed = sum(1 for row in results if not row["ok"])
+        if failed:
+            return {
+                "applied": False,
+                "batchId": None,
+                "total": len(results),
+                "failed": failed,
+                "results": results,
+                "timings": {"validateMs": validate_ms, "persistMs": 0.0, "totalMs": _elapsed_ms(started)},
+            }
+
+        batch_id = str(uuid.uuid4())
+        persist_started = time.perf_counter()
+        _persist_movements(
+            year,
+            valid_items,
+            initial_balances,
+            created_by=created_by,
+            allow_negative=allow_negative,
+            tag={"batchId": batch_id},
+            stripes=stripes,
+            logs=logs,
+            project_fields=project_fields,
+        )
+
+        return {
+            "applied": True,
+            "batchId": batch_id,
+            "total": len(results),
+            "failed": 0,
+            "results": results,
+            "timings": {
+                "validateMs": validate_ms,
+                "persistMs": _elapsed_ms(persist_started),
+                "totalMs": _elapsed_ms(started),
+            },
+        }
+
+
+    @staticmethod
+    def post_journal_entry(
+        *,
+        year: int,
+        legs: Iterable[Dict[str, Any]],
+        description: str = "",
+        reference: Optional[Dict[str, Any]] = None,
+        created_by: str,
+        allow_negative: bool,
+        balanced: bool = True,
+        logs: Optional[Iterable[Tuple[Any, str]]] = None,
+        project_fields: Optional[Dict[Any, Dict[str, Any]]] = None,
+    ) -> Dict[str, Any]:
+        """Registra un asiento de N patas (débitos y créditos en cualquier scope) de forma atómica.
+
+        Cada pata tiene la forma de un item de ``create_movements_batch``. Con ``balanced`` la suma
+        de débitos debe igualar la de créditos; ``balanced=False`` admite asientos de un solo lado
+        (consumos). Todas las patas comparten ``journalId`` y se aplican con una lectura de saldos,
+        un ``bulk_write`` ordenado de ``$inc`` y un ``insert_many`` en una transacción, junto con
+        los ``logs`` ``(id_proyecto, mensaje)`` y los ``$set`` de ``project_fields``. Sin
+        transacción, una pata que falla su guardia revierte las ya aplicadas (ver
+        ``_apply_balance_writes``).
+        """
+        AccountingIndexes.ensure_indexes()
+        raw_legs = list(legs or [])
+        if not raw_legs:
+            raise ValueError("legs es requerido")
+        if len(raw_legs) > MAX_BATCH_MOVEMENTS:
+            raise ValueError(f"El asiento admite como máximo {MAX_BATCH_MOVEMENTS} patas")
+
+        journal_id = str(uuid.uuid4())
+        catalog = _catalog(year)
+        items: List[Dict[str, Any]] = []
+        for index, raw in enumerate(raw_legs):
+            try:
+                item = _parse_movement_item(raw)
+            except ValueError as exc:
+                raise ValueError(f"Pata {index}: {exc}")
+            account = catalog.get(item["accountCode"])
+            if not account:
+                raise ValueError(f"La cuenta {item['accountCode']} no existe para el año indicado")
+            # Como en las transferencias, ninguna pata mueve cuentas titular (tampoco en global).
+            if account.is_header:
+                raise ValueError("No se permiten movimientos sobre cuentas titular. Use cuentas detalle")
+            item["description"] = item["description"] or description or ""
+            item["reference"] = {**(reference or {}), **item["reference"], "journalId": journal_id}
+            items.append(item)
+
+        debits = round(sum(item["amount"] for item in items if item["type"] == "debit"), 2)
+        credits = round(sum(item["amount"] for item in items if item["type"] == "credit"), 2)
+        if balanced and (len(items) < 2 or debits != credits):
+            raise ValueError("El asiento no cuadra: la suma de débitos debe igualar la de créditos")
+
+        stripes: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        balances = _read_state_balances(year, items, stripes)
+        initial_balances = dict(balances)
+        legs_out: List[Dict[str, Any]] = []
+        for item in items:
+            key = (item["scopeType"], item["scopeId"], item["accountCode"])
+            balances[key] = balances.get(key, 0.0) + item["delta"]
+            legs_out.append(
+                {
+                    "scopeType": item["scopeType"],
+                    "scopeId": item["scopeId"],
+                    "accountCode": item["accountCode"],
+                    "type": item["type"],
+                    "amount": item["amount"],
+                    "balanceAfter": round(balances[key], 2),
+                }
+            )
+        if not allow_negative:
+            for key, balance in balances.items():
+                # El saldo final por cuenta es lo que cuenta: una pata puede cubrir a otra del mismo asiento.
+                if balance < 0 and balance < initial_balances.get(key, 0.0):
+                    raise ValueError(f"Saldo insuficiente en la cuenta origen {key[2]}")
+
+        _persist_movements(
+            year,
+            items,
+            initial_balances,
+            created_by=created_by,
+            allow_negative=allow_negative,
+            tag={"journalId": journal_id},
+            stripes=stripes,
+            logs=logs,
+            project_fields=project_fields,
+        )
+        return {
+            "journalId": journal_id,
+            "debits": debits,
+            "credits": credits,
+            "legs": legs_out,
+        }
+
+    @staticmethod
+    def compact_stripes(year: int, scope_type: Optional[str] = None, scope_id: Optional[str] = None) -> Dict[str, Any]:
+        """Devuelve al documento principal de ``account_scope_state`` lo acumulado en stripes.
+
+        El total por cuenta no cambia (solo se mueve saldo entre documentos), así que no invalida
+        caches. Se ejecuta periódicamente con ``scripts.compact_scope_stripes``.
+        """
+        AccountingIndexes.ensure_indexes()
+        match: Dict[str, Any] = {}
+        if scope_type:
+            match["scopeType"] = scope_type
+        if scope_id:
+            match["scopeId"] = scope_id
+        now = _now_utc()
+        compacted = 0
+        moved = 0.0
+        for key, entry in stripe_states(year, match).items():
+            if not any(balance or count for balance, count in entry["stripes"].values()):
+                continue
+            moved += _compact_key(year, key, entry, now)
+            compacted += 1
+        return {"year": int(year), "scopeType": scope_type, "scopeId": scope_id, "compacted": compacted, "moved": round(moved, 2)}
+
+    @staticmethod
+    def stamp_project_timeline(year: int, project_id: str) -> Dict[str, Any]:
+        """Sella ``projectBalanceAfter``/``eventType`` en todo el ledger del proyecto y deja el contador al día.
+
+        Para movimientos anteriores al sellado en escritura; se ejecuta una vez por proyecto
+        (``scripts.stamp_project_timeline``). Corre en una transacción para no perder ``$inc``
+        concurrentes sobre el contador.
+        """
+        AccountingIndexes.ensure_indexes()
+        project_id = str(project_id)
+        now = _now_utc()
+        outcome: Dict[str, Any] = {}
+
+        def _txn(sess):
+            rows = mongo.db.ledger_movements.find(
+                {"year": int(year), "scopeType": "project", "scopeId": project_id, "source": {"$ne": LEGACY_ACTION_SOURCE}},
+                {"_id": 1, "type": 1, "amount": 1, "reference": 1},
+                session=sess,
+            ).sort([("createdAt", 1), ("_id", 1)])
+            running = 0.0
+            ops: List[UpdateOne] = []
+            stamped = 0
+            for row in rows:
+                running += _signed_amount(row)
+                ops.append(
+                    UpdateOne(
+                        {"_id": row["_id"]},
+                        {
+                            "$set": {
+                                "projectBalanceAfter": round(running, 2),
+                                "eventType": timeline_event_type(row.get("type"), row.get("reference")),
+                            }
+                        },
+                    )
+                )
+                if len(ops) >= MAX_BATCH_MOVEMENTS:
+                    mongo.db.ledger_movements.bulk_write(ops, ordered=False, session=sess)
+                    stamped += len(ops)
+                    ops = []
+            if ops:
+                mongo.db.ledger_movements.bulk_write(ops, ordered=False, session=sess)
+                stamped += len(ops)
+            mongo.db.project_ledger_balances.update_one(
+                {"_id": _project_balance_id(year, project_id)},
+                {
+                    "$set": {
+                        "year": int(year),
+                        "scopeId": project_id,
+                        "balance": round(running, 2),
+                        "stamped": True,
+                        "updatedAt": now,
+                    },
+                    "$setOnInsert": {"createdAt": now},
+                },
+                upsert=True,
+                session=sess,
+            )
+            outcome.update({"year": int(year), "projectId": project_id, "stamped": stamped, "balance": round(running, 2)})
+
+        _run_in_transaction(_txn)
+        return outcome
+
+
+class AccountRollupService:
+    @staticmethod
+    def rebuild(year: int, scope_type: Optional[str] = None, scope_id: Optional[str] = None) -> Dict[str, Any]:
+        """Recalcula ``rollupBalance`` de cuentas titular desde los saldos detalle.
+
+        Sirve para activar el modo rollup sobre datos existentes o corregir desvíos.
+        """
+        AccountingIndexes.ensure_indexes()
+        match: Dict[str, Any] = {"year": int(year)}
+        if scope_type:
+            match["scopeType"] = scope_type
+        if scope_id:
+            match["scopeId"] = scope_id
+
+        catalog = _catalog(year)
+        states = list(
+            mongo.db.account_scope_state.find(
+                match, {"_id": 0, "scopeType": 1, "scopeId": 1, "accountCode": 1, "balance": 1, "rollupBalance": 1}
+            )
+        )
+        stripes = stripe_states(year, {key: value for key, value in match.items() if key != "year"})
+        for row in states:
+            fold_stripe_state(row, stripes.get((row["scopeType"], row["scopeId"], row["accountCode"])))
+
+        expected: Dict[Tuple[str, str, str], float] = {}
+        for row in states:
+            balance = float(row.get("balance", 0) or 0)
+            if not balance:
+                continue
+            for ancestor in catalog.ancestors_of(row["accountCode"]):
+                if catalog.by_code[ancestor].is_header:
+                    key = (row["scopeType"], row["scopeId"], ancestor)
+                    expected[key] = expected.get(key, 0.0) + balance
+
+        now = _now_utc()
+        ops = []
+        touched_scopes = set()
+        existing_keys = set()
+        for row in states:
+            key = (row["scopeType"], row["scopeId"], row["accountCode"])
+            existing_keys.add(key)
+            target = round(expected.get(key, 0.0), 2)
+            if round(float(row.get("rollupBalance", 0) or 0), 2) == target:
+                continue
+            touched_scopes.add(key[:2])
+            ops.append(
+                UpdateOne(
+                    {"year": int(year), "scopeType": key[0], "scopeId": key[1], "accountCode": key[2]},
+                    {"$set": {"rollupBalance": target, "updatedAt": now}},
+                )
+            )
+        for key, total in expected.items():
+            if key in existing_keys or not round(total, 2):
+                continue
+            touched_scopes.add(key[:2])
+            ops.append(_rollup_state_op(key, year, round(total, 2), now))
+
+        if ops:
+            mongo.db.account_scope_state.bulk_write(ops, ordered=False)
+            _bump_ledger_versions(year, touched_scopes)
+        return {"year": int(year), "scopeType": scope_type, "scopeId": scope_id, "updated": len(ops)}
+
+
 class SeedService:
     def __init__(self, base_dir: Optional[Path] = None):
         root = Path(base_dir or Path(__file__).resolve().parents[2])
@@ -703,7 +2387,16 @@ class SeedService:
             key_fields=("year", "code"),
         )
 
-        return {"year": int(year), "dryRun": False, "force": bool(force), "counts": stats.as_dict()}
+        hierarchy = AccountHierarchyService.rebuild_year(int(year))
+        AccountCatalogCache.bump(db, int(year))
+
+        return {
+            "year": int(year),
+            "dryRun": False,
+            "force": bool(force),
+            "counts": stats.as_dict(),
+            "hierarchyUpdated": hierarchy["updated"],
+        }
 
     def sync_departments_from_units(self, year: int = DEFAULT_YEAR) -> Dict[str, Any]:
         units = list(mongo.db.master_units.find({"year": int(year)}, {"_id": 0}).sort("code", 1))
@@ -0,0 +1,221 @@
+"""Lectura paginada y archivo en frío de los logs de auditoría por proyecto.
+
+``logs`` se consulta por el índice ``(id_proyecto, fecha_creacion, _id)`` con paginación por
+keyset; los logs antiguos que solo tienen ``proyecto_id`` siguen entrando por un ``$or`` (con su
+propio índice parcial) hasta que ``normalize_legacy_field`` se haya corrido y verificado. Los logs de proyectos finalizados con más de N meses se mueven a ``logs_archive``
+en bloques comprimidos (BSON + zlib) por proyecto y rango de fechas; la paginación continúa
+en el archivo cuando se agotan los logs vigentes, de modo que el historial sigue consultable.
+"""
+
+from __future__ import annotations
+
+import base64
+import json
+import zlib
+from datetime import datetime, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import bson
+from bson import Binary, ObjectId
+
+from api.extensions import mongo
+
+
+LOG_ARCHIVE_MONTHS = 12
+LOG_ARCHIVE_BATCH = 1000
+LOG_ARCHIVE_CODEC = "bson+zlib"
+_DAYS_PER_MONTH = 30
+
+
+def _now_utc() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _as_utc(value: Any) -> datetime:
+    if not isinstance(value, datetime):
+        return datetime.min.replace(tzinfo=timezone.utc)
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _sort_key(row: Dict[str, Any]) -> Tuple[datetime, str]:
+    return _as_utc(row.get("fecha_creacion")), str(row.get("_id"))
+
+
+def _encode_cursor(row: Dict[str, Any]) -> str:
+    raw = json.dumps({"t": _as_utc(row.get("fecha_creacion")).isoformat(), "id": str(row["_id"])})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+
+def _decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(str(cursor).encode("ascii")).decode("utf-8"))
+        return datetime.fromisoformat(raw["t"]), ObjectId(raw["id"])
+    except Exception:
+        raise ValueError("cursor inválido")
+
+
+def _project_filter(project_id: ObjectId, extra: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    query: Dict[str, Any] = {"$or": [{"id_proyecto": project_id}, {"proyecto_id": project_id}]}
+    if extra:
+        query = {"$and": [query, extra]}
+    return query
+
+
+def _keyset_filter(after: Optional[Tuple[datetime, ObjectId]]) -> Dict[str, Any]:
+    if after is None:
+        return {}
+    occurred_at, row_id = after
+    return {"$or": [{"fecha_creacion": {"$lt": occurred_at}}, {"fecha_creacion": occurred_at, "_id": {"$lt": row_id}}]}
+
+
+def _before(row: Dict[str, Any], after: Optional[Tuple[datetime, ObjectId]]) -> bool:
+    if after is None:
+        return True
+    return _sort_key(row) < (_as_utc(after[0]), str(after[1]))
+
+
+def _compress(rows: List[Dict[str, Any]]) -> Binary:
+    return Binary(zlib.compress(bson.encode({"logs": rows}), 9))
+
+
+def _decompress(chunk: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return bson.decode(zlib.decompress(bytes(chunk["data"]))).get("logs", [])
+
+
+class AuditLogService:
+    _indexes_ready = False
+
+    @classmethod
+    def ensure_indexes(cls) -> None:
+        if cls._indexes_ready:
+            return
+        mongo.db.logs.create_index([("id_proyecto", 1), ("fecha_creacion", -1), ("_id", -1)])
+        mongo.db.logs.create_index(
+            [("proyecto_id", 1), ("fecha_creacion", -1), ("_id", -1)],
+            partialFilterExpression={"proyecto_id": {"$exists": True}},
+        )
+        mongo.db.logs_archive.create_index([("id_proyecto", 1), ("hasta", -1)])
+        cls._indexes_ready = True
+
+    @staticmethod
+    def _archived_rows(
+        project_id: ObjectId,
+        after: Optional[Tuple[datetime, ObjectId]],
+        needed: int,
+    ) -> List[Dict[str, Any]]:
+        query: Dict[str, Any] = {"id_proyecto": project_id}
+        if after is not None:
+            query["desde"] = {"$lte": after[0]}
+        rows: List[Dict[str, Any]] = []
+        # Los bloques de un proyecto no se solapan: se leen del más reciente hacia atrás.
+        for chunk in mongo.db.logs_archive.find(query).sort([("hasta", -1), ("_id", -1)]):
+            rows.extend(row for row in _decompress(chunk) if _before(row, after))
+            if len(rows) >= needed:
+                break
+        return rows
+
+    @staticmethod
+    def page(project_id: ObjectId, *, limit: int = 10, cursor: Optional[str] = None) -> Dict[str, Any]:
+        """Página de logs del más reciente al más antiguo, primero ``logs`` y luego el archivo."""
+        AuditLogService.ensure_indexes()
+        after = _decode_cursor(cursor) if cursor else None
+        query = _project_filter(project_id, _keyset_filter(after))
+        rows = list(mongo.db.logs.find(query).sort([("fecha_creacion", -1), ("_id", -1)]).limit(limit + 1))
+        if len(rows) <= limit:
+            rows.extend(AuditLogService._archived_rows(project_id, after, limit + 1 - len(rows)))
+            rows.sort(key=_sort_key, reverse=True)
+
+        has_more = len(rows) > limit
+        rows = rows[:limit]
+        return {
+            "rows": rows,
+            "nextCursor": _encode_cursor(rows[-1]) if has_more and rows else None,
+            "hasMore": has_more,
+        }
+
+    @staticmethod
+    def count(project_id: ObjectId) -> int:
+        AuditLogService.ensure_indexes()
+        archived = sum(int(chunk.get("count", 0) or 0) for chunk in mongo.db.logs_archive.find({"id_proyecto": project_id}, {"count": 1}))
+        return mongo.db.logs.count_documents(_project_filter(project_id)) + archived
+
+    @staticmethod
+    def project_logs(project_id: ObjectId) -> List[Dict[str, Any]]:
+        """Todos los logs del proyecto en orden cronológico (acta de finalización)."""
+        AuditLogService.ensure_indexes()
+        rows = list(mongo.db.logs.find(_project_filter(project_id)).sort([("fecha_creacion", 1), ("_id", 1)]))
+        archived = [row for chunk in mongo.db.logs_archive.find({"id_proyecto": project_id}) for row in _decompress(chunk)]
+        if not archived:
+            return rows
+        return sorted(archived + rows, key=_sort_key)
+
+    @staticmethod
+    def normalize_legacy_field() -> int:
+        """Copia ``proyecto_id`` a ``id_proyecto`` en logs antiguos para que usen el índice."""
+        result = mongo.db.logs.update_many(
+            {"proyecto_id": {"$exists": True}, "id_proyecto": {"$exists": False}},
+            [{"$set": {"id_proyecto": "$proyecto_id"}}],
+        )
+        return int(result.modified_count or 0)
+
+    @staticmethod
+    def _archive_project(project_id: ObjectId, cutoff: datetime, batch_size: int) -> Dict[str, int]:
+        moved = 0
+        chunks = 0
+        while True:
+            rows = list(
+                mongo.db.logs.find(_project_filter(project_id, {"fecha_creacion": {"$lt": cutoff}}))
+                .sort([("fecha_creacion", 1), ("_id", 1)])
+                .limit(batch_size)
+            )
+            if not rows:
+                break
+            # _id determinista: si el proceso se corta entre el upsert y el borrado, re-ejecutar
+            # reescribe el mismo bloque en lugar de duplicarlo.
+            chunk_id = f"{project_id}:{rows[0]['_id']}"
+            mongo.db.logs_archive.replace_one(
+                {"_id": chunk_id},
+                {
+                    "_id": chunk_id,
+                    "id_proyecto": project_id,
+                    "desde": rows[0].get("fecha_creacion"),
+                    "hasta": rows[-1].get("fecha_creacion"),
+                    "count": len(rows),
+                    "codec": LOG_ARCHIVE_CODEC,
+                    "data": _compress(rows),
+                    "archivedAt": _now_utc(),
+                },
+                upsert=True,
+            )
+            mongo.db.logs.delete_many({"_id": {"$in": [row["_id"] for row in rows]}})
+            moved += len(rows)
+            chunks += 1
+            if len(rows) < batch_size:
+                break
+        return {"moved": moved, "chunks": chunks}
+
+    @staticmethod
+    def archive_finished_projects(
+        *,
+        months: int = LOG_ARCHIVE_MONTHS,
+        batch_size: int = LOG_ARCHIVE_BATCH,
+        project_ids: Optional[Iterable[ObjectId]] = None,
+        now: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """Mueve a ``logs_archive`` los logs de proyectos finalizados anteriores a ``months`` meses."""
+        AuditLogService.ensure_indexes()
+        cutoff = (now or _now_utc()) - timedelta(days=_DAYS_PER_MONTH * int(months))
+        query: Dict[str, Any] = {"status.finished": True}
+        if project_ids is not None:
+            query["_id"] = {"$in": list(project_ids)}
+
+        projects = 0
+        moved = 0
+        chunks = 0
+        for project in mongo.db.proyectos.find(query, {"_id": 1}):
+            result = AuditLogService._archive_project(project["_id"], cutoff, batch_size)
+            if result["moved"]:
+                projects += 1
+                moved += result["moved"]
+                chunks += result["chunks"]
+        return {"cutoff": cutoff, "projects": projects, "moved": moved, "chunks": chunks}
@@ -1,22 +1,38 @@
 from __future__ import annotations
 
+import base64
+import json
+from concurrent.futures import ThreadPoolExecutor
+import uuid
 from copy import deepcopy
 from datetime import datetime, timezone
-from typing import Any, Dict, Iterable, List, Optional, Tuple
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
 
 from bson import ObjectId
+from flask import current_app, has_app_context
+from pymongo import UpdateOne
 
 from api.extensions import mongo
+from api.services.account_catalog_cache import AccountCatalogCache
 from api.services.accounting_service import (
     AccountingIndexes,
     AccountScopeService,
+    DEFAULT_CURRENCY,
     DEFAULT_YEAR,
+    LEGACY_ACTION_SOURCE,
+    MAX_BATCH_MOVEMENTS,
+    PROJECT_TOTALS_FIELD,
+    is_funding_debit,
+    timeline_event_type,
 )
-from api.util.common import agregar_log
+from api.services.report_engine import MovementColumns, summarize_movements
+from api.services.unit_of_work import apply_set, load_project
 from api.util.utils import actualizar_pasos
 
 
 PROJECT_FUNDING_VERSION = 2
+FUNDING_BACKFILL_BATCH = 500
+LEGACY_MIGRATION_BATCH = 500
 
 
 def _now_utc() -> datetime:
@@ -50,6 +66,31 @@ def _clean_str(value: Any) -> str:
     return str(value or "").strip()
 
 
+def _legacy_event_type(action_type: str) -> str:
+    if action_type.lower() == "fondeo":
+        return "funding"
+    if action_type.lower().startswith("retiro"):
+        return "expense"
+    return "adjustment"
+
+
+def _legacy_project_query(project_object_id: Any) -> Dict[str, Any]:
+    project_id = str(project_object_id)
+    return {
+        "$or": [
+            {"project_id": project_object_id},
+            {"project_id": project_id},
+            {"proyecto_id": project_object_id},
+            {"proyecto_id": project_id},
+        ]
+    }
+
+
+def _legacy_migrated(project: Dict[str, Any]) -> bool:
+    """``True`` cuando las ``acciones`` del proyecto ya viven en ``ledger_movements``."""
+    return (project.get("legacyLedger") or {}).get("status") == "done"
+
+
 def _build_default_model() -> Dict[str, Any]:
     return {
         "version": PROJECT_FUNDING_VERSION,
@@ -67,7 +108,16 @@ def _build_default_model() -> Dict[str, Any]:
 class ProjectFundingService:
     @staticmethod
     def ensure_model(project: Dict[str, Any], persist: bool = False) -> Dict[str, Any]:
-        model = deepcopy(project.get("fundingModel") or {})
+        current = project.get("fundingModel")
+        if isinstance(current, dict) and all(key in current for key in _build_default_model()):
+            if current.get("status") != "legacy" or (
+                current.get("legacyCurrentBalanceSnapshot") is not None
+                and current.get("legacyInitialBalanceSnapshot") is not None
+            ):
+                # Modelo completo: no hay nada que normalizar ni persistir.
+                return current
+
+        model = deepcopy(current or {})
         changed = False
         project_id = project.get("_id")
 
@@ -107,117 +157,216 @@ class ProjectFundingService:
         return model
 
     @staticmethod
-    def get_project_detail_states(project_id: str, year: int = DEFAULT_YEAR) -> List[Dict[str, Any]]:
-        AccountingIndexes.ensure_indexes()
-        states = list(
-            mongo.db.account_scope_state.find(
-                {"year": int(year), "scopeType": "project", "scopeId": str(project_id)},
-                {"_id": 0, "accountCode": 1, "balance": 1, "movementsCount": 1, "lastMovementAt": 1},
-            )
-        )
+    def _leaf_state_rows(states: Iterable[Dict[str, Any]], year: int = DEFAULT_YEAR) -> List[Dict[str, Any]]:
+        states = list(states)
         if not states:
             return []
 
-        codes = [state["accountCode"] for state in states]
-        accounts = list(
-            mongo.db.master_accounts.find(
-                {"year": int(year), "code": {"$in": codes}},
-                {"_id": 0, "code": 1, "description": 1, "group": 1, "is_header": 1, "level": 1, "parent_code": 1},
-            )
-        )
-        account_by_code = {item["code"]: item for item in accounts}
-
+        catalog = AccountCatalogCache.get(mongo.db, int(year))
         rows = []
         for state in states:
-            account = account_by_code.get(state["accountCode"])
-            if not account or account.get("is_header"):
+            account = catalog.get(state["accountCode"])
+            if not account or account.is_header:
                 continue
-            rows.append({**account, **state})
+            rows.append(
+                {
+                    "code": account.code,
+                    "description": account.description,
+                    "group": account.group,
+                    "is_header": account.is_header,
+                    "level": account.level,
+                    "parent_code": account.parent_code,
+                    **state,
+                }
+            )
         return rows
 
     @staticmethod
-    def _historical_initial_assigned(project: Dict[str, Any], year: int = DEFAULT_YEAR) -> float:
-        project_object_id = project.get("_id")
-        project_id = str(project_object_id) if project_object_id else ""
-        if not project_id:
-            return 0.0
+    def get_project_detail_states(project_id: str, year: int = DEFAULT_YEAR) -> List[Dict[str, Any]]:
+        AccountingIndexes.ensure_indexes()
+        states = mongo.db.account_scope_state.find(
+            {"year": int(year), "scopeType": "project", "scopeId": str(project_id)},
+            {"_id": 0, "accountCode": 1, "balance": 1, "movementsCount": 1, "lastMovementAt": 1},
+        )
+        return ProjectFundingService._leaf_state_rows(states, year=year)
 
+    @staticmethod
+    def _summarize_states(rows: List[Dict[str, Any]]) -> Dict[str, Any]:
+        dates = [item.get("lastMovementAt") for item in rows if item.get("lastMovementAt")]
+        return {
+            "hasRows": bool(rows),
+            "currentAvailable": round(sum(float(item.get("balance", 0) or 0) for item in rows), 2),
+            "fundedAccountsCount": sum(1 for item in rows if float(item.get("balance", 0) or 0) > 0),
+            "lastMovementAt": max(dates, key=_sort_datetime) if dates else None,
+        }
+
+    @staticmethod
+    def _ledger_funding_total(project_id: str, year: int = DEFAULT_YEAR) -> float:
         ledger_total = 0.0
-        ledger_rows = list(
-            mongo.db.ledger_movements.find(
-                {
-                    "year": int(year),
-                    "scopeType": "project",
-                    "scopeId": project_id,
-                    "type": "debit",
-                },
-                {"amount": 1, "reference": 1},
-            )
+        ledger_rows = mongo.db.ledger_movements.find(
+            {
+                "year": int(year),
+                "scopeType": "project",
+                "scopeId": project_id,
+                "type": "debit",
+            },
+            {"amount": 1, "type": 1, "reference": 1},
         )
         for row in ledger_rows:
-            reference = row.get("reference") or {}
-            funding_type = _clean_str(reference.get("fundingType")).lower()
-            kind = _clean_str(reference.get("kind")).lower()
-            if funding_type in {"funding", "migration"} or kind == "transfer":
+            if is_funding_debit("debit", row.get("reference")):
                 ledger_total += float(row.get("amount", 0) or 0)
+        return round(ledger_total, 2)
 
-        if ledger_total > 0:
-            return round(ledger_total, 2)
-
+    @staticmethod
+    def _legacy_funding_total(project_object_id: Any, migrated: bool = False) -> float:
         legacy_total = 0.0
-        legacy_actions = list(
-            mongo.db.acciones.find(
-                {
-                    "$or": [
-                        {"project_id": project_object_id},
-                        {"project_id": project_id},
-                        {"proyecto_id": project_object_id},
-                        {"proyecto_id": project_id},
-                    ]
-                },
+        if migrated:
+            rows = mongo.db.ledger_movements.find(
+                {"scopeType": "project", "scopeId": str(project_object_id), "source": LEGACY_ACTION_SOURCE, "eventType": "funding"},
                 {"amount": 1, "type": 1},
             )
-        )
+            for row in rows:
+                amount = float(row.get("amount", 0) or 0)
+                legacy_total += -amount if row.get("type") == "credit" else amount
+            return round(legacy_total, 2)
+
+        legacy_actions = mongo.db.acciones.find(_legacy_project_query(project_object_id), {"amount": 1, "type": 1})
         for row in legacy_actions:
             action_type = _clean_str(row.get("type")).lower()
             if action_type == "fondeo":
                 legacy_total += _cents_to_units(row.get("amount", 0))
-
         return round(legacy_total, 2)
 
+    @staticmethod
+    def _historical_initial_assigned(project: Dict[str, Any], year: int = DEFAULT_YEAR) -> float:
+        project_object_id = project.get("_id")
+        project_id = str(project_object_id) if project_object_id else ""
+        if not project_id:
+            return 0.0
+
+        ledger_total = ProjectFundingService._ledger_funding_total(project_id, year=year)
+        if ledger_total > 0:
+            return ledger_total
+        return ProjectFundingService._legacy_funding_total(project_object_id, migrated=_legacy_migrated(project))
+
+    @staticmethod
+    def _year_totals(states_summary: Dict[str, Any], funding_debits: float, now: datetime) -> Dict[str, Any]:
+        return {
+            "currentAvailable": states_summary["currentAvailable"],
+            "fundedAccountsCount": states_summary["fundedAccountsCount"],
+            "fundingDebits": round(float(funding_debits or 0), 2),
+            "lastMovementAt": states_summary["lastMovementAt"],
+            "rebuiltAt": now,
+            "updatedAt": now,
+        }
+
+    @staticmethod
+    def _set_materialized(project: Dict[str, Any], year: int, year_totals: Dict[str, Any], legacy_funding: float) -> Dict[str, Any]:
+        totals = dict(project.get(PROJECT_TOTALS_FIELD) or {})
+        totals[str(int(year))] = year_totals
+        totals["legacyFunding"] = legacy_funding
+        project[PROJECT_TOTALS_FIELD] = totals
+        return {
+            f"{PROJECT_TOTALS_FIELD}.{int(year)}": year_totals,
+            f"{PROJECT_TOTALS_FIELD}.legacyFunding": legacy_funding,
+        }
+
+    @staticmethod
+    def rebuild_funding_totals(project: Dict[str, Any], year: int = DEFAULT_YEAR, persist: bool = True) -> Dict[str, Any]:
+        """Recalcula ``fundingTotals`` del proyecto desde estados, ledger y acciones legacy.
+
+        A partir de aquí cada escritura del ledger sobre el proyecto lo mantiene con ``$inc``.
+        Con ``persist=False`` solo calcula (lecturas de proyectos aún sin backfill).
+        """
+        project_object_id = project.get("_id")
+        project_id = str(project_object_id)
+        rows = ProjectFundingService.get_project_detail_states(project_id, year=year)
+        year_totals = ProjectFundingService._year_totals(
+            ProjectFundingService._summarize_states(rows),
+            ProjectFundingService._ledger_funding_total(project_id, year=year),
+            _now_utc(),
+        )
+        legacy_funding = ProjectFundingService._legacy_funding_total(project_object_id, migrated=_legacy_migrated(project))
+        fields = ProjectFundingService._set_materialized(project, year, year_totals, legacy_funding)
+        if persist:
+            mongo.db.proyectos.update_one({"_id": project_object_id}, {"$set": fields})
+        return year_totals
+
+    @staticmethod
+    def _materialized_for(project: Dict[str, Any], year: int) -> Optional[Dict[str, Any]]:
+        if project["fundingModel"].get("status") in {"legacy", "pending_migration"} or not project.get("_id"):
+            return None
+        materialized = (project.get(PROJECT_TOTALS_FIELD) or {}).get(str(int(year)))
+        if not materialized or not materialized.get("rebuiltAt"):
+            return None
+        return materialized
+
     @staticmethod
     def _derived_totals(project: Dict[str, Any], year: int = DEFAULT_YEAR) -> Dict[str, Any]:
-        ProjectFundingService.ensure_model(project, persist=True)
-        project_id = str(project.get("_id"))
+        ProjectFundingService.ensure_model(project)
         model = project["fundingModel"]
-        rows = ProjectFundingService.get_project_detail_states(project_id, year=year)
 
-        if model.get("status") in {"legacy", "pending_migration"} and not rows:
-            current_available = _cents_to_units(model.get("legacyCurrentBalanceSnapshot"))
-            initial_assigned = _cents_to_units(
-                model.get("initialAssignedAmount") or model.get("legacyInitialBalanceSnapshot")
-            )
-            funded_accounts_count = 0
-            last_movement_at = None
-        else:
-            current_available = round(sum(float(item.get("balance", 0) or 0) for item in rows), 2)
-            initial_assigned = _cents_to_units(model.get("initialAssignedAmount"))
-            if initial_assigned <= 0:
-                initial_assigned = ProjectFundingService._historical_initial_assigned(project, year=year)
-                # Backward compatibility for rows without persisted initial amount or movement history.
-                if initial_assigned <= 0 and current_available > 0:
-                    initial_assigned = current_available
-            funded_accounts_count = sum(1 for item in rows if float(item.get("balance", 0) or 0) > 0)
-            last_movement_at = None
-            dates = [item.get("lastMovementAt") for item in rows if item.get("lastMovementAt")]
-            if dates:
-                last_movement_at = max(dates, key=_sort_datetime)
+        if model.get("status") not in {"legacy", "pending_migration"} and project.get("_id"):
+            materialized = ProjectFundingService._materialized_for(project, year)
+            if materialized is None:
+                materialized = ProjectFundingService.rebuild_funding_totals(project, year=year, persist=False)
+            return ProjectFundingService._totals_from_materialized(project, materialized)
 
+        rows = ProjectFundingService.get_project_detail_states(str(project.get("_id")), year=year)
+        return ProjectFundingService._live_totals(
+            project,
+            ProjectFundingService._summarize_states(rows),
+            lambda: ProjectFundingService._historical_initial_assigned(project, year=year),
+        )
+
+    @staticmethod
+    def _live_totals(
+        project: Dict[str, Any],
+        states_summary: Dict[str, Any],
+        historical_initial: Callable[[], float],
+    ) -> Dict[str, Any]:
+        model = project["fundingModel"]
+        if model.get("status") in {"legacy", "pending_migration"} and not states_summary["hasRows"]:
+            return {
+                "currentAvailable": _cents_to_units(model.get("legacyCurrentBalanceSnapshot")),
+                "initialAssigned": _cents_to_units(
+                    model.get("initialAssignedAmount") or model.get("legacyInitialBalanceSnapshot")
+                ),
+                "fundedAccountsCount": 0,
+                "lastMovementAt": None,
+            }
+
+        current_available = states_summary["currentAvailable"]
+        initial_assigned = _cents_to_units(model.get("initialAssignedAmount"))
+        if initial_assigned <= 0:
+            initial_assigned = historical_initial()
+            # Backward compatibility for rows without persisted initial amount or movement history.
+            if initial_assigned <= 0 and current_available > 0:
+                initial_assigned = current_available
         return {
             "currentAvailable": current_available,
             "initialAssigned": initial_assigned,
-            "fundedAccountsCount": funded_accounts_count,
-            "lastMovementAt": last_movement_at,
+            "fundedAccountsCount": states_summary["fundedAccountsCount"],
+            "lastMovementAt": states_summary["lastMovementAt"],
+        }
+
+    @staticmethod
+    def _totals_from_materialized(project: Dict[str, Any], materialized: Dict[str, Any]) -> Dict[str, Any]:
+        model = project["fundingModel"]
+        current_available = round(float(materialized.get("currentAvailable", 0) or 0), 2)
+        initial_assigned = _cents_to_units(model.get("initialAssignedAmount"))
+        if initial_assigned <= 0:
+            initial_assigned = round(float(materialized.get("fundingDebits", 0) or 0), 2)
+            if initial_assigned <= 0:
+                initial_assigned = round(float((project.get(PROJECT_TOTALS_FIELD) or {}).get("legacyFunding", 0) or 0), 2)
+            # Backward compatibility for rows without persisted initial amount or movement history.
+            if initial_assigned <= 0 and current_available > 0:
+                initial_assigned = current_available
+        return {
+            "currentAvailable": current_available,
+            "initialAssigned": initial_assigned,
+            "fundedAccountsCount": int(materialized.get("fundedAccountsCount", 0) or 0),
+            "lastMovementAt": materialized.get("lastMovementAt"),
         }
 
     @staticmethod
@@ -247,11 +396,8 @@ class ProjectFundingService:
         }
 
     @staticmethod
-    def build_summary(project: Dict[str, Any], year: int = DEFAULT_YEAR, user: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        ProjectFundingService.ensure_model(project, persist=True)
-        model = deepcopy(project["fundingModel"])
-        totals = ProjectFundingService._derived_totals(project, year=year)
-        permissions = ProjectFundingService.permissions_for_user(project, user)
+    def _summary_payload(project: Dict[str, Any], totals: Dict[str, Any], user: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+        model = project["fundingModel"]
         return {
             "projectId": str(project.get("_id")),
             "model": {
@@ -259,16 +405,18 @@ class ProjectFundingService:
                 "status": model.get("status", "active"),
                 "migrationRequired": model.get("status") in {"legacy", "pending_migration"},
             },
-            "permissions": permissions,
+            "permissions": ProjectFundingService.permissions_for_user(project, user),
             "totals": totals,
         }
 
     @staticmethod
-    def decorate_project(project: Dict[str, Any], year: int = DEFAULT_YEAR, user: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-        payload = deepcopy(project)
-        model = ProjectFundingService.ensure_model(payload, persist=True)
-        summary = ProjectFundingService.build_summary(payload, year=year, user=user)
-        payload["fundingModel"] = model
+    def build_summary(project: Dict[str, Any], year: int = DEFAULT_YEAR, user: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        ProjectFundingService.ensure_model(project)
+        totals = ProjectFundingService._derived_totals(project, year=year)
+        return ProjectFundingService._summary_payload(project, totals, user)
+
+    @staticmethod
+    def _decorated(payload: Dict[str, Any], summary: Dict[str, Any]) -> Dict[str, Any]:
         payload["fundingSummary"] = summary
         payload["balance"] = summary["totals"]["currentAvailable"]
         payload["balance_inicial"] = summary["totals"]["initialAssigned"]
@@ -277,26 +425,391 @@ class ProjectFundingService:
         return payload
 
     @staticmethod
-    def _complete_funding_step(project: Dict[str, Any]) -> None:
-        if 1 in (project.get("status") or {}).get("completado", []):
+    def decorate_project(project: Dict[str, Any], year: int = DEFAULT_YEAR, user: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        # Copia superficial: el documento puede venir del mapa de identidad del request.
+        payload = dict(project)
+        ProjectFundingService.ensure_model(payload)
+        summary = ProjectFundingService.build_summary(payload, year=year, user=user)
+        return ProjectFundingService._decorated(payload, summary)
+
+    @staticmethod
+    def _batch_state_summaries(project_ids: List[str], year: int) -> Dict[str, Dict[str, Any]]:
+        AccountingIndexes.ensure_indexes()
+        grouped = mongo.db.account_scope_state.aggregate(
+            [
+                {"$match": {"year": int(year), "scopeType": "project", "scopeId": {"$in": project_ids}}},
+                {
+                    "$group": {
+                        "_id": "$scopeId",
+                        "states": {
+                            "$push": {
+                                "accountCode": "$accountCode",
+                                "balance": "$balance",
+                                "lastMovementAt": "$lastMovementAt",
+                            }
+                        },
+                    }
+                },
+            ]
+        )
+        return {
+            row["_id"]: ProjectFundingService._summarize_states(
+                ProjectFundingService._leaf_state_rows(row.get("states") or [], year=year)
+            )
+            for row in grouped
+        }
+
+    @staticmethod
+    def _batch_ledger_funding(project_ids: List[str], year: int) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        ledger_rows = mongo.db.ledger_movements.find(
+            {"year": int(year), "scopeType": "project", "scopeId": {"$in": project_ids}, "type": "debit"},
+            {"scopeId": 1, "amount": 1, "reference": 1},
+        )
+        for row in ledger_rows:
+            if is_funding_debit("debit", row.get("reference")):
+                totals[row["scopeId"]] = totals.get(row["scopeId"], 0.0) + float(row.get("amount", 0) or 0)
+        return {key: round(value, 2) for key, value in totals.items()}
+
+    @staticmethod
+    def _batch_legacy_funding(projects: List[Dict[str, Any]]) -> Dict[str, float]:
+        totals: Dict[str, float] = {}
+        migrated_ids = [str(project["_id"]) for project in projects if _legacy_migrated(project)]
+        pending_ids = [project["_id"] for project in projects if not _legacy_migrated(project)]
+
+        if migrated_ids:
+            rows = mongo.db.ledger_movements.find(
+                {"scopeType": "project", "scopeId": {"$in": migrated_ids}, "source": LEGACY_ACTION_SOURCE, "eventType": "funding"},
+                {"scopeId": 1, "amount": 1, "type": 1},
+            )
+            for row in rows:
+                amount = float(row.get("amount", 0) or 0)
+                totals[row["scopeId"]] = totals.get(row["scopeId"], 0.0) + (-amount if row.get("type") == "credit" else amount)
+
+        if pending_ids:
+            keys = list(pending_ids) + [str(value) for value in pending_ids]
+            legacy_actions = mongo.db.acciones.find(
+                {"$or": [{"project_id": {"$in": keys}}, {"proyecto_id": {"$in": keys}}]},
+                {"project_id": 1, "proyecto_id": 1, "amount": 1, "type": 1},
+            )
+            for row in legacy_actions:
+                if _clean_str(row.get("type")).lower() != "fondeo":
+                    continue
+                key = str(row.get("project_id") or row.get("proyecto_id"))
+                totals[key] = totals.get(key, 0.0) + _cents_to_units(row.get("amount", 0))
+        return {key: round(value, 2) for key, value in totals.items()}
+
+    @staticmethod
+    def _batch_totals(payloads: List[Dict[str, Any]], year: int) -> Tuple[List[Dict[str, Any]], Dict[Any, Dict[str, Any]]]:
+        """Totales de una página de proyectos ya normalizados, sin escribir.
+
+        Los proyectos con ``fundingTotals`` materializado no consultan nada más. Para el
+        resto se hace una agregación de ``account_scope_state`` agrupada por ``scopeId``,
+        una lectura del ledger y una de ``acciones`` para toda la página. Devuelve también
+        los campos ``fundingTotals`` que faltaba materializar, por ``_id``.
+        """
+        missing = [
+            payload
+            for payload in payloads
+            if payload.get("_id") and ProjectFundingService._materialized_for(payload, year) is None
+        ]
+        states_by_project: Dict[str, Dict[str, Any]] = {}
+        debits_by_project: Dict[str, float] = {}
+        legacy_by_project: Dict[str, float] = {}
+        if missing:
+            project_ids = [str(payload["_id"]) for payload in missing]
+            states_by_project = ProjectFundingService._batch_state_summaries(project_ids, year)
+            debits_by_project = ProjectFundingService._batch_ledger_funding(project_ids, year)
+            legacy_by_project = ProjectFundingService._batch_legacy_funding(missing)
+
+        now = _now_utc()
+        empty_summary = ProjectFundingService._summarize_states([])
+        totals_list: List[Dict[str, Any]] = []
+        materialize: Dict[Any, Dict[str, Any]] = {}
+        for payload in payloads:
+            project_id = str(payload.get("_id"))
+            materialized = ProjectFundingService._materialized_for(payload, year) if payload.get("_id") else None
+            if materialized is not None:
+                totals_list.append(ProjectFundingService._totals_from_materialized(payload, materialized))
+                continue
+
+            states_summary = states_by_project.get(project_id, empty_summary)
+            debits = debits_by_project.get(project_id, 0.0)
+            legacy_funding = legacy_by_project.get(project_id, 0.0)
+            if payload["fundingModel"].get("status") in {"legacy", "pending_migration"} or not payload.get("_id"):
+                totals_list.append(
+                    ProjectFundingService._live_totals(
+                        payload, states_summary, lambda debits=debits, legacy=legacy_funding: debits if debits > 0 else legacy
+                    )
+                )
+                continue
+
+            year_totals = ProjectFundingService._year_totals(states_summary, debits, now)
+            materialize[payload["_id"]] = ProjectFundingService._set_materialized(payload, year, year_totals, legacy_funding)
+            totals_list.append(ProjectFundingService._totals_from_materialized(payload, year_totals))
+        return totals_list, materialize
+
+    @staticmethod
+    def decorate_projects(
+        projects: Iterable[Dict[str, Any]],
+        year: int = DEFAULT_YEAR,
+        user: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """Versión por lotes de ``decorate_project`` para listados paginados; no escribe en Mongo."""
+        payloads = [deepcopy(project) for project in projects]
+        for payload in payloads:
+            ProjectFundingService.ensure_model(payload)
+
+        totals_list, _ = ProjectFundingService._batch_totals(payloads, year)
+        return [
+            ProjectFundingService._decorated(payload, ProjectFundingService._summary_payload(payload, totals, user))
+            for payload, totals in zip(payloads, totals_list)
+        ]
+
+    @staticmethod
+    def backfill_funding_models(
+        year: int = DEFAULT_YEAR,
+        batch_size: int = FUNDING_BACKFILL_BATCH,
+        restart: bool = False,
+    ) -> Dict[str, Any]:
+        """Normaliza ``fundingModel`` y materializa ``fundingTotals.<year>`` en todos los proyectos.
+
+        Recorre ``proyectos`` por ``_id`` en lotes de ``batch_size`` con un ``bulk_write`` por
+        lote y guarda el último ``_id`` procesado en ``accounting_jobs``; si se interrumpe,
+        la siguiente ejecución continúa desde ahí. Con esto las lecturas normalizan en
+        memoria y no necesitan escribir.
+        """
+        job_id = f"funding_backfill:{int(year)}"
+        now = _now_utc()
+        job = mongo.db.accounting_jobs.find_one({"_id": job_id})
+        if restart or not job or job.get("status") == "done":
+            job = {
+                "_id": job_id,
+                "kind": "funding_backfill",
+                "status": "running",
+                "year": int(year),
+                "lastId": None,
+                "processed": 0,
+                "updated": 0,
+                "startedAt": now,
+                "updatedAt": now,
+            }
+            mongo.db.accounting_jobs.update_one({"_id": job_id}, {"$set": job}, upsert=True)
+        else:
+            mongo.db.accounting_jobs.update_one({"_id": job_id}, {"$set": {"status": "running", "updatedAt": now}})
+
+        last_id = job.get("lastId")
+        processed = int(job.get("processed", 0) or 0)
+        updated = int(job.get("updated", 0) or 0)
+        try:
+            while True:
+                query = {"_id": {"$gt": last_id}} if last_id is not None else {}
+                page = list(
+                    mongo.db.proyectos.find(
+                        query, {"fundingModel": 1, "fundingTotals": 1, "legacyLedger": 1, "balance": 1, "balance_inicial": 1}
+                    )
+                    .sort("_id", 1)
+                    .limit(int(batch_size))
+                )
+                if not page:
+                    break
+
+                pending: Dict[Any, Dict[str, Any]] = {}
+                for project in page:
+                    original = deepcopy(project.get("fundingModel"))
+                    model = ProjectFundingService.ensure_model(project)
+                    if model != original:
+                        pending.setdefault(project["_id"], {})["fundingModel"] = model
+                _, materialize = ProjectFundingService._batch_totals(page, year)
+                for project_id, fields in materialize.items():
+                    pending.setdefault(project_id, {}).update(fields)
+                if pending:
+                    mongo.db.proyectos.bulk_write(
+                        [UpdateOne({"_id": project_id}, {"$set": fields}) for project_id, fields in pending.items()],
+                        ordered=False,
+                    )
+
+                last_id = page[-1]["_id"]
+                processed += len(page)
+                updated += len(pending)
+                mongo.db.accounting_jobs.update_one(
+                    {"_id": job_id},
+                    {"$set": {"lastId": last_id, "processed": processed, "updated": updated, "updatedAt": _now_utc()}},
+                )
+        except Exception as exc:
+            mongo.db.accounting_jobs.update_one(
+                {"_id": job_id},
+                {"$set": {"status": "failed", "error": str(exc), "updatedAt": _now_utc()}},
+            )
+            raise
+
+        mongo.db.accounting_jobs.update_one(
+            {"_id": job_id},
+            {"$set": {"status": "done", "updatedAt": _now_utc(), "finishedAt": _now_utc()}},
+        )
+        return {"jobId": job_id, "year": int(year), "processed": processed, "updated": updated}
+
+    @staticmethod
+    def legacy_action_to_ledger(row: Dict[str, Any], project_id: str) -> Dict[str, Any]:
+        """Movimiento de ledger equivalente a una fila de ``acciones`` (``source=legacy_action``)."""
+        action_type = _clean_str(row.get("type"))
+        created_at = row.get("created_at") or row["_id"].generation_time
+        amount = _cents_to_units(row.get("amount", 0))
+        return {
+            "year": created_at.year,
+            "scopeType": "project",
+            "scopeId": str(project_id),
+            "accountCode": row.get("accountCode") or row.get("cuenta_contable"),
+            "type": "credit" if amount < 0 else "debit",
+            "amount": abs(amount),
+            "currency": DEFAULT_CURRENCY,
+            "description": action_type,
+            "reference": {"kind": LEGACY_ACTION_SOURCE, "legacyType": action_type, "actorName": row.get("user", "")},
+            "eventType": _legacy_event_type(action_type),
+            "projectBalanceAfter": _cents_to_units(row.get("total_amount", 0)),
+            "source": LEGACY_ACTION_SOURCE,
+            "legacyActionId": row["_id"],
+            "createdBy": row.get("user", ""),
+            "createdAt": created_at,
+        }
+
+    @staticmethod
+    def _legacy_ledger_ops(rows: List[Dict[str, Any]], project_id: str) -> List[UpdateOne]:
+        # Upsert por legacyActionId: re-ejecutar un lote (o el flujo legacy en paralelo) no duplica.
+        return [
+            UpdateOne(
+                {"legacyActionId": row["_id"]},
+                {"$setOnInsert": ProjectFundingService.legacy_action_to_ledger(row, project_id)},
+                upsert=True,
+            )
+            for row in rows
+        ]
+
+    @staticmethod
+    def record_legacy_action(row: Dict[str, Any], project: Dict[str, Any]) -> None:
+        """Replica en el ledger una acción legacy nueva de un proyecto ya migrado.
+
+        No toca ``fundingTotals.legacyFunding``: quien inserta la acción lo incrementa en su
+        propio update del proyecto (``asignar_balance``), así no hace falta otra escritura.
+        """
+        if not _legacy_migrated(project):
             return
-        new_status, _ = actualizar_pasos(project["status"], 1)
-        mongo.db.proyectos.update_one({"_id": project["_id"]}, {"$set": {"status": new_status}})
-        project["status"] = new_status
+        mongo.db.ledger_movements.bulk_write(
+            ProjectFundingService._legacy_ledger_ops([row], str(project["_id"])), ordered=False
+        )
 
     @staticmethod
-    def _apply_model_update_after_funding(
-        project: Dict[str, Any],
+    def migrate_project_legacy_actions(project_object_id: Any, batch_size: int = LEGACY_MIGRATION_BATCH) -> Dict[str, Any]:
+        """Copia las ``acciones`` de un proyecto al ledger en lotes por ``_id``.
+
+        El checkpoint (``lastActionId``, ``migrated``) vive en ``proyectos.legacyLedger``; al
+        terminar queda ``status=done`` y las lecturas dejan de consultar ``acciones``.
+        """
+        AccountingIndexes.ensure_indexes()
+        project = mongo.db.proyectos.find_one({"_id": project_object_id}, {"legacyLedger": 1}) or {}
+        state = project.get("legacyLedger") or {}
+        project_id = str(project_object_id)
+        if state.get("status") == "done":
+            return {"projectId": project_id, "status": "done", "migrated": int(state.get("migrated", 0) or 0), "skipped": True}
+
+        last_id = state.get("lastActionId")
+        migrated = int(state.get("migrated", 0) or 0)
+        base_query = _legacy_project_query(project_object_id)
+        mongo.db.proyectos.update_one(
+            {"_id": project_object_id},
+            {"$set": {"legacyLedger.status": "running", "legacyLedger.updatedAt": _now_utc()}},
+        )
+
+        def _next_page(after: Any) -> List[Dict[str, Any]]:
+            query = base_query if after is None else {"$and": [base_query, {"_id": {"$gt": after}}]}
+            return list(mongo.db.acciones.find(query).sort("_id", 1).limit(int(batch_size)))
+
+        def _persist(page: List[Dict[str, Any]], status: Optional[str] = None) -> None:
+            nonlocal last_id, migrated
+            if page:
+                mongo.db.ledger_movements.bulk_write(ProjectFundingService._legacy_ledger_ops(page, project_id), ordered=False)
+                last_id = page[-1]["_id"]
+                migrated += len(page)
+            fields: Dict[str, Any] = {
+                "legacyLedger.lastActionId": last_id,
+                "legacyLedger.migrated": migrated,
+                "legacyLedger.updatedAt": _now_utc(),
+            }
+            if status:
+                fields["legacyLedger.status"] = status
+                fields["legacyLedger.finishedAt"] = _now_utc()
+            mongo.db.proyectos.update_one({"_id": project_object_id}, {"$set": fields})
+
+        try:
+            while True:
+                page = _next_page(last_id)
+                if not page:
+                    break
+                _persist(page)
+            _persist([], status="done")
+            # Acciones insertadas mientras se marcaba ``done``; desde ahí ``record_legacy_action`` las replica.
+            while True:
+                page = _next_page(last_id)
+                if not page:
+                    break
+                _persist(page)
+        except Exception as exc:
+            mongo.db.proyectos.update_one(
+                {"_id": project_object_id},
+                {"$set": {"legacyLedger.status": "failed", "legacyLedger.error": str(exc), "legacyLedger.updatedAt": _now_utc()}},
+            )
+            raise
+        return {"projectId": project_id, "status": "done", "migrated": migrated, "skipped": False}
+
+    @staticmethod
+    def migrate_legacy_actions(
+        project_ids: Optional[List[Any]] = None,
+        workers: int = 4,
+        batch_size: int = LEGACY_MIGRATION_BATCH,
+    ) -> Dict[str, Any]:
+        """Migra las ``acciones`` de varios proyectos con ``workers`` hilos, un proyecto por tarea.
+
+        Cada proyecto lleva su propio checkpoint, así que una ejecución cortada se retoma
+        volviendo a llamar: los proyectos en ``done`` se saltan y el resto sigue desde su
+        ``lastActionId``.
+        """
+        if project_ids is None:
+            project_ids = [
+                row["_id"] for row in mongo.db.proyectos.find({"legacyLedger.status": {"$ne": "done"}}, {"_id": 1})
+            ]
+        app = current_app._get_current_object() if has_app_context() else None
+
+        def _work(project_object_id: Any) -> Dict[str, Any]:
+            try:
+                if app is None:
+                    return ProjectFundingService.migrate_project_legacy_actions(project_object_id, batch_size=batch_size)
+                with app.app_context():
+                    return ProjectFundingService.migrate_project_legacy_actions(project_object_id, batch_size=batch_size)
+            except Exception as exc:
+                return {"projectId": str(project_object_id), "status": "failed", "error": str(exc), "migrated": 0}
+
+        with ThreadPoolExecutor(max_workers=max(1, int(workers))) as pool:
+            results = list(pool.map(_work, project_ids))
+
+        return {
+            "projects": len(results),
+            "done": sum(1 for row in results if row["status"] == "done"),
+            "failed": sum(1 for row in results if row["status"] == "failed"),
+            "migrated": sum(int(row.get("migrated", 0) or 0) for row in results if not row.get("skipped")),
+            "results": results,
+        }
+
+    @staticmethod
+    def _funding_model_fields(
+        model: Dict[str, Any],
         *,
         funding_cents: int,
         mode: str,
         user: Dict[str, Any],
-        note: Optional[str] = None,
+        note: Optional[str],
+        now: datetime,
     ) -> Dict[str, Any]:
-        model = ProjectFundingService.ensure_model(project, persist=True)
-        now = _now_utc()
         update_fields: Dict[str, Any] = {}
-
         if mode == "migration":
             update_fields["fundingModel.status"] = "active"
             update_fields["fundingModel.migratedAt"] = now
@@ -311,13 +824,38 @@ class ProjectFundingService:
                 update_fields["fundingModel.configuredAt"] = now
             if int(model.get("initialAssignedAmount") or 0) <= 0:
                 update_fields["fundingModel.initialAssignedAmount"] = int(funding_cents)
+        return update_fields
 
-        if update_fields:
-            mongo.db.proyectos.update_one({"_id": project["_id"]}, {"$set": update_fields})
-            project = mongo.db.proyectos.find_one({"_id": project["_id"]}) or project
+    @staticmethod
+    def _funding_update(
+        project: Dict[str, Any],
+        model: Dict[str, Any],
+        *,
+        funding_cents: int,
+        mode: str,
+        user: Dict[str, Any],
+        note: Optional[str] = None,
+        model_changed: bool = False,
+        now: Optional[datetime] = None,
+    ) -> Dict[str, Any]:
+        """``$set`` del proyecto tras fondearlo: modelo completo y paso 1 completado.
 
-        ProjectFundingService._complete_funding_step(project)
-        return project
+        Se escribe dentro de la transacción del asiento (``project_fields``), no después.
+        """
+        fields = ProjectFundingService._funding_model_fields(
+            model, funding_cents=funding_cents, mode=mode, user=user, note=note, now=now or _now_utc()
+        )
+        update: Dict[str, Any] = {}
+        if fields or model_changed:
+            # Se guarda el modelo completo: cubre también proyectos que aún no pasaron por el backfill.
+            merged = dict(model)
+            for key, value in fields.items():
+                merged[key.split(".", 1)[1]] = value
+            update["fundingModel"] = merged
+        if project.get("status") and 1 not in (project.get("status") or {}).get("completado", []):
+            # actualizar_pasos extiende ``completado`` en sitio: se trabaja sobre una copia.
+            update["status"], _ = actualizar_pasos(deepcopy(project["status"]), 1)
+        return update
 
     @staticmethod
     def _project_balance_for_account(project_id: str, account_code: str, year: int = DEFAULT_YEAR) -> float:
@@ -360,30 +898,8 @@ class ProjectFundingService:
         raise ValueError("No autorizado para asignar fondos")
 
     @staticmethod
-    def allocate_funds(
-        project: Dict[str, Any],
-        *,
-        year: int,
-        source_scope_type: str,
-        source_scope_id: str,
-        allocations: Iterable[Dict[str, Any]],
-        user: Dict[str, Any],
-        allow_negative: bool,
-        migration: bool = False,
-        note: Optional[str] = None,
-    ) -> Dict[str, Any]:
-        project = mongo.db.proyectos.find_one({"_id": project["_id"]}) or project
-        model = ProjectFundingService.ensure_model(project, persist=True)
-        if migration:
-            if model.get("status") not in {"legacy", "pending_migration"}:
-                raise ValueError("La migración solo aplica a proyectos legacy")
-        elif model.get("status") in {"legacy", "pending_migration"}:
-            raise ValueError("Este proyecto requiere migración de saldo legacy antes de recibir nuevas asignaciones")
-
-        ProjectFundingService._validate_source_scope(project, user, source_scope_type, source_scope_id)
-
+    def _normalize_allocations(allocations: Optional[Iterable[Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], float]:
         normalized_allocations = []
-        grouped_source: Dict[str, float] = {}
         total_units = 0.0
         for item in allocations or []:
             from_account_code = _clean_str(item.get("fromAccountCode"))
@@ -400,84 +916,320 @@ class ProjectFundingService:
                     "description": description,
                 }
             )
-            grouped_source[from_account_code] = grouped_source.get(from_account_code, 0.0) + amount
             total_units += amount
 
         if not normalized_allocations:
             raise ValueError("allocations es requerido")
+        return normalized_allocations, total_units
+
+    @staticmethod
+    def _allocation_reference(
+        project: Dict[str, Any],
+        user: Dict[str, Any],
+        source_scope_type: str,
+        source_scope_id: str,
+        *,
+        migration: bool = False,
+    ) -> Dict[str, Any]:
+        return {
+            "kind": "transfer",
+            "fundingType": "migration" if migration else "funding",
+            "projectId": str(project["_id"]),
+            "projectName": project.get("nombre", ""),
+            "actorName": user.get("nombre", "Usuario"),
+            "title": "Migración de saldo legacy" if migration else "Asignación de fondos",
+            "sourceScopeType": source_scope_type,
+            "sourceScopeId": str(source_scope_id),
+            "toScopeType": "project",
+            "toScopeId": str(project["_id"]),
+        }
+
+    @staticmethod
+    def allocate_funds(
+        project: Dict[str, Any],
+        *,
+        year: int,
+        source_scope_type: str,
+        source_scope_id: str,
+        allocations: Iterable[Dict[str, Any]],
+        user: Dict[str, Any],
+        allow_negative: bool,
+        migration: bool = False,
+        note: Optional[str] = None,
+    ) -> Dict[str, Any]:
+        project = load_project(project["_id"]) or project
+        current_model = project.get("fundingModel")
+        model = ProjectFundingService.ensure_model(project)
+        if migration:
+            if model.get("status") not in {"legacy", "pending_migration"}:
+                raise ValueError("La migración solo aplica a proyectos legacy")
+        elif model.get("status") in {"legacy", "pending_migration"}:
+            raise ValueError("Este proyecto requiere migración de saldo legacy antes de recibir nuevas asignaciones")
+
+        ProjectFundingService._validate_source_scope(project, user, source_scope_type, source_scope_id)
 
+        normalized_allocations, total_units = ProjectFundingService._normalize_allocations(allocations)
         if migration:
             legacy_balance_units = _cents_to_units(model.get("legacyCurrentBalanceSnapshot"))
             if round(total_units, 2) != round(legacy_balance_units, 2):
                 raise ValueError("La suma asignada debe coincidir exactamente con el saldo legacy actual pendiente")
 
-        for account_code, total_amount in grouped_source.items():
-            state = mongo.db.account_scope_state.find_one(
-                {
-                    "year": int(year),
-                    "scopeType": source_scope_type,
-                    "scopeId": str(source_scope_id),
-                    "accountCode": account_code,
-                },
-                {"balance": 1},
-            )
-            balance = float((state or {}).get("balance", 0) or 0)
-            if not allow_negative and (balance - total_amount) < 0:
-                raise ValueError(f"Saldo insuficiente en la cuenta origen {account_code}")
-
-        operation_kind = "migration" if migration else "funding"
+        # Todas las partidas van en un único asiento: una transacción en lugar de una por transferencia.
+        source_scope_id = str(source_scope_id)
+        legs = []
         results = []
         for item in normalized_allocations:
+            transfer_id = str(uuid.uuid4())
             reference = {
-                "kind": "transfer",
-                "fundingType": operation_kind,
-                "projectId": str(project["_id"]),
-                "projectName": project.get("nombre", ""),
-                "actorName": user.get("nombre", "Usuario"),
-                "title": "Migración de saldo legacy" if migration else "Asignación de fondos",
-                "sourceScopeType": source_scope_type,
-                "sourceScopeId": str(source_scope_id),
-                "toScopeType": "project",
-                "toScopeId": str(project["_id"]),
+                "id": transfer_id,
+                "fromScopeType": source_scope_type,
+                "fromScopeId": source_scope_id,
+                **ProjectFundingService._allocation_reference(
+                    project, user, source_scope_type, source_scope_id, migration=migration
+                ),
             }
-            result = AccountScopeService.transfer_between_accounts(
-                year=int(year),
-                from_scope_type=source_scope_type,
-                from_scope_id=str(source_scope_id),
-                to_scope_type="project",
-                to_scope_id=str(project["_id"]),
-                from_account_code=item["fromAccountCode"],
-                to_account_code=item["toAccountCode"],
-                amount=float(item["amount"]),
-                description=item["description"] or reference["title"],
-                reference=reference,
-                created_by=str(user.get("sub")),
-                allow_negative=allow_negative,
+            description = item["description"] or reference["title"]
+            legs.append(
+                {
+                    "scopeType": source_scope_type,
+                    "scopeId": source_scope_id,
+                    "accountCode": item["fromAccountCode"],
+                    "type": "credit",
+                    "amount": item["amount"],
+                    "description": description,
+                    "reference": reference,
+                }
             )
-            results.append(result)
-
-            action = "migro saldo legacy" if migration else "asigno fondos"
-            agregar_log(
-                project["_id"],
-                f'{user.get("nombre", "Usuario")} {action} al proyecto en la partida {item["toAccountCode"]} '
-                f'desde {source_scope_type}:{source_scope_id} por un monto de Bs. {float(item["amount"]):.2f}',
+            legs.append(
+                {
+                    "scopeType": "project",
+                    "scopeId": str(project["_id"]),
+                    "accountCode": item["toAccountCode"],
+                    "type": "debit",
+                    "amount": item["amount"],
+                    "description": description,
+                    "reference": reference,
+                }
+            )
+            results.append(
+                {
+                    "transferId": transfer_id,
+                    "fromScopeType": source_scope_type,
+                    "fromScopeId": source_scope_id,
+                    "toScopeType": "project",
+                    "toScopeId": str(project["_id"]),
+                    "fromAccountCode": item["fromAccountCode"],
+                    "toAccountCode": item["toAccountCode"],
+                    "amount": float(item["amount"]),
+                }
             )
 
-        project = ProjectFundingService._apply_model_update_after_funding(
+        operation_kind = "migration" if migration else "funding"
+        action = "migro saldo legacy" if migration else "asigno fondos"
+        project_update = ProjectFundingService._funding_update(
             project,
+            model,
             funding_cents=_amount_to_cents(total_units),
-            mode="migration" if migration else "funding",
+            mode=operation_kind,
             user=user,
             note=note,
+            model_changed=model is not current_model,
+        )
+        journal = AccountScopeService.post_journal_entry(
+            year=int(year),
+            legs=legs,
+            created_by=str(user.get("sub")),
+            allow_negative=allow_negative,
+            logs=[
+                (
+                    project["_id"],
+                    f'{user.get("nombre", "Usuario")} {action} al proyecto en la partida {item["toAccountCode"]} '
+                    f'desde {source_scope_type}:{source_scope_id} por un monto de Bs. {float(item["amount"]):.2f}',
+                )
+                for item in normalized_allocations
+            ],
+            project_fields={project["_id"]: project_update},
         )
+        for result, source_leg, target_leg in zip(results, journal["legs"][::2], journal["legs"][1::2]):
+            result.update(
+                {
+                    "journalId": journal["journalId"],
+                    "sourceBalanceAfter": source_leg["balanceAfter"],
+                    "targetBalanceAfter": target_leg["balanceAfter"],
+                }
+            )
+
+        for path, value in project_update.items():
+            apply_set(project, path, value)
+        # El asiento actualizó fundingTotals en Mongo; se relee para no resumir una copia vieja.
+        project = load_project(project["_id"], refresh=True) or project
 
         return {
             "projectId": str(project["_id"]),
             "operation": operation_kind,
+            "journalId": journal["journalId"],
             "allocations": results,
             "fundingSummary": ProjectFundingService.build_summary(project, year=year, user=user),
         }
 
+    @staticmethod
+    def build_summaries(
+        projects: Iterable[Dict[str, Any]],
+        year: int = DEFAULT_YEAR,
+        user: Optional[Dict[str, Any]] = None,
+    ) -> List[Dict[str, Any]]:
+        """``build_summary`` para varios proyectos con las mismas consultas por lote que ``decorate_projects``."""
+        payloads = [deepcopy(project) for project in projects]
+        for payload in payloads:
+            ProjectFundingService.ensure_model(payload)
+        totals_list, _ = ProjectFundingService._batch_totals(payloads, year)
+        return [
+            ProjectFundingService._summary_payload(payload, totals, user)
+            for payload, totals in zip(payloads, totals_list)
+        ]
+
+    @staticmethod
+    def allocate_funds_bulk(
+        projects: List[Dict[str, Any]],
+        *,
+        year: int,
+        source_scope_type: str,
+        source_scope_id: str,
+        allocations_by_project: Dict[str, List[Dict[str, Any]]],
+        user: Dict[str, Any],
+        allow_negative: bool,
+    ) -> Dict[str, Any]:
+        """Asigna fondos a varios proyectos desde un mismo origen, todo o nada.
+
+        Cada asignación son dos patas (crédito en el origen, débito en el proyecto) de un
+        único ``create_movements_batch``: una lectura de saldos para validar, una transacción
+        con ``insert_many``/``bulk_write``. Logs, modelos y resúmenes también van por lote.
+        """
+        if not projects:
+            raise ValueError("projects es requerido")
+        source_scope_id = str(source_scope_id)
+        catalog = AccountCatalogCache.get(mongo.db, int(year))
+
+        items: List[Dict[str, Any]] = []
+        legs: List[Tuple[Dict[str, Any], Dict[str, Any]]] = []
+        plan: List[Dict[str, Any]] = []
+        for project in projects:
+            current_model = project.get("fundingModel")
+            model = ProjectFundingService.ensure_model(project)
+            name = project.get("nombre") or str(project["_id"])
+            if model.get("status") in {"legacy", "pending_migration"}:
+                raise ValueError(f"El proyecto {name} requiere migración de saldo legacy antes de recibir nuevas asignaciones")
+            ProjectFundingService._validate_source_scope(project, user, source_scope_type, source_scope_id)
+
+            normalized, total_units = ProjectFundingService._normalize_allocations(
+                allocations_by_project.get(str(project["_id"]))
+            )
+            transfer_ids = []
+            for allocation in normalized:
+                for code in (allocation["fromAccountCode"], allocation["toAccountCode"]):
+                    account = catalog.get(code)
+                    if not account:
+                        raise ValueError(f"La cuenta {code} no existe para el año indicado")
+                    if account.is_header:
+                        raise ValueError("Las transferencias requieren cuentas detalle, no cuentas titular")
+
+                transfer_id = str(uuid.uuid4())
+                transfer_ids.append(transfer_id)
+                reference = {
+                    "id": transfer_id,
+                    "fromScopeType": source_scope_type,
+                    "fromScopeId": source_scope_id,
+                    **ProjectFundingService._allocation_reference(project, user, source_scope_type, source_scope_id),
+                }
+                description = allocation["description"] or reference["title"]
+                items.append(
+                    {
+                        "scopeType": source_scope_type,
+                        "scopeId": source_scope_id,
+                        "accountCode": allocation["fromAccountCode"],
+                        "type": "credit",
+                        "amount": allocation["amount"],
+                        "description": description,
+                        "reference": reference,
+                    }
+                )
+                items.append(
+                    {
+                        "scopeType": "project",
+                        "scopeId": str(project["_id"]),
+                        "accountCode": allocation["toAccountCode"],
+                        "type": "debit",
+                        "amount": allocation["amount"],
+                        "description": description,
+                        "reference": reference,
+                    }
+                )
+                legs.extend([(project, allocation), (project, allocation)])
+            plan.append(
+                {
+                    "project": project,
+                    "update": ProjectFundingService._funding_update(
+                        project,
+                        model,
+                        funding_cents=_amount_to_cents(total_units),
+                        mode="funding",
+                        user=user,
+                        model_changed=model is not current_model,
+                    ),
+                    "allocations": normalized,
+                    "total": total_units,
+                    "transferIds": transfer_ids,
+                }
+            )
+
+        if len(items) > MAX_BATCH_MOVEMENTS:
+            raise ValueError(f"La asignación admite como máximo {MAX_BATCH_MOVEMENTS // 2} partidas por solicitud")
+
+        actor = user.get("nombre", "Usuario")
+        batch = AccountScopeService.create_movements_batch(
+            year=int(year),
+            items=items,
+            created_by=str(user.get("sub")),
+            allow_negative=allow_negative,
+            logs=[
+                (
+                    entry["project"]["_id"],
+                    f'{actor} asigno fondos al proyecto en la partida {allocation["toAccountCode"]} '
+                    f'desde {source_scope_type}:{source_scope_id} por un monto de Bs. {float(allocation["amount"]):.2f}',
+                )
+                for entry in plan
+                for allocation in entry["allocations"]
+            ],
+            project_fields={entry["project"]["_id"]: entry["update"] for entry in plan},
+        )
+        if not batch["applied"]:
+            failed = next(row for row in batch["results"] if not row["ok"])
+            project, allocation = legs[failed["index"]]
+            if failed["index"] % 2 == 0 and "negativo" in failed.get("message", ""):
+                raise ValueError(f"Saldo insuficiente en la cuenta origen {allocation['fromAccountCode']}")
+            raise ValueError(f"{failed['message']} (proyecto {project.get('nombre') or project['_id']})")
+
+        refreshed = {
+            row["_id"]: row for row in mongo.db.proyectos.find({"_id": {"$in": [entry["project"]["_id"] for entry in plan]}})
+        }
+        summaries = ProjectFundingService.build_summaries(
+            [refreshed.get(entry["project"]["_id"], entry["project"]) for entry in plan], year=year, user=user
+        )
+        return {
+            "operation": "funding",
+            "batchId": batch["batchId"],
+            "projects": [
+                {
+                    "projectId": str(entry["project"]["_id"]),
+                    "transferIds": entry["transferIds"],
+                    "amount": round(entry["total"], 2),
+                    "fundingSummary": summary,
+                }
+                for entry, summary in zip(plan, summaries)
+            ],
+            "timings": batch["timings"],
+        }
+
     @staticmethod
     def consume_project_account(
         project: Dict[str, Any],
@@ -511,119 +1263,252 @@ class ProjectFundingService:
             reference=reference or {},
             created_by=str(user.get("sub")),
             allow_negative=allow_negative,
+            logs=[(project["_id"], log_message)],
         )
+        return result
+
+    @staticmethod
+    def consume_project_accounts(
+        project: Dict[str, Any],
+        *,
+        year: int,
+        consumptions: Iterable[Dict[str, Any]],
+        user: Dict[str, Any],
+        allow_negative: bool,
+        project_fields: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Varios consumos del proyecto (``accountCode``, ``amount``, ``description``, ``reference``,
+        ``logMessage``) como un único asiento de un solo lado: todos se aplican o ninguno.
+
+        ``project_fields`` son ``$set`` del proyecto que se escriben en la transacción del asiento.
+        """
+        current_model = project.get("fundingModel")
+        model = ProjectFundingService.ensure_model(project)
+        if model.get("status") in {"legacy", "pending_migration"}:
+            raise ValueError("Este proyecto debe migrarse a partidas antes de registrar consumos por cuenta")
+
+        rows = list(consumptions or [])
+        legs = []
+        for row in rows:
+            if not row.get("accountCode"):
+                raise ValueError("accountCode es requerido")
+            if float(row.get("amount") or 0) <= 0:
+                raise ValueError("amount debe ser mayor que 0")
+            legs.append(
+                {
+                    "scopeType": "project",
+                    "scopeId": str(project["_id"]),
+                    "accountCode": str(row["accountCode"]),
+                    "type": "credit",
+                    "amount": float(row["amount"]),
+                    "description": row.get("description") or "",
+                    "reference": row.get("reference") or {},
+                }
+            )
 
-        agregar_log(project["_id"], log_message)
+        fields = dict(project_fields or {})
+        if model is not current_model:
+            fields["fundingModel"] = model
+        result = AccountScopeService.post_journal_entry(
+            year=int(year),
+            legs=legs,
+            created_by=str(user.get("sub")),
+            allow_negative=allow_negative,
+            balanced=False,
+            logs=[(project["_id"], row["logMessage"]) for row in rows if row.get("logMessage")],
+            project_fields={project["_id"]: fields},
+        )
+        for path, value in fields.items():
+            apply_set(project, path, value)
         return result
 
+    @staticmethod
+    def _ledger_timeline_item(row: Dict[str, Any], project_id: str, balance_after: Optional[float]) -> Dict[str, Any]:
+        delta = float(row.get("amount", 0) or 0)
+        if row.get("type") == "credit":
+            delta *= -1
+        reference = row.get("reference") or {}
+        event_type = row.get("eventType") or timeline_event_type(row.get("type"), reference)
+        title = reference.get("title") or {
+            "migration": "Migración de saldo legacy",
+            "rule": "Consumo por regla fija",
+            "expense": "Consumo por actividad",
+            "funding": "Asignación de fondos",
+            "adjustment": "Ajuste contable",
+        }.get(event_type, "Movimiento contable")
+
+        return {
+            "id": str(row.get("_id") or reference.get("id") or f"{project_id}-{row.get('createdAt')}"),
+            "occurredAt": row.get("createdAt"),
+            "type": event_type,
+            "source": "ledger",
+            "title": title,
+            "description": row.get("description", ""),
+            "amount": delta,
+            "projectBalanceAfter": balance_after,
+            "accountCode": row.get("accountCode"),
+            "accountDescription": reference.get("accountDescription", ""),
+            "fromScopeType": reference.get("fromScopeType") or reference.get("sourceScopeType"),
+            "fromScopeId": reference.get("fromScopeId") or reference.get("sourceScopeId"),
+            "toScopeType": reference.get("toScopeType") or ("project" if event_type in {"funding", "migration"} else None),
+            "toScopeId": reference.get("toScopeId") or (project_id if event_type in {"funding", "migration"} else None),
+            "actorName": reference.get("actorName") or row.get("createdBy", ""),
+            "reference": reference,
+        }
+
+    @staticmethod
+    def _legacy_timeline_item(row: Dict[str, Any], project_id: str) -> Dict[str, Any]:
+        action_type = _clean_str(row.get("type"))
+        event_type = _legacy_event_type(action_type)
+        return {
+            "id": str(row.get("_id") or f"legacy-{row.get('created_at')}"),
+            "occurredAt": row.get("created_at"),
+            "type": event_type,
+            "source": "legacy_action",
+            "title": action_type or "Movimiento legacy",
+            "description": action_type or "",
+            "amount": _cents_to_units(row.get("amount", 0)),
+            "projectBalanceAfter": _cents_to_units(row.get("total_amount", 0)),
+            "accountCode": row.get("accountCode") or row.get("cuenta_contable"),
+            "accountDescription": "",
+            "fromScopeType": None,
+            "fromScopeId": None,
+            "toScopeType": "project" if event_type == "funding" else None,
+            "toScopeId": project_id if event_type == "funding" else None,
+            "actorName": row.get("user", ""),
+            "reference": {},
+        }
+
+    @staticmethod
+    def _migrated_legacy_item(row: Dict[str, Any], project_id: str) -> Dict[str, Any]:
+        """Mismo item que ``_legacy_timeline_item`` a partir de la acción ya migrada al ledger."""
+        reference = row.get("reference") or {}
+        action_type = _clean_str(reference.get("legacyType"))
+        event_type = row.get("eventType") or _legacy_event_type(action_type)
+        amount = float(row.get("amount", 0) or 0)
+        return {
+            "id": str(row.get("legacyActionId") or row.get("_id")),
+            "occurredAt": row.get("createdAt"),
+            "type": event_type,
+            "source": "legacy_action",
+            "title": action_type or "Movimiento legacy",
+            "description": action_type or "",
+            "amount": -amount if row.get("type") == "credit" else amount,
+            "projectBalanceAfter": row.get("projectBalanceAfter"),
+            "accountCode": row.get("accountCode"),
+            "accountDescription": "",
+            "fromScopeType": None,
+            "fromScopeId": None,
+            "toScopeType": "project" if event_type == "funding" else None,
+            "toScopeId": project_id if event_type == "funding" else None,
+            "actorName": reference.get("actorName", ""),
+            "reference": {},
+        }
+
+    @staticmethod
+    def _timeline_item(row: Dict[str, Any], project_id: str) -> Dict[str, Any]:
+        if row.get("source") == LEGACY_ACTION_SOURCE:
+            return ProjectFundingService._migrated_legacy_item(row, project_id)
+        return ProjectFundingService._ledger_timeline_item(row, project_id, row.get("projectBalanceAfter"))
+
+    @staticmethod
+    def _legacy_visible_before(project: Dict[str, Any]) -> Tuple[bool, Optional[datetime]]:
+        """Si las acciones legacy se muestran en la línea de tiempo y hasta qué fecha (``migratedAt``)."""
+        model = project["fundingModel"]
+        migrated_at = model.get("migratedAt")
+        visible = model.get("status") in {"legacy", "pending_migration"} or bool(migrated_at)
+        return visible, migrated_at
+
+    @staticmethod
+    def _legacy_actions_query(project: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Filtro de ``acciones`` visibles en la línea de tiempo, o ``None`` si no aplica (o ya se migraron)."""
+        visible, migrated_at = ProjectFundingService._legacy_visible_before(project)
+        if not visible or _legacy_migrated(project):
+            return None
+        query: Dict[str, Any] = {"$or": [{"project_id": project["_id"]}, {"proyecto_id": project["_id"]}]}
+        if migrated_at:
+            query["created_at"] = {"$lt": migrated_at}
+        return query
+
+    @staticmethod
+    def _ledger_timeline_query(project: Dict[str, Any], year: int) -> Dict[str, Any]:
+        """Filtro del ledger para la línea de tiempo; incluye las acciones legacy migradas visibles.
+
+        Las acciones migradas no tienen año contable propio: se muestran en todos los años,
+        igual que cuando se leían de ``acciones``.
+        """
+        query: Dict[str, Any] = {"scopeType": "project", "scopeId": str(project["_id"])}
+        current = {"year": int(year), "source": {"$ne": LEGACY_ACTION_SOURCE}}
+        visible, migrated_at = ProjectFundingService._legacy_visible_before(project)
+        if not visible or not _legacy_migrated(project):
+            query.update(current)
+            return query
+        legacy_branch: Dict[str, Any] = {"source": LEGACY_ACTION_SOURCE}
+        if migrated_at:
+            legacy_branch["createdAt"] = {"$lt": migrated_at}
+        query["$or"] = [current, legacy_branch]
+        return query
+
     @staticmethod
     def build_timeline(project: Dict[str, Any], year: int = DEFAULT_YEAR) -> List[Dict[str, Any]]:
-        project = mongo.db.proyectos.find_one({"_id": project["_id"]}) or project
-        model = ProjectFundingService.ensure_model(project, persist=True)
+        project = load_project(project["_id"]) or project
+        ProjectFundingService.ensure_model(project)
         project_id = str(project["_id"])
-        project_object_id = project["_id"]
 
-        ledger_rows = list(
-            mongo.db.ledger_movements.find(
-                {"year": int(year), "scopeType": "project", "scopeId": project_id}
-            )
-        )
+        ledger_rows = list(mongo.db.ledger_movements.find(ProjectFundingService._ledger_timeline_query(project, year)))
         ledger_rows.sort(key=lambda item: _sort_datetime(item.get("createdAt")))
 
         balance = 0.0
         timeline: List[Dict[str, Any]] = []
         for row in ledger_rows:
-            delta = float(row.get("amount", 0) or 0)
-            if row.get("type") == "credit":
-                delta *= -1
-            balance = round(balance + delta, 2)
-            reference = row.get("reference") or {}
-            funding_type = reference.get("fundingType")
-            if funding_type == "migration":
-                event_type = "migration"
-            elif reference.get("kind") == "fixed_rule":
-                event_type = "rule"
-            elif reference.get("kind") == "project_expense":
-                event_type = "expense"
-            elif row.get("type") == "debit":
-                event_type = "funding"
-            else:
-                event_type = "adjustment"
-
-            title = reference.get("title") or {
-                "migration": "Migración de saldo legacy",
-                "rule": "Consumo por regla fija",
-                "expense": "Consumo por actividad",
-                "funding": "Asignación de fondos",
-                "adjustment": "Ajuste contable",
-            }.get(event_type, "Movimiento contable")
-
-            timeline.append(
-                {
-                    "id": str(row.get("_id") or reference.get("id") or f"{project_id}-{len(timeline)}"),
-                    "occurredAt": row.get("createdAt"),
-                    "type": event_type,
-                    "source": "ledger",
-                    "title": title,
-                    "description": row.get("description", ""),
-                    "amount": delta,
-                    "projectBalanceAfter": balance,
-                    "accountCode": row.get("accountCode"),
-                    "accountDescription": reference.get("accountDescription", ""),
-                    "fromScopeType": reference.get("fromScopeType") or reference.get("sourceScopeType"),
-                    "fromScopeId": reference.get("fromScopeId") or reference.get("sourceScopeId"),
-                    "toScopeType": reference.get("toScopeType") or ("project" if event_type in {"funding", "migration"} else None),
-                    "toScopeId": reference.get("toScopeId") or (project_id if event_type in {"funding", "migration"} else None),
-                    "actorName": reference.get("actorName") or row.get("createdBy", ""),
-                    "reference": reference,
-                }
-            )
-
-        include_legacy_actions = model.get("status") in {"legacy", "pending_migration"}
-        migrated_at = model.get("migratedAt")
-        actions = list(
-            mongo.db.acciones.find({"$or": [{"project_id": project_object_id}, {"proyecto_id": project_object_id}]})
-        )
-        if actions:
+            if row.get("source") == LEGACY_ACTION_SOURCE:
+                timeline.append(ProjectFundingService._migrated_legacy_item(row, project_id))
+                continue
+            item = ProjectFundingService._ledger_timeline_item(row, project_id, None)
+            balance = round(balance + item["amount"], 2)
+            item["projectBalanceAfter"] = balance
+            timeline.append(item)
+
+        legacy_query = ProjectFundingService._legacy_actions_query(project)
+        if legacy_query is not None:
+            actions = list(mongo.db.acciones.find(legacy_query))
             actions.sort(key=lambda item: _sort_datetime(item.get("created_at")))
-        if actions and (include_legacy_actions or migrated_at):
-            for row in actions:
-                created_at = row.get("created_at")
-                if migrated_at and created_at and created_at >= migrated_at:
-                    continue
-                amount = _cents_to_units(row.get("amount", 0))
-                total_amount = _cents_to_units(row.get("total_amount", 0))
-                action_type = _clean_str(row.get("type"))
-                if action_type.lower() == "fondeo":
-                    event_type = "funding"
-                elif action_type.lower().startswith("retiro"):
-                    event_type = "expense"
-                else:
-                    event_type = "adjustment"
-                timeline.append(
-                    {
-                        "id": str(row.get("_id") or f"legacy-{len(timeline)}"),
-                        "occurredAt": created_at,
-                        "type": event_type,
-                        "source": "legacy_action",
-                        "title": action_type or "Movimiento legacy",
-                        "description": action_type or "",
-                        "amount": amount,
-                        "projectBalanceAfter": total_amount,
-                        "accountCode": row.get("accountCode") or row.get("cuenta_contable"),
-                        "accountDescription": "",
-                        "fromScopeType": None,
-                        "fromScopeId": None,
-                        "toScopeType": "project" if event_type == "funding" else None,
-                        "toScopeId": project_id if event_type == "funding" else None,
-                        "actorName": row.get("user", ""),
-                        "reference": {},
-                    }
-                )
+            timeline.extend(ProjectFundingService._legacy_timeline_item(row, project_id) for row in actions)
 
         timeline.sort(key=lambda item: _sort_datetime(item.get("occurredAt")), reverse=True)
         return timeline
 
+    @staticmethod
+    def _encode_cursor(occurred_at: Any, row_id: Any) -> str:
+        raw = json.dumps({"t": _sort_datetime(occurred_at).isoformat(), "id": str(row_id)})
+        return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
+
+    @staticmethod
+    def _decode_cursor(cursor: str) -> Tuple[datetime, ObjectId]:
+        try:
+            raw = json.loads(base64.urlsafe_b64decode(str(cursor).encode("ascii")).decode("utf-8"))
+            return datetime.fromisoformat(raw["t"]), ObjectId(raw["id"])
+        except Exception:
+            raise ValueError("cursor inválido")
+
+    @staticmethod
+    def _keyset_filter(time_field: str, after: Optional[Tuple[datetime, ObjectId]]) -> Dict[str, Any]:
+        if after is None:
+            return {}
+        occurred_at, row_id = after
+        return {"$or": [{time_field: {"$lt": occurred_at}}, {time_field: occurred_at, "_id": {"$lt": row_id}}]}
+
+    @staticmethod
+    def timeline_is_stamped(project_id: str, year: int = DEFAULT_YEAR) -> bool:
+        counter = mongo.db.project_ledger_balances.find_one({"_id": f"{int(year)}:{project_id}"}, {"stamped": 1})
+        if counter is not None:
+            return bool(counter.get("stamped"))
+        # Sin contador: solo es paginable si el proyecto aún no tiene movimientos en el ledger.
+        return mongo.db.ledger_movements.find_one(
+            {"year": int(year), "scopeType": "project", "scopeId": str(project_id), "source": {"$ne": LEGACY_ACTION_SOURCE}},
+            {"_id": 1},
+        ) is None
+
     @staticmethod
     def timeline_response(
         project: Dict[str, Any],
@@ -631,47 +1516,102 @@ class ProjectFundingService:
         year: int = DEFAULT_YEAR,
         page: int = 0,
         limit: int = 20,
+        cursor: Optional[str] = None,
     ) -> Dict[str, Any]:
-        rows = ProjectFundingService.build_timeline(project, year=year)
+        """Página de la línea de tiempo, más reciente primero.
+
+        Con el ledger sellado (``projectBalanceAfter``/``eventType`` guardados al escribir)
+        la página sale de Mongo por keyset sobre ``(createdAt, _id)``: ``nextCursor`` se pasa
+        como ``cursor`` para la siguiente. Sin sellar se conserva el armado completo en memoria.
+        """
         if limit <= 0:
             limit = 20
         if page < 0:
             page = 0
-        start = page * limit
-        end = start + limit
-        return {"request_list": rows[start:end], "count": len(rows)}
+
+        project_id = str(project["_id"])
+        if not ProjectFundingService.timeline_is_stamped(project_id, year=year):
+            if cursor:
+                raise ValueError("La paginación por cursor requiere el ledger sellado del proyecto")
+            rows = ProjectFundingService.build_timeline(project, year=year)
+            start = page * limit
+            return {"request_list": rows[start:start + limit], "count": len(rows), "nextCursor": None, "hasMore": start + limit < len(rows)}
+
+        project = load_project(project["_id"]) or project
+        ProjectFundingService.ensure_model(project)
+        after = ProjectFundingService._decode_cursor(cursor) if cursor else None
+        skip = 0 if cursor else page * limit
+        fetch = skip + limit + 1
+
+        ledger_query = ProjectFundingService._ledger_timeline_query(project, year)
+        keyset = ProjectFundingService._keyset_filter("createdAt", after)
+        if keyset:
+            ledger_query = {"$and": [ledger_query, keyset]}
+        candidates = [
+            (row.get("createdAt"), row["_id"], ProjectFundingService._timeline_item(row, project_id))
+            for row in mongo.db.ledger_movements.find(ledger_query).sort([("createdAt", -1), ("_id", -1)]).limit(fetch)
+        ]
+        legacy_query = ProjectFundingService._legacy_actions_query(project)
+        if legacy_query is not None:
+            legacy_filter = ProjectFundingService._keyset_filter("created_at", after)
+            if legacy_filter:
+                legacy_query = {"$and": [legacy_query, legacy_filter]}
+            candidates.extend(
+                (row.get("created_at"), row["_id"], ProjectFundingService._legacy_timeline_item(row, project_id))
+                for row in mongo.db.acciones.find(legacy_query).sort([("created_at", -1), ("_id", -1)]).limit(fetch)
+            )
+
+        candidates.sort(key=lambda item: (_sort_datetime(item[0]), item[1]), reverse=True)
+        window = candidates[skip:skip + limit + 1]
+        has_more = len(window) > limit
+        window = window[:limit]
+        payload: Dict[str, Any] = {
+            "request_list": [item for _occurred, _row_id, item in window],
+            "nextCursor": ProjectFundingService._encode_cursor(window[-1][0], window[-1][1]) if has_more and window else None,
+            "hasMore": has_more,
+        }
+        if not cursor:
+            # Compatibilidad con la paginación por página; con cursor no se cuenta el historial.
+            count = mongo.db.ledger_movements.count_documents(ProjectFundingService._ledger_timeline_query(project, year))
+            if legacy_query is not None:
+                count += mongo.db.acciones.count_documents(ProjectFundingService._legacy_actions_query(project))
+            payload["count"] = count
+        return payload
+
+    @staticmethod
+    def _report_columns(project: Dict[str, Any], year: int) -> MovementColumns:
+        """Mismos movimientos que ``build_timeline`` pero solo fecha, monto, tipo y saldo, sin armar items."""
+        project = load_project(project["_id"]) or project
+        columns = MovementColumns()
+        rows = mongo.db.ledger_movements.find(
+            ProjectFundingService._ledger_timeline_query(project, year),
+            {"createdAt": 1, "type": 1, "amount": 1, "eventType": 1, "reference": 1, "source": 1, "projectBalanceAfter": 1},
+        )
+        for row in rows:
+            amount = float(row.get("amount", 0) or 0)
+            signed = -amount if row.get("type") == "credit" else amount
+            reference = row.get("reference") or {}
+            if row.get("source") == LEGACY_ACTION_SOURCE:
+                event_type = row.get("eventType") or _legacy_event_type(_clean_str(reference.get("legacyType")))
+                columns.add(row.get("createdAt"), signed, event_type, row.get("projectBalanceAfter") or 0.0)
+            else:
+                columns.add(row.get("createdAt"), signed, row.get("eventType") or timeline_event_type(row.get("type"), reference))
+
+        legacy_query = ProjectFundingService._legacy_actions_query(project)
+        if legacy_query is not None:
+            for row in mongo.db.acciones.find(legacy_query, {"created_at": 1, "type": 1, "amount": 1, "total_amount": 1}):
+                columns.add(
+                    row.get("created_at"),
+                    _cents_to_units(row.get("amount", 0)),
+                    _legacy_event_type(_clean_str(row.get("type"))),
+                    _cents_to_units(row.get("total_amount", 0)),
+                )
+        return columns
 
     @staticmethod
     def report_payload(project: Dict[str, Any], year: int = DEFAULT_YEAR) -> Dict[str, Any]:
         summary = ProjectFundingService.build_summary(project, year=year)
-        timeline_asc = ProjectFundingService.build_timeline(project, year=year)
-        timeline_asc.sort(key=lambda item: _sort_datetime(item.get("occurredAt")))
-
-        balance_history = []
-        egresos_por_tipo: Dict[str, float] = {}
-        ingresos = 0.0
-        egresos = 0.0
-        for item in timeline_asc:
-            occurred_at = item.get("occurredAt")
-            if occurred_at:
-                balance_history.append(
-                    {
-                        "fecha": occurred_at.strftime("%Y-%m-%d"),
-                        "saldo": item.get("projectBalanceAfter", 0),
-                    }
-                )
-            amount = float(item.get("amount", 0) or 0)
-            if amount > 0:
-                ingresos += amount
-            elif amount < 0:
-                egresos += abs(amount)
-                label = {
-                    "expense": "Actividades",
-                    "rule": "Reglas fijas",
-                    "migration": "Migración",
-                    "adjustment": "Ajustes",
-                }.get(item.get("type"), "Otros")
-                egresos_por_tipo[label] = round(egresos_por_tipo.get(label, 0) + abs(amount), 2)
+        report = summarize_movements(ProjectFundingService._report_columns(project, year))
 
         budgets = list(
             mongo.db.documentos.find({"$or": [{"project_id": project["_id"]}, {"proyecto_id": project["_id"]}]})
@@ -679,11 +1619,12 @@ class ProjectFundingService:
         finished_budgets = [item for item in budgets if item.get("status") == "finished"]
 
         return {
-            "balance_history": balance_history,
-            "egresos_tipo": [{"tipo": key, "monto": value} for key, value in egresos_por_tipo.items()],
+            "balance_history": report["balance_history"],
+            "balance_bucket": report["bucket"],
+            "egresos_tipo": report["egresos_tipo"],
             "resumen": {
-                "ingresos": round(ingresos, 2),
-                "egresos": round(egresos, 2),
+                "ingresos": report["ingresos"],
+                "egresos": report["egresos"],
                 "presupuestos": len(finished_budgets),
                 "represupuestos": len([item for item in budgets if item.get("status") != "finished"]),
                 "miembros": len(project.get("miembros") or []),
@@ -0,0 +1,182 @@
+"""Membresías de proyecto normalizadas en ``project_members``.
+
+``proyectos.miembros`` sigue existiendo (lo leen el detalle, reportes y permisos), pero
+"en qué proyectos está el usuario X" y la limpieza al borrar o renombrar un usuario se
+resuelven desde ``project_members`` sin recorrer todos los proyectos.
+"""
+
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Optional
+
+from bson import ObjectId
+from pymongo import UpdateOne
+
+from api.extensions import mongo
+
+
+MEMBERS_MIGRATION_BATCH = 500
+MEMBER_JOINED_FORMAT = "%d/%m/%Y %H:%M"
+
+
+def _now_utc() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _to_object_id(value: Any) -> Optional[ObjectId]:
+    if isinstance(value, dict):
+        value = value.get("$oid")
+    if isinstance(value, ObjectId):
+        return value
+    try:
+        return ObjectId(str(value))
+    except Exception:
+        return None
+
+
+def _joined_at(member: Dict[str, Any]) -> Optional[datetime]:
+    try:
+        return datetime.strptime(str(member.get("fecha_ingreso")), MEMBER_JOINED_FORMAT).replace(tzinfo=timezone.utc)
+    except (TypeError, ValueError):
+        return None
+
+
+class ProjectMembersService:
+    _indexes_ready = False
+
+    @classmethod
+    def ensure_indexes(cls) -> None:
+        if cls._indexes_ready:
+            return
+        mongo.db.project_members.create_index([("usuario_id", 1), ("project_id", 1)], unique=True)
+        mongo.db.project_members.create_index([("project_id", 1), ("role", 1)])
+        cls._indexes_ready = True
+
+    @staticmethod
+    def _member_fields(project: Dict[str, Any], member: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        usuario = member.get("usuario") if isinstance(member, dict) else None
+        if not isinstance(usuario, dict):
+            return None
+        user_object_id = _to_object_id(usuario.get("_id"))
+        if not user_object_id:
+            return None
+        role = member.get("role") if isinstance(member.get("role"), dict) else {"value": member.get("role")}
+        return {
+            "usuario_id": user_object_id,
+            "project_id": project["_id"],
+            "departamento_id": project.get("departamento_id"),
+            "role": role.get("value"),
+            "roleLabel": role.get("label"),
+            "nombre": usuario.get("nombre"),
+            "email": usuario.get("email"),
+            "fecha_ingreso": member.get("fecha_ingreso"),
+            "joinedAt": _joined_at(member),
+        }
+
+    @staticmethod
+    def _upsert_op(fields: Dict[str, Any]) -> UpdateOne:
+        return UpdateOne(
+            {"usuario_id": fields["usuario_id"], "project_id": fields["project_id"]},
+            {"$set": fields},
+            upsert=True,
+        )
+
+    @staticmethod
+    def add_member(project: Dict[str, Any], member: Dict[str, Any]) -> None:
+        """Registra el mismo miembro que se acaba de agregar a ``proyectos.miembros``."""
+        fields = ProjectMembersService._member_fields(project, member)
+        if fields is None:
+            return
+        ProjectMembersService.ensure_indexes()
+        fields["joinedAt"] = fields["joinedAt"] or _now_utc()
+        mongo.db.project_members.bulk_write([ProjectMembersService._upsert_op(fields)], ordered=False)
+
+    @staticmethod
+    def remove_member(project_id: ObjectId, user_id: Any) -> None:
+        user_object_id = _to_object_id(user_id)
+        if user_object_id:
+            mongo.db.project_members.delete_many({"project_id": project_id, "usuario_id": user_object_id})
+
+    @staticmethod
+    def remove_project(project_id: ObjectId) -> None:
+        mongo.db.project_members.delete_many({"project_id": project_id})
+
+    @staticmethod
+    def project_ids_for_user(user_id: Any) -> List[ObjectId]:
+        user_object_id = _to_object_id(user_id)
+        if not user_object_id:
+            return []
+        return [row["project_id"] for row in mongo.db.project_members.find({"usuario_id": user_object_id}, {"project_id": 1})]
+
+    @staticmethod
+    def memberships_for_user(user_id: Any, *, skip: int = 0, limit: int = 10) -> Dict[str, Any]:
+        user_object_id = _to_object_id(user_id)
+        if not user_object_id:
+            return {"rows": [], "count": 0}
+        query = {"usuario_id": user_object_id}
+        rows = list(
+            mongo.db.project_members.find(query, {"project_id": 1, "role": 1, "roleLabel": 1, "joinedAt": 1})
+            .sort([("joinedAt", -1), ("_id", -1)])
+            .skip(skip)
+            .limit(limit)
+        )
+        return {"rows": rows, "count": mongo.db.project_members.count_documents(query)}
+
+    @staticmethod
+    def remove_user(user_id: Any) -> int:
+        """Quita al usuario de sus proyectos (colección y copias embebidas); devuelve cuántos."""
+        project_ids = ProjectMembersService.project_ids_for_user(user_id)
+        if project_ids:
+            mongo.db.proyectos.update_many(
+                {"_id": {"$in": project_ids}},
+                {"$pull": {"miembros": {"usuario._id.$oid": str(user_id)}}},
+            )
+            mongo.db.project_members.delete_many({"usuario_id": _to_object_id(user_id)})
+        return len(project_ids)
+
+    @staticmethod
+    def rename_user(user_id: Any, fields: Dict[str, Any]) -> int:
+        """Propaga ``nombre``/``email`` a las membresías y a las copias en ``proyectos.miembros``."""
+        changes = {key: fields[key] for key in ("nombre", "email") if key in fields}
+        project_ids = ProjectMembersService.project_ids_for_user(user_id) if changes else []
+        if not project_ids:
+            return 0
+        mongo.db.project_members.update_many({"usuario_id": _to_object_id(user_id)}, {"$set": changes})
+        mongo.db.proyectos.update_many(
+            {"_id": {"$in": project_ids}},
+            {"$set": {f"miembros.$[m].usuario.{key}": value for key, value in changes.items()}},
+            array_filters=[{"m.usuario._id.$oid": str(user_id)}],
+        )
+        return len(project_ids)
+
+    @staticmethod
+    def migrate_embedded(
+        project_ids: Optional[Iterable[ObjectId]] = None,
+        batch_size: int = MEMBERS_MIGRATION_BATCH,
+    ) -> Dict[str, Any]:
+        """Copia ``proyectos.miembros`` a ``project_members``; idempotente (upsert por usuario y proyecto)."""
+        ProjectMembersService.ensure_indexes()
+        query: Dict[str, Any] = {"miembros.0": {"$exists": True}}
+        if project_ids is not None:
+            query["_id"] = {"$in": list(project_ids)}
+
+        projects = 0
+        members = 0
+        skipped = 0
+        ops: List[UpdateOne] = []
+        for project in mongo.db.proyectos.find(query, {"miembros": 1, "departamento_id": 1}).batch_size(batch_size):
+            projects += 1
+            for member in project.get("miembros") or []:
+                fields = ProjectMembersService._member_fields(project, member)
+                if fields is None:
+                    skipped += 1
+                    continue
+                ops.append(ProjectMembersService._upsert_op(fields))
+                members += 1
+            if len(ops) >= batch_size:
+                mongo.db.project_members.bulk_write(ops, ordered=False)
+                ops = []
+        if ops:
+            mongo.db.project_members.bulk_write(ops, ordered=False)
+        return {"projects": projects, "members": members, "skipped": skipped}
@@ -0,0 +1,130 @@
+"""Motor de cálculo de reportes de fondeo por proyecto.
+
+Carga los movimientos como columnas (fecha, monto con signo, tipo, saldo) y calcula
+saldo acumulado, ingresos/egresos, egresos por tipo y la serie de saldo agrupada por
+día, semana o mes según el rango de fechas.
+"""
+
+from __future__ import annotations
+
+from datetime import date, datetime, timedelta, timezone
+from itertools import accumulate
+from typing import Any, Dict, List, Optional
+
+
+EVENT_TYPES = ("funding", "migration", "rule", "expense", "adjustment")
+EXPENSE_LABELS = ("Actividades", "Reglas fijas", "Migración", "Ajustes", "Otros")
+OTHER_TYPE = len(EVENT_TYPES)
+# Índice de EXPENSE_LABELS para cada tipo (un egreso de tipo funding o desconocido cae en "Otros").
+_LABEL_FOR_TYPE = (4, 2, 1, 0, 3, 4)
+
+DAY_BUCKET_MAX_DAYS = 92
+WEEK_BUCKET_MAX_DAYS = 731
+_EPOCH = date(1970, 1, 1)
+_SECONDS_PER_DAY = 86400
+
+
+def _timestamp(value: Any) -> Optional[float]:
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+
+def bucket_for_span(days: int) -> str:
+    """``day`` hasta ~3 meses, ``week`` hasta ~2 años, ``month`` por encima."""
+    if days <= DAY_BUCKET_MAX_DAYS:
+        return "day"
+    if days <= WEEK_BUCKET_MAX_DAYS:
+        return "week"
+    return "month"
+
+
+def _day_label(day_number: int) -> str:
+    return (_EPOCH + timedelta(days=int(day_number))).isoformat()
+
+
+def _month_start(day_number: int) -> int:
+    day = _EPOCH + timedelta(days=int(day_number))
+    return (date(day.year, day.month, 1) - _EPOCH).days
+
+
+class MovementColumns:
+    """Movimientos de un proyecto en columnas paralelas.
+
+    ``balance`` es ``None`` para movimientos del ledger (el saldo se acumula) y el saldo
+    registrado para acciones legacy, que traen su propio ``total_amount``.
+    """
+
+    __slots__ = ("timestamps", "amounts", "types", "balances")
+
+    def __init__(self) -> None:
+        self.timestamps: List[Optional[float]] = []
+        self.amounts: List[float] = []
+        self.types: List[int] = []
+        self.balances: List[Optional[float]] = []
+
+    def __len__(self) -> int:
+        return len(self.amounts)
+
+    def add(self, occurred_at: Any, amount: float, event_type: str, balance: Optional[float] = None) -> None:
+        self.timestamps.append(_timestamp(occurred_at))
+        self.amounts.append(float(amount or 0))
+        self.types.append(EVENT_TYPES.index(event_type) if event_type in EVENT_TYPES else OTHER_TYPE)
+        self.balances.append(None if balance is None else float(balance))
+
+
+def _summarize(columns: MovementColumns) -> Dict[str, Any]:
+    order = sorted(range(len(columns)), key=lambda i: columns.timestamps[i] or 0.0)
+    amounts = [columns.amounts[i] for i in order]
+    running = list(accumulate(amount if columns.balances[i] is None else 0.0 for i, amount in zip(order, amounts)))
+
+    by_label = [0.0] * len(EXPENSE_LABELS)
+    for i, amount in zip(order, amounts):
+        if amount < 0:
+            by_label[_LABEL_FOR_TYPE[columns.types[i]]] -= amount
+
+    points = []
+    for position, i in enumerate(order):
+        if columns.timestamps[i] is None:
+            continue
+        balance = columns.balances[i]
+        points.append(
+            (
+                int(columns.timestamps[i] // _SECONDS_PER_DAY),
+                round(running[position], 2) if balance is None else balance,
+            )
+        )
+
+    history: List[Dict[str, Any]] = []
+    bucket = "day"
+    if points:
+        bucket = bucket_for_span(points[-1][0] - points[0][0])
+        grouped: Dict[int, float] = {}
+        for day, balance in points:
+            if bucket == "day":
+                key = day
+            elif bucket == "week":
+                key = day - (day + 3) % 7
+            else:
+                key = _month_start(day)
+            grouped[key] = balance
+        history = [{"fecha": _day_label(key), "saldo": balance} for key, balance in grouped.items()]
+
+    return {
+        "ingresos": round(sum(amount for amount in amounts if amount > 0), 2),
+        "egresos": round(-sum(amount for amount in amounts if amount < 0), 2),
+        "egresos_tipo": [
+            {"tipo": label, "monto": round(total, 2)} for label, total in zip(EXPENSE_LABELS, by_label) if total > 0
+        ],
+        "balance_history": history,
+        "bucket": bucket,
+    }
+
+
+def summarize_movements(columns: MovementColumns) -> Dict[str, Any]:
+    """Totales y serie de saldo del reporte a partir de las columnas de movimientos."""
+    if not len(columns):
+        return {"ingresos": 0.0, "egresos": 0.0, "egresos_tipo": [], "balance_history": [], "bucket": "day"}
+    return _summarize(columns)
@@ -0,0 +1,112 @@
+"""Mapa de identidad por request (``flask.g``).
+
+Dentro de un request, ``load_project`` devuelve siempre el mismo documento (una lectura por
+``_id``). Las escrituras no se difieren: los campos del proyecto que acompañan a un asiento se
+escriben en la transacción del ledger (``project_fields``) y ``apply_set`` refleja el cambio en
+el documento ya cargado. Fuera de un request (scripts, jobs) se lee directo contra Mongo.
+
+Con ``DEBUG`` activo se cuentan los comandos Mongo de cada request (``X-Mongo-Queries``).
+"""
+
+from __future__ import annotations
+
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+from flask import Flask, g, has_request_context
+from pymongo import monitoring
+
+from api.extensions import mongo
+
+
+def apply_set(doc: Dict[str, Any], path: str, value: Any) -> None:
+    """Aplica un ``$set`` con ruta punteada sobre un documento ya cargado."""
+    parts = path.split(".")
+    current = doc
+    for part in parts[:-1]:
+        nxt = current.get(part)
+        if not isinstance(nxt, dict):
+            nxt = {}
+            current[part] = nxt
+        current = nxt
+    current[parts[-1]] = value
+
+
+class UnitOfWork:
+    __slots__ = ("identity", "queries", "hits")
+
+    def __init__(self) -> None:
+        self.identity: Dict[Tuple[str, Any], Dict[str, Any]] = {}
+        self.queries: Dict[str, int] = {}
+        self.hits = 0
+
+    @staticmethod
+    def current() -> Optional["UnitOfWork"]:
+        if not has_request_context():
+            return None
+        uow = g.get("_unit_of_work")
+        if uow is None:
+            uow = UnitOfWork()
+            g._unit_of_work = uow
+        return uow
+
+    def get(self, collection: str, doc_id: Any, refresh: bool = False) -> Optional[Dict[str, Any]]:
+        key = (collection, doc_id)
+        if not refresh and key in self.identity:
+            self.hits += 1
+            return self.identity[key]
+        doc = getattr(mongo.db, collection).find_one({"_id": doc_id})
+        if doc is None:
+            self.identity.pop(key, None)
+            return None
+        self.identity[key] = doc
+        return doc
+
+
+def load_project(project_id: Any, refresh: bool = False) -> Optional[Dict[str, Any]]:
+    uow = UnitOfWork.current()
+    if uow is None:
+        return mongo.db.proyectos.find_one({"_id": project_id})
+    return uow.get("proyectos", project_id, refresh=refresh)
+
+
+class _QueryCounter(monitoring.CommandListener):
+    def started(self, event):
+        uow = UnitOfWork.current()
+        if uow is not None:
+            uow.queries[event.command_name] = uow.queries.get(event.command_name, 0) + 1
+
+    def succeeded(self, event):
+        pass
+
+    def failed(self, event):
+        pass
+
+
+_counter_lock = threading.Lock()
+_counter_registered = False
+
+
+def register_query_counter() -> None:
+    """Registra el contador de comandos; debe llamarse antes de crear el cliente Mongo."""
+    global _counter_registered
+    with _counter_lock:
+        if not _counter_registered:
+            monitoring.register(_QueryCounter())
+            _counter_registered = True
+
+
+def init_unit_of_work(app: Flask) -> None:
+    if not app.debug:
+        return
+    register_query_counter()
+
+    @app.after_request
+    def _report_mongo_queries(response):
+        uow = g.get("_unit_of_work")
+        if uow is None:
+            return response
+        total = sum(uow.queries.values())
+        response.headers["X-Mongo-Queries"] = str(total)
+        app.logger.debug("mongo queries=%s hits=%s detail=%s", total, uow.hits, uow.queries)
+        return response
@@ -1,6 +1,8 @@
 from datetime import datetime, timezone
 import json
 from bson import ObjectId
+from flask import g, has_request_context
+from pymongo.errors import BulkWriteError
 from api.extensions import mongo
 
 class JSONEncoder(json.JSONEncoder):
@@ -17,10 +19,76 @@ class CustomJSONEncoder(JSONEncoder):
             return o.isoformat()
         return JSONEncoder.default(self, o)
 
+# Entradas de log: por request se acumulan en ``g`` y se escriben con un ``insert_many`` al
+# cerrar el request (también si termina con excepción); fuera de un request (scripts, jobs) se
+# escriben en el acto. Dentro de una transacción se usa ``documentos_log`` con la sesión.
+
+LOG_WRITE_ATTEMPTS = 2
+DUPLICATE_KEY_CODE = 11000
+
+
+def documentos_log(entradas, fecha=None):
+    """Documentos de ``logs`` para entradas ``(id_proyecto, mensaje)``."""
+    fecha = fecha or datetime.now(timezone.utc)
+    return [
+        {"id_proyecto": ObjectId(id_proyecto), "fecha_creacion": fecha, "mensaje": mensaje}
+        for id_proyecto, mensaje in entradas
+    ]
+
+
+def _encolar_logs(docs):
+    if not docs:
+        return 0
+    if has_request_context():
+        g.setdefault("_log_buffer", []).extend(docs)
+    else:
+        # Sin request no hay un cierre garantizado (serverless congela o termina el proceso).
+        mongo.db.logs.insert_many(docs, ordered=False)
+    return len(docs)
+
+
 def agregar_log(id_proyecto, mensaje):
-    data = {}
-    data["id_proyecto"] = ObjectId(id_proyecto)
-    data["fecha_creacion"] = datetime.now(timezone.utc)
-    data["mensaje"] = mensaje
-    mongo.db.logs.insert_one(data)
+    _encolar_logs(documentos_log([(id_proyecto, mensaje)]))
     return "registro agregado"
+
+
+def _insertar_logs(docs):
+    try:
+        mongo.db.logs.insert_many(docs, ordered=False)
+    except BulkWriteError as exc:
+        # En un reintento los documentos ya escritos (mismo ``_id``) fallan por clave duplicada.
+        if any(error.get("code") != DUPLICATE_KEY_CODE for error in exc.details.get("writeErrors", [])):
+            raise
+
+
+def _escribir_logs_del_request(logger):
+    """Escribe el buffer del request sin lanzar: reintenta y, si no puede, lo deja en el log de la app.
+
+    La mutación del request ya está confirmada en Mongo; un 500 no la deshace. Las escrituras que
+    necesitan su log sí o sí lo insertan en su propia transacción (``documentos_log``).
+    """
+    docs = g.pop("_log_buffer", None)
+    if not docs:
+        return
+    for intento in range(1, LOG_WRITE_ATTEMPTS + 1):
+        try:
+            _insertar_logs(docs)
+            return
+        except Exception:
+            logger.exception("No se pudieron escribir %s logs de auditoria (intento %s)", len(docs), intento)
+    for doc in docs:
+        logger.error("log de auditoria no escrito: %s", json.dumps(doc, cls=CustomJSONEncoder))
+
+
+def init_log_buffer(app):
+    @app.after_request
+    def _flush_log_buffer(response):
+        # Antes de responder, para no depender de que el proceso siga vivo tras la respuesta.
+        _escribir_logs_del_request(app.logger)
+        return response
+
+    @app.teardown_request
+    def _flush_log_buffer_on_teardown(exc):
+        # Un request que termina con excepción no pasa por after_request, pero lo que ya escribió
+        # en Mongo necesita su log igual.
+        _escribir_logs_del_request(app.logger)
@@ -0,0 +1,39 @@
+import argparse
+import json
+
+from api import create_app
+from api.services.audit_log_service import LOG_ARCHIVE_BATCH, LOG_ARCHIVE_MONTHS, AuditLogService
+from api.util.access import parse_object_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Archiva en logs_archive los logs de proyectos finalizados")
+    parser.add_argument("--months", type=int, default=LOG_ARCHIVE_MONTHS, help="Antigüedad mínima en meses (30 días)")
+    parser.add_argument("--batch-size", type=int, default=LOG_ARCHIVE_BATCH, help="Logs por bloque comprimido")
+    parser.add_argument("--project", action="append", default=None, help="ID de proyecto (repetible); por defecto todos los finalizados")
+    parser.add_argument("--normalize", action="store_true", help="Copia proyecto_id a id_proyecto en logs antiguos antes de archivar")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        project_ids = None
+        if args.project:
+            project_ids = [parse_object_id(value) for value in args.project]
+            if not all(project_ids):
+                raise SystemExit("--project inválido")
+
+        result = {}
+        if args.normalize:
+            result["normalized"] = AuditLogService.normalize_legacy_field()
+        result.update(
+            AuditLogService.archive_finished_projects(
+                months=args.months,
+                batch_size=args.batch_size,
+                project_ids=project_ids,
+            )
+        )
+        print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import argparse
+import json
+
+from api import create_app
+from api.services.accounting_service import DEFAULT_YEAR
+from api.services.project_funding_service import FUNDING_BACKFILL_BATCH, ProjectFundingService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Normaliza fundingModel y materializa fundingTotals en todos los proyectos")
+    parser.add_argument("--year", type=int, default=DEFAULT_YEAR)
+    parser.add_argument("--batch-size", type=int, default=FUNDING_BACKFILL_BATCH)
+    parser.add_argument("--restart", action="store_true", help="Ignora el checkpoint y empieza desde el primer proyecto")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        result = ProjectFundingService.backfill_funding_models(
+            year=args.year,
+            batch_size=args.batch_size,
+            restart=args.restart,
+        )
+        print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
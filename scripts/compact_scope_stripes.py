@@ -0,0 +1,28 @@
+import argparse
+import json
+import time
+
+from api import create_app
+from api.services.accounting_service import AccountScopeService, DEFAULT_YEAR
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Consolida los stripes de saldo en account_scope_state")
+    parser.add_argument("--year", type=int, default=DEFAULT_YEAR)
+    parser.add_argument("--scope-type", default=None, choices=["global", "department"])
+    parser.add_argument("--scope-id", default=None)
+    parser.add_argument("--interval", type=float, default=0, help="Segundos entre pasadas; 0 ejecuta una sola vez")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        while True:
+            result = AccountScopeService.compact_stripes(args.year, scope_type=args.scope_type, scope_id=args.scope_id)
+            print(json.dumps(result, ensure_ascii=False, default=str), flush=True)
+            if args.interval <= 0:
+                break
+            time.sleep(args.interval)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,33 @@
+import argparse
+import json
+
+from api import create_app
+from api.services.project_funding_service import LEGACY_MIGRATION_BATCH, ProjectFundingService
+from api.util.access import parse_object_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Migra acciones legacy a ledger_movements (source=legacy_action)")
+    parser.add_argument("--project", action="append", default=None, help="ID de proyecto (repetible); por defecto todos los pendientes")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--batch-size", type=int, default=LEGACY_MIGRATION_BATCH)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        project_ids = None
+        if args.project:
+            project_ids = [parse_object_id(value) for value in args.project]
+            if not all(project_ids):
+                raise SystemExit("--project inválido")
+
+        result = ProjectFundingService.migrate_legacy_actions(
+            project_ids=project_ids,
+            workers=args.workers,
+            batch_size=args.batch_size,
+        )
+        print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
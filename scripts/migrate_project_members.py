@@ -0,0 +1,28 @@
+import argparse
+import json
+
+from api import create_app
+from api.services.project_members_service import MEMBERS_MIGRATION_BATCH, ProjectMembersService
+from api.util.access import parse_object_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Copia proyectos.miembros a la colección project_members")
+    parser.add_argument("--project", action="append", default=None, help="ID de proyecto (repetible); por defecto todos")
+    parser.add_argument("--batch-size", type=int, default=MEMBERS_MIGRATION_BATCH)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        project_ids = None
+        if args.project:
+            project_ids = [parse_object_id(value) for value in args.project]
+            if not all(project_ids):
+                raise SystemExit("--project inválido")
+
+        result = ProjectMembersService.migrate_embedded(project_ids=project_ids, batch_size=args.batch_size)
+        print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,20 @@
+import argparse
+import json
+
+from api import create_app
+from api.services.accounting_service import AccountHierarchyService, DEFAULT_YEAR
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula ancestors/root_code de master_accounts")
+    parser.add_argument("--year", type=int, default=DEFAULT_YEAR)
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        result = AccountHierarchyService.rebuild_year(args.year)
+        print(json.dumps(result, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,35 @@
+import argparse
+import json
+
+from api import create_app
+from api.extensions import mongo
+from api.services.accounting_service import DEFAULT_YEAR
+from api.services.project_funding_service import ProjectFundingService
+from api.util.access import parse_object_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Recalcula fundingTotals materializados en proyectos")
+    parser.add_argument("--year", type=int, default=DEFAULT_YEAR)
+    parser.add_argument("--project", default=None, help="ID de un proyecto puntual")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        query = {}
+        if args.project:
+            project_object_id = parse_object_id(args.project)
+            if not project_object_id:
+                raise SystemExit("--project inválido")
+            query["_id"] = project_object_id
+
+        rebuilt = []
+        for project in mongo.db.proyectos.find(query):
+            totals = ProjectFundingService.rebuild_funding_totals(project, year=args.year)
+            rebuilt.append({"projectId": str(project["_id"]), **totals})
+
+        print(json.dumps({"year": args.year, "count": len(rebuilt), "items": rebuilt}, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
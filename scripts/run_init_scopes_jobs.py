@@ -0,0 +1,36 @@
+import argparse
+import json
+
+from api import create_app
+from api.services.accounting_service import AccountScopeService
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Completa los jobs pendientes de inicializacion masiva de cuentas")
+    parser.add_argument("--job-id", default=None, help="Procesa solo este job")
+    parser.add_argument("--chunks", type=int, default=20, help="Bloques por paso antes de guardar el avance")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        job_ids = [args.job_id] if args.job_id else AccountScopeService.pending_init_job_ids()
+        failed = []
+        for job_id in job_ids:
+            job = AccountScopeService.get_job(job_id)
+            while job and job.get("status") in ("pending", "running"):
+                before = job.get("processed")
+                job = AccountScopeService.advance_init_job(job_id, max_chunks=args.chunks)
+                if job and job.get("status") == "running" and job.get("processed") == before:
+                    # Otro proceso tiene el job tomado; se retoma en la siguiente ejecucion.
+                    break
+            if job:
+                job.pop("scopeIds", None)
+                print(json.dumps(job, ensure_ascii=False, default=str), flush=True)
+                if job.get("status") == "failed":
+                    failed.append(job_id)
+        if failed:
+            raise SystemExit(f"Jobs fallidos: {', '.join(failed)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,27 @@
+import argparse
+import json
+
+from api import create_app
+from api.extensions import mongo
+from api.services.accounting_service import AccountScopeService, DEFAULT_YEAR
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Sella projectBalanceAfter/eventType en el ledger historico de proyectos")
+    parser.add_argument("--year", type=int, default=DEFAULT_YEAR)
+    parser.add_argument("--project", default=None, help="ID de un proyecto puntual")
+    args = parser.parse_args()
+
+    app = create_app()
+    with app.app_context():
+        if args.project:
+            project_ids = [args.project]
+        else:
+            project_ids = mongo.db.ledger_movements.distinct("scopeId", {"year": args.year, "scopeType": "project"})
+
+        results = [AccountScopeService.stamp_project_timeline(args.year, project_id) for project_id in project_ids]
+        print(json.dumps({"year": args.year, "count": len(results), "items": results}, ensure_ascii=False, indent=2, default=str))
+
+
+if __name__ == "__main__":
+    main()
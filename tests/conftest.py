@@ -1,8 +1,35 @@
 # tests/conftest.py
+from types import SimpleNamespace
+from uuid import uuid4
+
 import pytest
+from bson import ObjectId
+from pymongo import MongoClient, UpdateOne
+from pymongo.errors import PyMongoError
 
 from api.index import app
-from pymongo import MongoClient
+from api.routes import accounting as accounting_routes
+from api.routes import projects as project_routes
+from api.services import (
+    accounting_service,
+    audit_log_service,
+    project_funding_service,
+    project_members_service,
+    unit_of_work,
+)
+from api.services.account_catalog_cache import AccountCatalogCache
+from api.util import common
+
+MODULOS_CON_MONGO = (
+    accounting_routes,
+    project_routes,
+    accounting_service,
+    audit_log_service,
+    project_funding_service,
+    project_members_service,
+    unit_of_work,
+    common,
+)
 
 @pytest.fixture
 def test_db():
@@ -19,3 +46,291 @@ def client():
         "TESTING": True,
     })
     return app.test_client()
+
+
+class BulkResult:
+    def __init__(self, upserted_count=0, modified_count=0):
+        self.upserted_count = upserted_count
+        self.modified_count = modified_count
+        self.matched_count = modified_count
+
+
+class InMemoryCollection:
+    def __init__(self):
+        self.rows = []
+
+    def create_index(self, *args, **kwargs):
+        return "idx"
+
+    def _resolve_field(self, row, field):
+        current = row
+        for part in field.split("."):
+            if isinstance(current, dict) and part in current:
+                current = current[part]
+            elif isinstance(current, list) and part.isdigit() and int(part) < len(current):
+                current = current[int(part)]
+            else:
+                return None
+        return current
+
+    def _assign_field(self, row, field, value):
+        if "." not in field:
+            row[field] = value
+            return
+        current = row
+        parts = field.split(".")
+        for part in parts[:-1]:
+            current = current.setdefault(part, {})
+        current[parts[-1]] = value
+
+    def _match_condition(self, current, expected):
+        if isinstance(expected, dict):
+            if "$in" in expected:
+                return current in expected["$in"]
+            if "$exists" in expected:
+                return (current is not None) == bool(expected["$exists"])
+            if "$gt" in expected:
+                return current is not None and current > expected["$gt"]
+            if "$ne" in expected:
+                return current != expected["$ne"]
+            if "$lt" in expected:
+                return current is not None and current < expected["$lt"]
+            if "$gte" in expected:
+                return current is not None and current >= expected["$gte"]
+            if "$lte" in expected:
+                return current is not None and current <= expected["$lte"]
+            if "$regex" in expected:
+                import re
+                pattern = expected["$regex"]
+                flags = re.I if expected.get("$options") == "i" else 0
+                return re.search(pattern, str(current or ""), flags) is not None
+        if isinstance(current, list) and not isinstance(expected, list):
+            return expected in current
+        return current == expected
+
+    def _match(self, row, query):
+        if "$and" in query:
+            if not all(self._match(row, branch) for branch in query["$and"]):
+                return False
+            query = {k: v for k, v in query.items() if k != "$and"}
+        if "$or" in query:
+            if not any(self._match(row, branch) for branch in query["$or"]):
+                return False
+            query = {k: v for k, v in query.items() if k != "$or"}
+        return all(self._match_condition(self._resolve_field(row, k), v) for k, v in query.items())
+
+    def bulk_write(self, ops, ordered=False, session=None):
+        upserted = 0
+        modified = 0
+        for op in ops:
+            assert isinstance(op, UpdateOne)
+            filt = op._filter
+            update = op._doc
+            target = next((r for r in self.rows if self._match(r, filt)), None)
+            if target is None and op._upsert:
+                doc = dict(filt)
+                doc.update(update.get("$setOnInsert", {}))
+                doc.update(update.get("$set", {}))
+                self.rows.append(doc)
+                upserted += 1
+                target = doc
+            elif target is not None:
+                for k, v in update.get("$set", {}).items():
+                    self._assign_field(target, k, v)
+                modified += 1
+            else:
+                continue
+            for k, v in update.get("$inc", {}).items():
+                self._assign_field(target, k, (self._resolve_field(target, k) or 0) + v)
+            for k, v in update.get("$max", {}).items():
+                current = self._resolve_field(target, k)
+                if current is None or v > current:
+                    self._assign_field(target, k, v)
+        return BulkResult(upserted_count=upserted, modified_count=modified)
+
+    def delete_many(self, query):
+        self.rows = [r for r in self.rows if not self._match(r, query)]
+
+    def delete_one(self, query):
+        index = next((i for i, r in enumerate(self.rows) if self._match(r, query)), None)
+        if index is not None:
+            self.rows.pop(index)
+        return SimpleNamespace(deleted_count=0 if index is None else 1)
+
+    def replace_one(self, query, doc, upsert=False, session=None):
+        index = next((i for i, r in enumerate(self.rows) if self._match(r, query)), None)
+        if index is not None:
+            self.rows[index] = dict(doc)
+        elif upsert:
+            self.rows.append(dict(doc))
+
+    def find_one(self, query, projection=None):
+        for row in self.rows:
+            if self._match(row, query):
+                if projection:
+                    if all(v in (0, False) for v in projection.values()):
+                        excluded = {k for k, v in projection.items() if v in (0, False)}
+                        return {k: v for k, v in row.items() if k not in excluded}
+                    included = {}
+                    for k, v in projection.items():
+                        if v:
+                            self._assign_field(included, k, self._resolve_field(row, k))
+                    return included
+                return dict(row)
+        return None
+
+    def find(self, query, projection=None, session=None):
+        out = [r for r in self.rows if self._match(r, query)]
+        if projection:
+            if all(v in (0, False) for v in projection.values()):
+                excluded = {k for k, v in projection.items() if v in (0, False)}
+                out = [{k: v for k, v in r.items() if k not in excluded} for r in out]
+            else:
+                keep_id = projection.get("_id", 1)
+                out = [
+                    {**({"_id": r["_id"]} if keep_id and "_id" in r else {}), **{k: r.get(k) for k, v in projection.items() if v}}
+                    for r in out
+                ]
+
+        class _Cursor(list):
+            def sort(self, key_or_list, direction=1):
+                keys = [(key_or_list, direction)] if isinstance(key_or_list, str) else list(key_or_list)
+                rows = list(self)
+                for key, order in reversed(keys):
+                    rows.sort(key=lambda r: (r.get(key) is not None, r.get(key) or 0), reverse=order == -1)
+                return _Cursor(rows)
+
+            def limit(self, count):
+                return _Cursor(self[:count]) if count else self
+
+            def skip(self, count):
+                return _Cursor(self[count:])
+
+            def batch_size(self, size):
+                return self
+
+        return _Cursor(out)
+
+    def update_one(self, query, update, upsert=False, session=None):
+        row = next((r for r in self.rows if self._match(r, query)), None)
+        matched = int(row is not None)
+        if row is None:
+            if not upsert:
+                return SimpleNamespace(matched_count=0, modified_count=0)
+            row = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            row.update(update.get("$setOnInsert", {}))
+            self.rows.append(row)
+        for k, v in update.get("$set", {}).items():
+            self._assign_field(row, k, v)
+        for k, v in update.get("$inc", {}).items():
+            current = self._resolve_field(row, k) or 0
+            self._assign_field(row, k, current + v)
+        for k, v in update.get("$max", {}).items():
+            current = self._resolve_field(row, k)
+            if current is None or v > current:
+                self._assign_field(row, k, v)
+        return SimpleNamespace(matched_count=matched, modified_count=matched)
+
+    def find_one_and_update(self, query, update, projection=None, upsert=False, return_document=None, session=None):
+        row = next((r for r in self.rows if self._match(r, query)), None)
+        if row is None and not upsert:
+            return None
+        if row is None:
+            row = {k: v for k, v in query.items() if not isinstance(v, dict)}
+            row.update(update.get("$setOnInsert", {}))
+            self.rows.append(row)
+        for k, v in update.get("$set", {}).items():
+            self._assign_field(row, k, v)
+        for k, v in update.get("$inc", {}).items():
+            current = self._resolve_field(row, k) or 0
+            self._assign_field(row, k, current + v)
+        if projection and all(v in (0, False) for v in projection.values()):
+            return {k: v for k, v in row.items() if k not in projection}
+        return dict(row)
+
+    def count_documents(self, query):
+        return len([r for r in self.rows if self._match(r, query)])
+
+    def insert_one(self, doc, session=None):
+        doc.setdefault("_id", ObjectId())
+        self.rows.append(dict(doc))
+        return SimpleNamespace(inserted_id=doc["_id"])
+
+    def insert_many(self, docs, session=None):
+        for doc in docs:
+            doc.setdefault("_id", ObjectId())
+            self.rows.append(dict(doc))
+        return SimpleNamespace(inserted_ids=[doc["_id"] for doc in docs])
+
+    def aggregate(self, pipeline, session=None):
+        return []
+
+
+class InMemoryDB:
+    def __init__(self):
+        self.master_accounts = InMemoryCollection()
+        self.master_units = InMemoryCollection()
+        self.master_funding_sources = InMemoryCollection()
+        self.master_budget_categories = InMemoryCollection()
+        self.account_scope_state = InMemoryCollection()
+        self.account_scope_stripes = InMemoryCollection()
+        self.ledger_movements = InMemoryCollection()
+        self.proyectos = InMemoryCollection()
+        self.departamentos = InMemoryCollection()
+        self.logs = InMemoryCollection()
+        self.acciones = InMemoryCollection()
+        self.accounting_versions = InMemoryCollection()
+        self.accounting_jobs = InMemoryCollection()
+        self.project_ledger_balances = InMemoryCollection()
+        self.documentos = InMemoryCollection()
+        self.project_members = InMemoryCollection()
+        self.logs_archive = InMemoryCollection()
+
+
+class MongoStub:
+    def __init__(self):
+        self.db = InMemoryDB()
+
+        class _Client:
+            def start_session(self):
+                raise RuntimeError("no sessions in test")
+
+        self.cx = _Client()
+
+
+
+@pytest.fixture
+def mongo_stub(monkeypatch):
+    """Mongo en memoria para los servicios y rutas que lo usan."""
+    stub = MongoStub()
+    for module in MODULOS_CON_MONGO:
+        monkeypatch.setattr(module, "mongo", stub)
+    AccountCatalogCache.clear()
+    yield stub
+    AccountCatalogCache.clear()
+
+
+@pytest.fixture
+def mongo_replica_set(monkeypatch):
+    """Mongo real con replica set, para probar las rutas transaccionales."""
+    client = MongoClient(app.config["MONGO_URI"], serverSelectionTimeoutMS=500)
+    try:
+        hello = client.admin.command("ismaster")
+    except PyMongoError:
+        client.close()
+        pytest.skip("MongoDB no disponible")
+    if not hello.get("setName"):
+        client.close()
+        pytest.skip("MongoDB sin replica set: no hay transacciones")
+    db = client.get_database(f"enii_test_{uuid4().hex[:8]}")
+    real = SimpleNamespace(cx=client, db=db)
+    for module in MODULOS_CON_MONGO:
+        monkeypatch.setattr(module, "mongo", real)
+    monkeypatch.setattr(accounting_service, "_transactions_unsupported", False)
+    monkeypatch.setattr(accounting_service.AccountingIndexes, "_created", False)
+    accounting_service.AccountingIndexes.ensure_indexes()
+    AccountCatalogCache.clear()
+    yield real
+    AccountCatalogCache.clear()
+    client.drop_database(db.name)
+    client.close()
@@ -0,0 +1,528 @@
+import pytest
+from pymongo.errors import OperationFailure
+
+from api import create_app
+from api.routes import accounting as accounting_routes
+from api.services import accounting_service
+from api.services.account_catalog_cache import AccountCatalogCache
+from api.services.accounting_service import (
+    AccountCatalogService,
+    AccountHierarchyService,
+    AccountRollupService,
+    AccountScopeService,
+    SeedService,
+)
+
+
+def test_catalog_cache_se_invalida_por_version(mongo_stub):
+    mongo_stub.db.master_accounts.rows.append(
+        {"year": 2025, "code": "401000000000", "description": "Titular", "group": "EGRESO", "is_header": True, "parent_code": None}
+    )
+
+    first = AccountCatalogCache.get(mongo_stub.db, 2025)
+    mongo_stub.db.master_accounts.rows.append(
+        {"year": 2025, "code": "401010000000", "description": "Detalle", "group": "EGRESO", "is_header": False, "parent_code": "401000000000"}
+    )
+    assert AccountCatalogCache.get(mongo_stub.db, 2025) is first
+
+    AccountCatalogCache.bump(mongo_stub.db, 2025)
+    second = AccountCatalogCache.get(mongo_stub.db, 2025)
+    assert second is not first
+    assert second.children_of("401000000000") == ["401010000000"]
+    assert second.ancestors_of("401010000000") == ["401000000000"]
+
+    tree = AccountCatalogService.tree(2025)
+    assert tree[0]["children"][0]["code"] == "401010000000"
+
+
+def test_search_por_prefijo_de_codigo_y_tokens_sin_acentos(mongo_stub):
+    for code, description in (
+        ("401000000000", "Gastos de personal"),
+        ("401010000000", "Remuneraciones"),
+        ("401010100000", "Sueldos básicos personal fijo"),
+        ("402000000000", "Materiales y suministros"),
+        ("403000000000", "Servicios de comunicación"),
+    ):
+        mongo_stub.db.master_accounts.rows.append(
+            {"year": 2025, "code": code, "description": description, "group": "EGRESO", "is_header": False, "parent_code": None}
+        )
+
+    by_prefix = AccountCatalogService.search(2025, q="40101")
+    assert [row["code"] for row in by_prefix] == ["401010000000", "401010100000"]
+
+    exact = AccountCatalogService.search(2025, q="401010100000")
+    assert [row["code"] for row in exact] == ["401010100000"]
+
+    folded = AccountCatalogService.search(2025, q="COMUNICACION")
+    assert [row["code"] for row in folded] == ["403000000000"]
+
+    ranked = AccountCatalogService.search(2025, q="personal")
+    assert [row["code"] for row in ranked] == ["401000000000", "401010100000"]
+
+    partial = AccountCatalogService.search(2025, q="basic pers 401")
+    assert [row["code"] for row in partial] == ["401010100000"]
+
+    assert AccountCatalogService.search(2025, q="(") == []
+
+
+def test_tree_children_un_nivel_con_conteo_y_formato_columnar(mongo_stub):
+    for code, parent, is_header in (
+        ("401000000000", None, True),
+        ("401010000000", "401000000000", True),
+        ("401010100000", "401010000000", False),
+        ("401020000000", "401000000000", False),
+        ("402000000000", None, False),
+    ):
+        mongo_stub.db.master_accounts.rows.append(
+            {"year": 2025, "code": code, "description": code, "group": "EGRESO", "is_header": is_header, "level": 1, "parent_code": parent}
+        )
+    mongo_stub.db.account_scope_state.rows.append(
+        {"year": 2025, "scopeType": "project", "scopeId": "proj-1", "accountCode": "401020000000", "balance": 75.0, "movementsCount": 1}
+    )
+
+    roots = AccountCatalogService.tree_children(2025)
+    assert [(row["code"], row["childCount"]) for row in roots] == [("401000000000", 2), ("402000000000", 0)]
+
+    level = AccountCatalogService.tree_children(2025, parent="401000000000", scope_type="project", scope_id="proj-1")
+    assert [(row["code"], row["childCount"], row["balance"]) for row in level] == [
+        ("401010000000", 1, 0.0),
+        ("401020000000", 0, 75.0),
+    ]
+
+    columns = AccountCatalogService.tree_columnar(2025, root="401000000000")
+    assert columns["count"] == 4
+    assert columns["data"]["code"] == ["401000000000", "401010000000", "401010100000", "401020000000"]
+    assert columns["data"]["parent_code"][0] is None
+
+    scoped = AccountScopeService.get_scope_accounts(2025, "project", "proj-1", assigned_only=True, columnar=True)
+    assert "tree" not in scoped
+    assert scoped["columns"]["data"]["balance"] == [0, 75.0]
+
+
+def test_seed_idempotente(mongo_stub, monkeypatch):
+    service = SeedService(base_dir="/Users/MacBook/Develop/deu-sisgead/deu-sisgead-be")
+    monkeypatch.setattr(service, "_ensure_local_data_files", lambda: None)
+    monkeypatch.setattr(service, "_load_accounts", lambda: [{"code": "100", "description": "A", "group": "INGRESO", "is_header": False, "level": 1, "parent_code": None}])
+    monkeypatch.setattr(service, "_load_units", lambda: [{"code": "460", "description": "U", "level": 1, "parent_code": None}])
+    monkeypatch.setattr(service, "_load_funding_sources", lambda: [{"code": "11", "description": "F"}])
+    monkeypatch.setattr(service, "_load_budget_categories", lambda: [{"code": "AC", "description": "C"}])
+
+    first = service.seed(year=2025)
+    second = service.seed(year=2025)
+
+    assert first["counts"]["accounts"] >= 1
+    assert second["counts"]["accounts"] >= 1
+    assert len(mongo_stub.db.master_accounts.rows) == 1
+
+
+def test_account_hierarchy_rebuild_y_reparent(mongo_stub):
+    for code, parent in (
+        ("400000000000", None),
+        ("401000000000", "400000000000"),
+        ("401010000000", "401000000000"),
+        ("401010100000", "401010000000"),
+        ("500000000000", None),
+    ):
+        mongo_stub.db.master_accounts.rows.append({"year": 2025, "code": code, "parent_code": parent})
+
+    # Sin ``ancestors`` materializado el ciclo se detecta igual, por parent_code.
+    with pytest.raises(ValueError):
+        AccountHierarchyService.validate_parent(2025, "400000000000", "401010100000")
+
+    result = AccountHierarchyService.rebuild_year(2025)
+    assert result["updated"] == 5
+    leaf = mongo_stub.db.master_accounts.find_one({"code": "401010100000"})
+    assert leaf["ancestors"] == ["400000000000", "401000000000", "401010000000"]
+    assert leaf["root_code"] == "400000000000"
+    assert AccountHierarchyService.rebuild_year(2025)["updated"] == 0
+
+    with pytest.raises(ValueError):
+        AccountHierarchyService.validate_parent(2025, "401000000000", "401010100000")
+
+    mongo_stub.db.master_accounts.update_one({"code": "401010000000"}, {"$set": {"parent_code": "500000000000"}})
+    assert AccountHierarchyService.refresh_subtree(2025, "401010000000") == 2
+    leaf = mongo_stub.db.master_accounts.find_one({"code": "401010100000"})
+    assert leaf["ancestors"] == ["500000000000", "401010000000"]
+    assert leaf["root_code"] == "500000000000"
+
+    subtree = AccountCatalogService.tree(2025, root="500000000000")
+    assert subtree[0]["code"] == "500000000000"
+    assert subtree[0]["children"][0]["children"][0]["code"] == "401010100000"
+
+
+def test_admin_delete_account_bloquea_hijos_y_recalcula_rutas_viejas(mongo_stub):
+    for code, parent in (
+        ("400000000000", None),
+        ("401000000000", "400000000000"),
+        ("401010000000", "401000000000"),
+        ("500000000000", None),
+    ):
+        mongo_stub.db.master_accounts.rows.append({"year": 2025, "code": code, "parent_code": parent})
+    AccountHierarchyService.rebuild_year(2025)
+
+    borrar = accounting_routes.admin_delete_account.__wrapped__.__wrapped__
+    admin = {"role": "super_admin"}
+    app = create_app()
+    with app.test_request_context("/admin/accounts/401000000000?year=2025", method="DELETE"):
+        assert borrar(admin, "401000000000")[1] == 409
+
+    # Re-parentado sin refrescar el subárbol: la ruta sigue pasando por 401000000000.
+    mongo_stub.db.master_accounts.update_one({"code": "401010000000"}, {"$set": {"parent_code": "500000000000"}})
+    with app.test_request_context("/admin/accounts/401000000000?year=2025", method="DELETE"):
+        response, status = borrar(admin, "401000000000")
+    assert status == 200
+    moved = mongo_stub.db.master_accounts.find_one({"code": "401010000000"})
+    assert moved["ancestors"] == ["500000000000"]
+    assert moved["root_code"] == "500000000000"
+
+
+def test_rollup_headers_incrementa_titulares_y_rebuild_consistente(mongo_stub, monkeypatch):
+    monkeypatch.setenv("ACCOUNTING_ROLLUP_HEADERS", "true")
+
+    for code, parent, is_header in (
+        ("401000000000", None, True),
+        ("401010000000", "401000000000", True),
+        ("401010100000", "401010000000", False),
+        ("401010200000", "401010000000", False),
+    ):
+        mongo_stub.db.master_accounts.rows.append(
+            {"year": 2025, "code": code, "parent_code": parent, "is_header": is_header, "group": "EGRESO", "level": 1}
+        )
+    AccountHierarchyService.rebuild_year(2025)
+
+    AccountScopeService.create_movement(
+        year=2025,
+        scope_type="project",
+        scope_id="proj-1",
+        account_code="401010100000",
+        movement_type="debit",
+        amount=300,
+        description="Carga",
+        reference=None,
+        created_by="user-1",
+        allow_negative=False,
+    )
+    AccountScopeService.transfer_between_accounts(
+        year=2025,
+        scope_type="project",
+        scope_id="proj-1",
+        from_account_code="401010100000",
+        to_account_code="401010200000",
+        amount=100,
+        description="Reasignación",
+        reference=None,
+        created_by="user-1",
+        allow_negative=False,
+    )
+
+    for header in ("401000000000", "401010000000"):
+        state = mongo_stub.db.account_scope_state.find_one({"scopeId": "proj-1", "accountCode": header})
+        assert state["rollupBalance"] == 300.0
+        assert state["balance"] == 0.0
+
+    scope = AccountScopeService.get_scope_accounts(2025, "project", "proj-1", assigned_only=True)
+    assert scope["meta"]["totalAssigned"] == 2
+    full = AccountScopeService.get_scope_accounts(2025, "project", "proj-1")
+    assert full["tree"][0]["code"] == "401000000000"
+    assert full["tree"][0]["rollupBalance"] == 300.0
+
+    assert AccountRollupService.rebuild(2025)["updated"] == 0
+
+
+def test_init_scopes_bulk_usa_merge_por_bloques_y_reporta_avance(mongo_stub, monkeypatch):
+    monkeypatch.setattr(accounting_service, "INIT_BULK_CHUNK", 2)
+    for code in ("401010100000", "401010200000"):
+        mongo_stub.db.master_accounts.rows.append({"year": 2025, "code": code, "is_header": False, "group": "EGRESO"})
+
+    pipelines = []
+
+    def fake_aggregate(pipeline):
+        # Simula el $merge: un estado por (scopeId, cuenta) que cumple el $match.
+        pipelines.append(pipeline)
+        project = pipeline[1]["$project"]
+        for account in mongo_stub.db.master_accounts.find(pipeline[0]["$match"]):
+            for scope_id in project["scopeId"]["$literal"]:
+                mongo_stub.db.account_scope_state.rows.append(
+                    {"year": account["year"], "scopeType": project["scopeType"]["$literal"], "scopeId": scope_id, "accountCode": account["code"], "balance": 0}
+                )
+        return []
+
+    monkeypatch.setattr(mongo_stub.db.master_accounts, "aggregate", fake_aggregate)
+
+    job = AccountScopeService.create_init_job(2025, "department", ["d1", "d2", "d3"], "detail_only", created_by="admin")
+    assert job["status"] == "pending"
+
+    # Cada llamada procesa un tramo y la siguiente retoma desde ``processed``.
+    status = AccountScopeService.advance_init_job(job["_id"], max_chunks=1)
+    assert (status["status"], status["processed"], status["inserted"]) == ("running", 2, 4)
+    assert status["lockedUntil"] is None
+
+    status = AccountScopeService.advance_init_job(job["_id"], max_chunks=1)
+    assert len(pipelines) == 2
+    assert pipelines[0][-1]["$merge"]["into"] == "account_scope_state"
+    assert pipelines[0][0]["$match"] == {"year": 2025, "is_header": False}
+    assert status["status"] == "done"
+    assert (status["processed"], status["inserted"]) == (3, 6)
+
+    # Un job terminado no vuelve a procesarse.
+    AccountScopeService.advance_init_job(job["_id"])
+    assert len(pipelines) == 2
+    assert AccountScopeService.pending_init_job_ids() == []
+
+    result = AccountScopeService.init_scopes_bulk(2025, "department", ["d4"])
+    assert (result["processed"], result["inserted"]) == (1, 2)
+
+    with pytest.raises(ValueError):
+        AccountScopeService.create_init_job(2025, "department", ["d1"], "otro", created_by="admin")
+
+    # La consulta de estado solo lee; un error de Mongo queda en el estado del job.
+    job = AccountScopeService.create_init_job(2025, "department", ["d5"], "detail_only", created_by="admin")
+    estado = accounting_routes.admin_init_scopes_bulk_status.__wrapped__.__wrapped__
+    app = create_app()
+    with app.test_request_context(f"/admin/accounts/init-bulk/{job['_id']}"):
+        response, status_code = estado({"role": "super_admin"}, job["_id"])
+    assert (status_code, response.get_json()["status"]) == (200, "pending")
+    assert len(pipelines) == 3
+
+    def failing_aggregate(pipeline):
+        raise OperationFailure("merge no disponible")
+
+    monkeypatch.setattr(mongo_stub.db.master_accounts, "aggregate", failing_aggregate)
+    status = AccountScopeService.advance_init_job(job["_id"])
+    assert (status["status"], status["error"]) == ("failed", "merge no disponible")
+    assert status["lockedUntil"] is None
+
+
+def test_consolidated_totals_cachea_por_scope_e_invalida_con_movimientos(mongo_stub, monkeypatch):
+    accounting_service.ConsolidatedTotalsCache.clear()
+    mongo_stub.db.master_accounts.rows.append(
+        {"year": 2025, "code": "401010100000", "description": "Detalle", "group": "EGRESO", "is_header": False, "parent_code": None}
+    )
+
+    calls = []
+
+    def fake_aggregate(pipeline):
+        calls.append(pipeline)
+        assert "$facet" in pipeline[-1]
+        return [
+            {
+                "byAccount": [{"accountCode": "401010100000", "balance": 10.0, "movementsCount": 1, "rollupBalance": 0}],
+                "byRoot": [{"_id": "401010100000", "balance": 10.0, "rootTotal": 10.0, "hasRootRow": True, "root": [{"description": "Detalle"}]}],
+            }
+        ]
+
+    monkeypatch.setattr(mongo_stub.db.account_scope_state, "aggregate", fake_aggregate)
+
+    first = AccountCatalogService.consolidated_totals(2025, "project", "proj-1")
+    second = AccountCatalogService.consolidated_totals(2025, "project", "proj-1")
+    assert (first["cached"], second["cached"]) == (False, True)
+    assert second["totalsByRoot"] == [{"rootCode": "401010100000", "description": "Detalle", "balance": 10.0}]
+    assert len(calls) == 1
+    # La lectura no materializa la jerarquía.
+    assert "root_code" not in mongo_stub.db.master_accounts.rows[0]
+
+    movement = dict(
+        year=2025,
+        account_code="401010100000",
+        movement_type="debit",
+        amount=5,
+        description="",
+        reference=None,
+        created_by="user-1",
+        allow_negative=True,
+    )
+    AccountScopeService.create_movement(scope_type="project", scope_id="proj-2", **movement)
+    assert AccountCatalogService.consolidated_totals(2025, "project", "proj-1")["cached"] is True
+
+    AccountScopeService.create_movement(scope_type="project", scope_id="proj-1", **movement)
+    assert AccountCatalogService.consolidated_totals(2025, "project", "proj-1")["cached"] is False
+    assert len(calls) == 2
+    accounting_service.ConsolidatedTotalsCache.clear()
+
+
+def test_consolidated_totals_suma_stripes_en_la_raiz_del_catalogo(mongo_stub, monkeypatch):
+    accounting_service.ConsolidatedTotalsCache.clear()
+    mongo_stub.db.master_accounts.rows.extend(
+        [
+            {"year": 2025, "code": "401000000000", "description": "Raiz", "is_header": True, "parent_code": None, "root_code": "401000000000"},
+            # root_code desactualizado: la raíz sale de la cadena de padres del catálogo.
+            {"year": 2025, "code": "401010100000", "description": "Detalle", "is_header": False, "parent_code": "401000000000", "root_code": "401010100000"},
+            # Sin root_code materializado: la agregación la devuelve en ``unrooted``.
+            {"year": 2025, "code": "401010200000", "description": "Otro", "is_header": False, "parent_code": "401000000000"},
+            {"year": 2025, "code": "402000000000", "description": "Sin jerarquia", "is_header": False, "parent_code": None},
+        ]
+    )
+    monkeypatch.setattr(
+        mongo_stub.db.account_scope_state,
+        "aggregate",
+        lambda pipeline: [
+            {
+                "byAccount": [],
+                "byRoot": [{"_id": "401000000000", "balance": 10.0, "root": [{"description": "Raiz"}]}],
+                "unrooted": [
+                    {"_id": "401010200000", "totalBalance": 3.0, "totalRollup": 0},
+                    {"_id": "402000000000", "totalBalance": 4.0, "totalRollup": 0},
+                ],
+            }
+        ],
+    )
+    monkeypatch.setattr(
+        accounting_service,
+        "stripe_states",
+        lambda year, match: {("department", "dep-1", "401010100000"): {"balance": 7.0, "movementsCount": 1}},
+    )
+
+    result = AccountCatalogService.consolidated_totals(2025, "department", "dep-1")
+    assert result["totalsByRoot"] == [
+        {"rootCode": "401000000000", "description": "Raiz", "balance": 20.0},
+        {"rootCode": "402000000000", "description": "Sin jerarquia", "balance": 4.0},
+    ]
+    unrooted = next(row for row in mongo_stub.db.master_accounts.rows if row["code"] == "401010200000")
+    assert "root_code" not in unrooted
+    accounting_service.ConsolidatedTotalsCache.clear()
+
+
+def test_rbac_department_basico():
+    user_admin = {"role": "super_admin"}
+    user_dep_ok = {"role": "admin_departamento", "departamento_id": "dep-1"}
+    user_dep_bad = {"role": "admin_departamento", "departamento_id": "dep-2"}
+
+    assert accounting_routes._can_access_department(user_admin, "dep-1") is True
+    assert accounting_routes._can_access_department(user_dep_ok, "dep-1") is True
+    assert accounting_routes._can_access_department(user_dep_bad, "dep-1") is False
+
+
+def test_get_scope_accounts_assigned_only_include_zero_filters(mongo_stub):
+    mongo_stub.db.master_accounts.rows.extend(
+        [
+            {
+                "year": 2025,
+                "code": "100000000000",
+                "description": "Raiz",
+                "group": "EGRESO",
+                "is_header": True,
+                "level": 1,
+                "parent_code": None,
+            },
+            {
+                "year": 2025,
+                "code": "100100000000",
+                "description": "Sub raiz",
+                "group": "EGRESO",
+                "is_header": True,
+                "level": 2,
+                "parent_code": "100000000000",
+            },
+            {
+                "year": 2025,
+                "code": "100100100000",
+                "description": "Detalle A",
+                "group": "EGRESO",
+                "is_header": False,
+                "level": 3,
+                "parent_code": "100100000000",
+            },
+            {
+                "year": 2025,
+                "code": "100100200000",
+                "description": "Detalle B",
+                "group": "EGRESO",
+                "is_header": False,
+                "level": 3,
+                "parent_code": "100100000000",
+            },
+        ]
+    )
+
+    # Dos cuentas asignadas al scope: una con saldo y otra en 0.
+    mongo_stub.db.account_scope_state.rows.extend(
+        [
+            {
+                "year": 2025,
+                "scopeType": "project",
+                "scopeId": "proj-1",
+                "accountCode": "100100100000",
+                "balance": 300.0,
+                "movementsCount": 2,
+                "lastMovementAt": None,
+            },
+            {
+                "year": 2025,
+                "scopeType": "project",
+                "scopeId": "proj-1",
+                "accountCode": "100100200000",
+                "balance": 0.0,
+                "movementsCount": 0,
+                "lastMovementAt": None,
+            },
+        ]
+    )
+
+    # assignedOnly + includeZero=false: solo no-cero + ancestros.
+    payload_no_zero = AccountScopeService.get_scope_accounts(
+        year=2025,
+        scope_type="project",
+        scope_id="proj-1",
+        assigned_only=True,
+        include_zero=False,
+    )
+
+    def _flatten(nodes):
+        out = []
+        for node in nodes:
+            out.append(node)
+            out.extend(_flatten(node.get("children", [])))
+        return out
+
+    flat_no_zero = _flatten(payload_no_zero["tree"])
+    codes_no_zero = {row["code"] for row in flat_no_zero}
+
+    assert "100100100000" in codes_no_zero
+    assert "100100200000" not in codes_no_zero
+    # Ancestros preservados para mantener jerarquía.
+    assert "100100000000" in codes_no_zero
+    assert "100000000000" in codes_no_zero
+    assert payload_no_zero["meta"]["assignedOnly"] is True
+    assert payload_no_zero["meta"]["includeZero"] is False
+    assert payload_no_zero["meta"]["totalAssigned"] == 2
+
+    # assignedOnly + includeZero=true: incluye asignadas en 0.
+    payload_with_zero = AccountScopeService.get_scope_accounts(
+        year=2025,
+        scope_type="project",
+        scope_id="proj-1",
+        assigned_only=True,
+        include_zero=True,
+    )
+    flat_with_zero = _flatten(payload_with_zero["tree"])
+    codes_with_zero = {row["code"] for row in flat_with_zero}
+    assert "100100100000" in codes_with_zero
+    assert "100100200000" in codes_with_zero
+
+
+def test_get_scope_accounts_assigned_only_es_disperso(mongo_stub):
+    for code, parent, is_header in (
+        ("100000000000", None, True),
+        ("100100000000", "100000000000", True),
+        ("100100100000", "100100000000", False),
+        ("100100200000", "100100000000", False),
+        ("200000000000", None, True),
+        ("200100000000", "200000000000", False),
+    ):
+        mongo_stub.db.master_accounts.rows.append(
+            {"year": 2025, "code": code, "description": code, "group": "EGRESO", "is_header": is_header, "level": 1, "parent_code": parent}
+        )
+    mongo_stub.db.account_scope_state.rows.append(
+        {"year": 2025, "scopeType": "project", "scopeId": "proj-1", "accountCode": "100100200000", "balance": 0.0, "movementsCount": 0}
+    )
+
+    payload = AccountScopeService.get_scope_accounts(2025, "project", "proj-1", assigned_only=True, include_zero=True)
+
+    assert payload["meta"]["sparse"] is True
+    assert payload["meta"]["totalVisible"] == 3
+    root = payload["tree"][0]
+    assert len(payload["tree"]) == 1
+    assert root["code"] == "100000000000"
+    assert [child["code"] for child in root["children"][0]["children"]] == ["100100200000"]
+    assert root["children"][0]["children"][0]["hasState"] is True
+
@@ -0,0 +1,491 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from api.services import accounting_service
+from api.services.accounting_service import AccountScopeService
+
+
+def test_crear_movimiento_actualiza_balance(mongo_stub):
+    mongo_stub.db.master_accounts.rows.append(
+        {
+            "year": 2025,
+            "code": "401010100000",
+            "description": "Cuenta detalle",
+            "group": "EGRESO",
+            "is_header": False,
+            "level": 4,
+            "parent_code": "401010000000",
+        }
+    )
+
+    result = AccountScopeService.create_movement(
+        year=2025,
+        scope_type="department",
+        scope_id="dep-1",
+        account_code="401010100000",
+        movement_type="debit",
+        amount=100,
+        description="Prueba",
+        reference={"kind": "manual", "id": "1"},
+        created_by="user-1",
+        allow_negative=True,
+    )
+
+    assert result["state"]["balance"] == 100
+    assert result["state"]["movementsCount"] == 1
+    assert len(mongo_stub.db.ledger_movements.rows) == 1
+
+
+def test_create_movements_batch_aplica_lote_atomico(mongo_stub, monkeypatch):
+    for code in ("401010100000", "401010200000"):
+        mongo_stub.db.master_accounts.rows.append(
+            {"year": 2025, "code": code, "description": "Cuenta detalle", "group": "EGRESO", "is_header": False, "level": 4, "parent_code": "401010000000"}
+        )
+
+    result = AccountScopeService.create_movements_batch(
+        year=2025,
+        items=[
+            {"scopeType": "department", "scopeId": "dep-1", "accountCode": "401010100000", "type": "debit", "amount": 300},
+            {"scopeType": "department", "scopeId": "dep-1", "accountCode": "401010100000", "type": "credit", "amount": 100},
+            {"scopeType": "project", "scopeId": "proj-1", "accountCode": "401010200000", "type": "debit", "amount": 50},
+        ],
+        created_by="user-1",
+        allow_negative=False,
+    )
+
+    assert result["applied"] is True
+    assert [row["balanceAfter"] for row in result["results"]] == [300.0, 200.0, 50.0]
+    assert len(mongo_stub.db.ledger_movements.rows) == 3
+    dep_state = mongo_stub.db.account_scope_state.find_one({"scopeId": "dep-1", "accountCode": "401010100000"})
+    assert dep_state["balance"] == 200.0
+    assert dep_state["movementsCount"] == 2
+
+    # Otro proceso retira saldo entre la lectura y el update: el lote entero se rechaza.
+    read_balances = accounting_service._read_state_balances
+
+    def read_then_withdraw(*args, **kwargs):
+        balances = read_balances(*args, **kwargs)
+        next(row for row in mongo_stub.db.account_scope_state.rows if row["scopeId"] == "dep-1")["balance"] = 10.0
+        return balances
+
+    monkeypatch.setattr(accounting_service, "_read_state_balances", read_then_withdraw)
+    with pytest.raises(ValueError):
+        AccountScopeService.create_movements_batch(
+            year=2025,
+            items=[
+                {"scopeType": "project", "scopeId": "proj-1", "accountCode": "401010200000", "type": "credit", "amount": 20},
+                {"scopeType": "department", "scopeId": "dep-1", "accountCode": "401010100000", "type": "credit", "amount": 150},
+            ],
+            created_by="user-1",
+            allow_negative=False,
+        )
+    assert mongo_stub.db.account_scope_state.find_one({"scopeId": "proj-1"})["balance"] == 50.0
+    assert len(mongo_stub.db.ledger_movements.rows) == 3
+
+
+def test_create_movements_batch_rechaza_lote_con_errores(mongo_stub):
+    mongo_stub.db.master_accounts.rows.append(
+        {"year": 2025, "code": "401010100000", "description": "Cuenta detalle", "group": "EGRESO", "is_header": False, "level": 4, "parent_code": None}
+    )
+
+    result = AccountScopeService.create_movements_batch(
+        year=2025,
+        items=[
+            {"scopeType": "department", "scopeId": "dep-1", "accountCode": "401010100000", "type": "debit", "amount": 100},
+            {"scopeType": "department", "scopeId": "dep-1", "accountCode": "401010100000", "type": "credit", "amount": 150},
+            {"scopeType": "department", "scopeId": "dep-1", "accountCode": "999999999999", "type": "debit", "amount": 10},
+        ],
+        created_by="user-1",
+        allow_negative=False,
+    )
+
+    assert result["applied"] is False
+    assert [row["ok"] for row in result["results"]] == [True, False, False]
+    assert mongo_stub.db.ledger_movements.rows == []
+    assert mongo_stub.db.account_scope_state.rows == []
+
+
+def test_create_movement_rechaza_credito_sin_saldo_sin_tocar_estado(mongo_stub):
+    mongo_stub.db.master_accounts.rows.append(
+        {"year": 2025, "code": "401010100000", "description": "Cuenta detalle", "group": "EGRESO", "is_header": False, "level": 4, "parent_code": None}
+    )
+    mongo_stub.db.account_scope_state.rows.append(
+        {"year": 2025, "scopeType": "department", "scopeId": "dep-1", "accountCode": "401010100000", "balance": 40.0, "movementsCount": 1}
+    )
+
+    try:
+        AccountScopeService.create_movement(
+            year=2025,
+            scope_type="department",
+            scope_id="dep-1",
+            account_code="401010100000",
+            movement_type="credit",
+            amount=50,
+            description="Sobregiro",
+            reference=None,
+            created_by="user-1",
+            allow_negative=False,
+        )
+        assert False, "Se esperaba ValueError"
+    except ValueError:
+        pass
+
+    state = mongo_stub.db.account_scope_state.rows[0]
+    assert state["balance"] == 40.0
+    assert state["movementsCount"] == 1
+    assert mongo_stub.db.ledger_movements.rows == []
+
+
+def test_saldos_sin_transaccion_revierten_lo_aplicado_si_falla_una_guardia(mongo_stub, monkeypatch):
+    now = accounting_service._now_utc()
+    state = mongo_stub.db.account_scope_state
+    state.rows.extend(
+        [
+            {"year": 2025, "scopeType": "department", "scopeId": "dep-1", "accountCode": "A", "balance": 100.0, "movementsCount": 1},
+            {"year": 2025, "scopeType": "department", "scopeId": "dep-1", "accountCode": "B", "balance": 10.0, "movementsCount": 1},
+        ]
+    )
+
+    def write(code, delta, guarded):
+        filt = {"year": 2025, "scopeType": "department", "scopeId": "dep-1", "accountCode": code}
+        if guarded:
+            filt["balance"] = {"$gte": -delta}
+        return state, filt, {"$inc": {"balance": delta, "movementsCount": 1}, "$set": {"updatedAt": now}}, not guarded
+
+    # Sin sesión, si una guardia no coincide se revierten las escrituras ya aplicadas.
+    with pytest.raises(ValueError):
+        accounting_service._apply_balance_writes(
+            [write("C", 30.0, False), write("A", -50.0, True), write("B", -20.0, True)], now
+        )
+    balances = {row["accountCode"]: (row["balance"], row["movementsCount"]) for row in state.rows}
+    assert balances == {"A": (100.0, 1), "B": (10.0, 1)}
+
+    # Transferencia sin transacción: si el ledger falla, el origen vuelve a su saldo.
+    for code in ("A", "D"):
+        mongo_stub.db.master_accounts.rows.append({"year": 2025, "code": code, "is_header": False, "group": "EGRESO", "parent_code": None})
+
+    def failing_insert(docs, session=None):
+        raise RuntimeError("ledger no disponible")
+
+    monkeypatch.setattr(mongo_stub.db.ledger_movements, "insert_many", failing_insert)
+    with pytest.raises(RuntimeError):
+        AccountScopeService.transfer_between_accounts(
+            year=2025,
+            scope_type="department",
+            scope_id="dep-1",
+            from_account_code="A",
+            to_account_code="D",
+            amount=40.0,
+            description="",
+            reference=None,
+            created_by="user-1",
+            allow_negative=False,
+        )
+    balances = {row["accountCode"]: row["balance"] for row in state.rows}
+    assert balances["A"] == 100.0
+    assert balances.get("D", 0.0) == 0.0
+
+    # Hacia un proyecto también se revierte el contador de project_ledger_balances.
+    with pytest.raises(RuntimeError):
+        AccountScopeService.transfer_between_accounts(
+            year=2025,
+            from_scope_type="department",
+            from_scope_id="dep-1",
+            to_scope_type="project",
+            to_scope_id="proj-1",
+            from_account_code="A",
+            to_account_code="D",
+            amount=40.0,
+            description="",
+            reference=None,
+            created_by="user-1",
+            allow_negative=False,
+        )
+    assert mongo_stub.db.project_ledger_balances.find_one({"_id": "2025:proj-1"})["balance"] == 0.0
+    assert state.find_one({"scopeType": "department", "accountCode": "A"})["balance"] == 100.0
+
+
+def test_run_in_transaction_recuerda_servidor_sin_replica_set(mongo_stub, monkeypatch):
+    monkeypatch.setattr(accounting_service, "_transactions_unsupported", False)
+    sessions = []
+
+    class _Session:
+        def __enter__(self):
+            return self
+
+        def __exit__(self, *exc):
+            return False
+
+        def with_transaction(self, callback):
+            raise OperationFailure("Transaction numbers are only allowed on a replica set member or mongos", code=20)
+
+    def start_session():
+        sessions.append(1)
+        return _Session()
+
+    monkeypatch.setattr(mongo_stub.cx, "start_session", start_session)
+    calls = []
+    accounting_service._run_in_transaction(calls.append)
+    accounting_service._run_in_transaction(calls.append)
+    assert calls == [None, None]
+    assert len(sessions) == 1
+
+
+def test_transfer_between_accounts_actualiza_ambas(mongo_stub):
+    for code in ("401010100000", "401010200000"):
+        mongo_stub.db.master_accounts.rows.append(
+            {
+                "year": 2025,
+                "code": code,
+                "description": "Cuenta detalle",
+                "group": "EGRESO",
+                "is_header": False,
+                "level": 4,
+                "parent_code": "401010000000",
+            }
+        )
+
+    # saldo inicial en origen
+    mongo_stub.db.account_scope_state.rows.append(
+        {
+            "year": 2025,
+            "scopeType": "department",
+            "scopeId": "dep-1",
+            "accountCode": "401010100000",
+            "balance": 500.0,
+            "movementsCount": 1,
+        }
+    )
+
+    result = AccountScopeService.transfer_between_accounts(
+        year=2025,
+        scope_type="department",
+        scope_id="dep-1",
+        from_account_code="401010100000",
+        to_account_code="401010200000",
+        amount=200.0,
+        description="Transferencia interna",
+        reference={"kind": "manual", "id": "T-1"},
+        created_by="user-1",
+        allow_negative=False,
+    )
+
+    assert result["sourceState"]["balance"] == 300.0
+    assert result["targetState"]["balance"] == 200.0
+    assert len(mongo_stub.db.ledger_movements.rows) == 2
+
+
+def test_post_journal_entry_valida_cuadre_y_aplica_todas_las_patas(mongo_stub, monkeypatch):
+    for code in ("401010100000", "401010200000", "401010300000"):
+        mongo_stub.db.master_accounts.rows.append(
+            {"year": 2025, "code": code, "description": "Cuenta", "group": "EGRESO", "is_header": False, "level": 4, "parent_code": None}
+        )
+    mongo_stub.db.account_scope_state.rows.append(
+        {"year": 2025, "scopeType": "department", "scopeId": "dep-1", "accountCode": "401010100000", "balance": 500.0, "movementsCount": 1}
+    )
+
+    def leg(scope_type, scope_id, code, movement_type, amount):
+        return {"scopeType": scope_type, "scopeId": scope_id, "accountCode": code, "type": movement_type, "amount": amount}
+
+    with pytest.raises(ValueError, match="no cuadra"):
+        AccountScopeService.post_journal_entry(
+            year=2025,
+            legs=[leg("department", "dep-1", "401010100000", "credit", 300.0), leg("project", "p-1", "401010200000", "debit", 200.0)],
+            created_by="user-1",
+            allow_negative=False,
+        )
+    with pytest.raises(ValueError, match="Saldo insuficiente en la cuenta origen 401010100000"):
+        AccountScopeService.post_journal_entry(
+            year=2025,
+            legs=[leg("department", "dep-1", "401010100000", "credit", 600.0), leg("project", "p-1", "401010200000", "debit", 600.0)],
+            created_by="user-1",
+            allow_negative=False,
+        )
+    assert mongo_stub.db.ledger_movements.rows == []
+
+    result = AccountScopeService.post_journal_entry(
+        year=2025,
+        legs=[
+            leg("department", "dep-1", "401010100000", "credit", 450.0),
+            leg("project", "p-1", "401010200000", "debit", 300.0),
+            leg("project", "p-2", "401010300000", "debit", 150.0),
+        ],
+        description="Reparto",
+        reference={"kind": "journal"},
+        created_by="user-1",
+        allow_negative=False,
+    )
+
+    assert result["debits"] == result["credits"] == 450.0
+    assert [row["balanceAfter"] for row in result["legs"]] == [50.0, 300.0, 150.0]
+    rows = mongo_stub.db.ledger_movements.rows
+    assert len(rows) == 3
+    assert {row["journalId"] for row in rows} == {result["journalId"]}
+    assert all(row["reference"]["journalId"] == result["journalId"] and row["description"] == "Reparto" for row in rows)
+    source = mongo_stub.db.account_scope_state.find_one({"scopeType": "department", "accountCode": "401010100000"})
+    assert source["balance"] == 50.0
+
+    # Sin transacción, una pata que falla su guardia revierte las ya aplicadas.
+    mongo_stub.db.account_scope_state.rows.append(
+        {"year": 2025, "scopeType": "department", "scopeId": "dep-1", "accountCode": "401010300000", "balance": 100.0, "movementsCount": 1}
+    )
+    read_balances = accounting_service._read_state_balances
+
+    def read_then_withdraw(*args, **kwargs):
+        balances = read_balances(*args, **kwargs)
+        next(row for row in mongo_stub.db.account_scope_state.rows if row["scopeId"] == "dep-1" and row["accountCode"] == "401010300000")["balance"] = 30.0
+        return balances
+
+    monkeypatch.setattr(accounting_service, "_read_state_balances", read_then_withdraw)
+    with pytest.raises(ValueError, match="cambió durante la operación"):
+        AccountScopeService.post_journal_entry(
+            year=2025,
+            legs=[
+                leg("department", "dep-1", "401010100000", "credit", 40.0),
+                leg("department", "dep-1", "401010300000", "credit", 60.0),
+                leg("project", "p-3", "401010200000", "debit", 100.0),
+            ],
+            created_by="user-1",
+            allow_negative=False,
+        )
+    source = mongo_stub.db.account_scope_state.find_one({"scopeType": "department", "accountCode": "401010100000"})
+    assert (source["balance"], source["movementsCount"]) == (50.0, 2)
+    assert mongo_stub.db.account_scope_state.find_one({"scopeId": "p-3"}) is None
+    assert len(mongo_stub.db.ledger_movements.rows) == 3
+
+
+def test_stripes_reparten_saldo_caliente_y_compactan(mongo_stub, monkeypatch):
+    monkeypatch.setenv("ACCOUNTING_STRIPED_SCOPES", "department")
+    monkeypatch.setenv("ACCOUNTING_STRIPES", "4")
+
+    for code in ("401010100000", "401010200000"):
+        mongo_stub.db.master_accounts.rows.append(
+            {"year": 2025, "code": code, "description": "Cuenta", "group": "EGRESO", "is_header": False, "level": 4, "parent_code": None}
+        )
+    for scope_type, scope_id, balance in (("department", "dep-1", 100.0), ("global", "global", 1000.0)):
+        mongo_stub.db.account_scope_state.rows.append(
+            {"year": 2025, "scopeType": scope_type, "scopeId": scope_id, "accountCode": "401010100000", "balance": balance, "movementsCount": 1}
+        )
+    department = ("department", "dep-1", "401010100000")
+
+    def move(source, target, amount):
+        return AccountScopeService.post_journal_entry(
+            year=2025,
+            legs=[
+                {"scopeType": source[0], "scopeId": source[1], "accountCode": source[2], "type": "credit", "amount": amount},
+                {"scopeType": target[0], "scopeId": target[1], "accountCode": target[2], "type": "debit", "amount": amount},
+            ],
+            created_by="user-1",
+            allow_negative=False,
+        )
+
+    def main_balance():
+        return mongo_stub.db.account_scope_state.find_one({"scopeType": "department", "accountCode": "401010100000"})["balance"]
+
+    for _ in range(3):
+        move(("global", "global", "401010100000"), department, 50.0)
+    assert main_balance() == 100.0
+    assert sum(row["balance"] for row in mongo_stub.db.account_scope_stripes.rows) == 150.0
+    scoped = AccountScopeService.get_scope_accounts(2025, "department", "dep-1", assigned_only=True)
+    assert scoped["meta"]["totalBalanceVisible"] == 250.0
+
+    # Ningún stripe ni el principal cubren 200 por sí solos: se consolida antes de descontar.
+    result = move(department, ("project", "p-1", "401010200000"), 200.0)
+    assert result["legs"][0]["balanceAfter"] == 50.0
+    assert main_balance() == 50.0
+    assert all(row["balance"] == 0 for row in mongo_stub.db.account_scope_stripes.rows)
+
+    with pytest.raises(ValueError, match="Saldo insuficiente en la cuenta origen 401010100000"):
+        move(department, ("project", "p-1", "401010200000"), 60.0)
+
+    move(("global", "global", "401010100000"), department, 30.0)
+    compacted = AccountScopeService.compact_stripes(2025, scope_type="department")
+    assert compacted["compacted"] == 1 and compacted["moved"] == 30.0
+    assert main_balance() == 80.0
+    assert all(row["balance"] == 0 for row in mongo_stub.db.account_scope_stripes.rows)
+    assert mongo_stub.db.account_scope_state.find_one({"scopeType": "global"})["balance"] == 820.0
+
+    # Movimientos sueltos: el abono va a un stripe y el descuento no compacta la cuenta.
+    single = dict(year=2025, scope_type="department", scope_id="dep-1", account_code="401010100000", description="", reference=None, created_by="user-1", allow_negative=False)
+    result = AccountScopeService.create_movement(movement_type="debit", amount=20.0, **single)
+    assert result["state"]["balance"] == 100.0
+    assert main_balance() == 80.0
+    transfer = AccountScopeService.transfer_between_accounts(
+        year=2025,
+        from_scope_type="department",
+        from_scope_id="dep-1",
+        to_scope_type="project",
+        to_scope_id="p-1",
+        from_account_code="401010100000",
+        to_account_code="401010200000",
+        amount=15.0,
+        description="",
+        reference=None,
+        created_by="user-1",
+        allow_negative=False,
+    )
+    assert transfer["sourceState"]["balance"] == 85.0
+    assert main_balance() == 80.0
+    assert sum(row["balance"] for row in mongo_stub.db.account_scope_stripes.rows) == 5.0
+    with pytest.raises(ValueError, match="saldo negativo"):
+        AccountScopeService.create_movement(movement_type="credit", amount=90.0, **single)
+    assert main_balance() == 80.0
+
+
+def test_compactar_sin_sesion_devuelve_el_saldo_a_los_stripes_si_falla(mongo_stub, monkeypatch):
+    key = ("department", "dep-1", "401010100000")
+    now = accounting_service._now_utc()
+    for stripe, balance in ((0, 30.0), (1, 20.0)):
+        mongo_stub.db.account_scope_stripes.rows.append(
+            {"_id": accounting_service._stripe_id(2025, key, stripe), "year": 2025, "scopeType": key[0], "scopeId": key[1], "accountCode": key[2], "stripe": stripe, "balance": balance, "movementsCount": 1}
+        )
+    entry = accounting_service.stripe_states(2025, {"scopeType": "department"})[key]
+
+    def failing_update(*args, **kwargs):
+        raise RuntimeError("principal no disponible")
+
+    monkeypatch.setattr(mongo_stub.db.account_scope_state, "update_one", failing_update)
+    with pytest.raises(RuntimeError):
+        accounting_service._compact_key(2025, key, entry, now)
+    assert sorted(row["balance"] for row in mongo_stub.db.account_scope_stripes.rows) == [20.0, 30.0]
+
+
+
+def test_transferencias_concurrentes_en_replica_set_no_sobregiran(mongo_replica_set):
+    db = mongo_replica_set.db
+    for code in ("401010100000", "401010200000"):
+        db.master_accounts.insert_one(
+            {"year": 2025, "code": code, "description": "Cuenta detalle", "group": "EGRESO", "is_header": False, "level": 4, "parent_code": None}
+        )
+    source = {"year": 2025, "scopeType": "department", "scopeId": "dep-1", "accountCode": "401010100000"}
+    db.account_scope_state.insert_one({**source, "balance": 500.0, "movementsCount": 1})
+
+    def transferir(reference_id):
+        try:
+            AccountScopeService.transfer_between_accounts(
+                year=2025,
+                scope_type="department",
+                scope_id="dep-1",
+                from_account_code="401010100000",
+                to_account_code="401010200000",
+                amount=300.0,
+                description="Transferencia concurrente",
+                reference={"kind": "manual", "id": reference_id},
+                created_by="user-1",
+                allow_negative=False,
+            )
+            return True
+        except ValueError:
+            return False
+
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        results = list(pool.map(transferir, ["T-1", "T-2"]))
+
+    # La transferencia rechazada aborta su transacción: no deja ledger ni saldo parcial.
+    assert sorted(results) == [False, True]
+    assert accounting_service._transactions_unsupported is False
+    assert db.account_scope_state.find_one(source)["balance"] == 200.0
+    assert db.account_scope_state.find_one({**source, "accountCode": "401010200000"})["balance"] == 300.0
+    assert db.ledger_movements.count_documents({}) == 2
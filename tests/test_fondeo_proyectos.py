@@ -0,0 +1,847 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from api import create_app
+from api.routes import projects as project_routes
+from api.services import accounting_service
+from api.services.account_catalog_cache import AccountCatalogCache
+from api.services.accounting_service import AccountScopeService
+from api.services.project_funding_service import ProjectFundingService
+
+
+def test_project_funding_summary_legacy_uses_snapshots(mongo_stub):
+    project = {
+        "_id": ObjectId(),
+        "nombre": "Proyecto Legacy",
+        "balance": 125000,
+        "balance_inicial": 150000,
+        "status": {"actual": 1, "completado": []},
+    }
+    mongo_stub.db.proyectos.rows.append(project)
+
+    summary = ProjectFundingService.build_summary(project, year=2025, user={"role": "super_admin"})
+
+    assert summary["model"]["status"] == "legacy"
+    assert summary["model"]["migrationRequired"] is True
+    assert summary["totals"]["currentAvailable"] == 1250.0
+    assert summary["totals"]["initialAssigned"] == 1500.0
+
+
+def test_project_funding_summary_uses_current_available_when_initial_missing(mongo_stub):
+    project = {
+        "_id": ObjectId(),
+        "nombre": "Proyecto Active",
+        "balance": 0,
+        "balance_inicial": 0,
+        "status": {"actual": 1, "completado": []},
+        "fundingModel": {
+            "version": 2,
+            "status": "active",
+            "configuredAt": None,
+            "migratedAt": None,
+            "migratedBy": None,
+            "initialAssignedAmount": 0,
+            "legacyCurrentBalanceSnapshot": None,
+            "legacyInitialBalanceSnapshot": None,
+            "migrationNote": None,
+        },
+    }
+    mongo_stub.db.proyectos.rows.append(project)
+    mongo_stub.db.master_accounts.rows.append(
+        {
+            "year": 2026,
+            "code": "403109900000",
+            "description": "Cuenta detalle",
+            "group": "EGRESO",
+            "is_header": False,
+            "level": 4,
+            "parent_code": "403100000000",
+        }
+    )
+    mongo_stub.db.account_scope_state.rows.append(
+        {
+            "year": 2026,
+            "scopeType": "project",
+            "scopeId": str(project["_id"]),
+            "accountCode": "403109900000",
+            "balance": 300.0,
+            "movementsCount": 1,
+            "lastMovementAt": None,
+        }
+    )
+
+    summary = ProjectFundingService.build_summary(project, year=2026, user={"role": "super_admin"})
+
+    assert summary["totals"]["currentAvailable"] == 300.0
+    assert summary["totals"]["initialAssigned"] == 300.0
+
+
+def test_project_funding_summary_uses_historical_funding_when_initial_missing(mongo_stub):
+    project_id = ObjectId()
+    project = {
+        "_id": project_id,
+        "nombre": "Proyecto Active",
+        "balance": 0,
+        "balance_inicial": 0,
+        "status": {"actual": 1, "completado": []},
+        "fundingModel": {
+            "version": 2,
+            "status": "active",
+            "configuredAt": None,
+            "migratedAt": None,
+            "migratedBy": None,
+            "initialAssignedAmount": 0,
+            "legacyCurrentBalanceSnapshot": None,
+            "legacyInitialBalanceSnapshot": None,
+            "migrationNote": None,
+        },
+    }
+    mongo_stub.db.proyectos.rows.append(project)
+    mongo_stub.db.master_accounts.rows.append(
+        {
+            "year": 2026,
+            "code": "403109900000",
+            "description": "Cuenta detalle",
+            "group": "EGRESO",
+            "is_header": False,
+            "level": 4,
+            "parent_code": "403100000000",
+        }
+    )
+    mongo_stub.db.account_scope_state.rows.append(
+        {
+            "year": 2026,
+            "scopeType": "project",
+            "scopeId": str(project_id),
+            "accountCode": "403109900000",
+            "balance": 200.0,
+            "movementsCount": 2,
+            "lastMovementAt": None,
+        }
+    )
+    mongo_stub.db.ledger_movements.rows.extend(
+        [
+            {
+                "_id": ObjectId(),
+                "year": 2026,
+                "scopeType": "project",
+                "scopeId": str(project_id),
+                "accountCode": "403109900000",
+                "type": "debit",
+                "amount": 300.0,
+                "reference": {"kind": "transfer", "fundingType": "funding"},
+            },
+            {
+                "_id": ObjectId(),
+                "year": 2026,
+                "scopeType": "project",
+                "scopeId": str(project_id),
+                "accountCode": "403109900000",
+                "type": "credit",
+                "amount": 100.0,
+                "reference": {"kind": "project_expense"},
+            },
+        ]
+    )
+
+    summary = ProjectFundingService.build_summary(project, year=2026, user={"role": "super_admin"})
+
+    assert summary["totals"]["currentAvailable"] == 200.0
+    assert summary["totals"]["initialAssigned"] == 300.0
+
+
+def test_decorate_projects_agrupa_estados_en_una_agregacion(mongo_stub, monkeypatch):
+    mongo_stub.db.master_accounts.rows.extend(
+        [
+            {"year": 2026, "code": "403100000000", "description": "Titular", "group": "EGRESO", "is_header": True, "level": 3, "parent_code": None},
+            {"year": 2026, "code": "403109900000", "description": "Detalle", "group": "EGRESO", "is_header": False, "level": 4, "parent_code": "403100000000"},
+        ]
+    )
+
+    active_id, funded_id, legacy_id = ObjectId(), ObjectId(), ObjectId()
+    mongo_stub.db.proyectos.rows.extend(
+        [
+            {"_id": active_id, "nombre": "Activo", "balance": 0, "balance_inicial": 0, "status": {"actual": 1, "completado": []}, "fundingModel": {"version": 2, "status": "active", "initialAssignedAmount": 0}},
+            {"_id": funded_id, "nombre": "Sin estados", "balance": 0, "balance_inicial": 0, "status": {"actual": 1, "completado": []}},
+            {"_id": legacy_id, "nombre": "Legacy", "balance": 50000, "balance_inicial": 80000, "status": {"actual": 1, "completado": [1]}},
+        ]
+    )
+    mongo_stub.db.account_scope_state.rows.extend(
+        [
+            {"year": 2026, "scopeType": "project", "scopeId": str(active_id), "accountCode": "403109900000", "balance": 200.0, "movementsCount": 2, "lastMovementAt": None},
+            {"year": 2026, "scopeType": "project", "scopeId": str(active_id), "accountCode": "403100000000", "balance": 999.0, "movementsCount": 0, "lastMovementAt": None},
+        ]
+    )
+    mongo_stub.db.ledger_movements.rows.append(
+        {"year": 2026, "scopeType": "project", "scopeId": str(active_id), "accountCode": "403109900000", "type": "debit", "amount": 300.0, "reference": {"kind": "transfer"}}
+    )
+
+    aggregations = []
+
+    def fake_aggregate(pipeline):
+        aggregations.append(pipeline)
+        ids = pipeline[0]["$match"]["scopeId"]["$in"]
+        grouped = {}
+        for row in mongo_stub.db.account_scope_state.rows:
+            if row["scopeId"] in ids:
+                grouped.setdefault(row["scopeId"], []).append(
+                    {"accountCode": row["accountCode"], "balance": row["balance"], "lastMovementAt": row.get("lastMovementAt")}
+                )
+        return [{"_id": key, "states": states} for key, states in grouped.items()]
+
+    monkeypatch.setattr(mongo_stub.db.account_scope_state, "aggregate", fake_aggregate)
+
+    projects = [dict(row) for row in mongo_stub.db.proyectos.rows]
+    batch = ProjectFundingService.decorate_projects(projects, year=2026, user={"role": "super_admin"})
+
+    assert len(aggregations) == 1
+    assert [item["balance"] for item in batch] == [200.0, 0.0, 500.0]
+    assert [item["balance_inicial"] for item in batch] == [300.0, 0.0, 800.0]
+    assert batch[2]["fundingSummary"]["model"]["migrationRequired"] is True
+
+    stored = {row["_id"]: row for row in mongo_stub.db.proyectos.rows}
+    assert all("fundingTotals" not in row for row in stored.values())
+    assert "fundingModel" not in stored[funded_id]
+
+    for item in batch:
+        single = ProjectFundingService.decorate_project(stored[item["_id"]], year=2026, user={"role": "super_admin"})
+        assert single["fundingSummary"]["totals"] == item["fundingSummary"]["totals"]
+    assert "fundingModel" not in stored[funded_id]
+
+
+def test_backfill_funding_models_por_lotes_y_reanudable(mongo_stub, monkeypatch):
+    monkeypatch.setattr(mongo_stub.db.account_scope_state, "aggregate", lambda pipeline: [])
+    ids = sorted(ObjectId() for _ in range(5))
+    for index, project_id in enumerate(ids):
+        row = {"_id": project_id, "nombre": f"P{index}", "balance": 0, "balance_inicial": 0}
+        if index == 3:
+            row.update({"balance": 1000, "balance_inicial": 1000})
+        mongo_stub.db.proyectos.rows.append(row)
+
+    original_bulk_write = mongo_stub.db.proyectos.bulk_write
+    calls = []
+
+    def failing_bulk_write(ops, ordered=False, session=None):
+        calls.append(len(ops))
+        if len(calls) == 2:
+            raise RuntimeError("corte")
+        return original_bulk_write(ops, ordered=ordered, session=session)
+
+    monkeypatch.setattr(mongo_stub.db.proyectos, "bulk_write", failing_bulk_write)
+    with pytest.raises(RuntimeError):
+        ProjectFundingService.backfill_funding_models(year=2026, batch_size=2)
+
+    job = mongo_stub.db.accounting_jobs.find_one({"_id": "funding_backfill:2026"})
+    assert (job["status"], job["lastId"], job["processed"]) == ("failed", ids[1], 2)
+
+    result = ProjectFundingService.backfill_funding_models(year=2026, batch_size=2)
+    assert result["processed"] == 5
+    assert calls == [2, 2, 2, 1]
+
+    stored = {row["_id"]: row for row in mongo_stub.db.proyectos.rows}
+    assert stored[ids[3]]["fundingModel"]["status"] == "legacy"
+    assert "fundingTotals" not in stored[ids[3]]
+    assert all(stored[pid]["fundingTotals"]["2026"]["rebuiltAt"] for pid in ids if pid != ids[3])
+    assert mongo_stub.db.accounting_jobs.find_one({"_id": "funding_backfill:2026"})["status"] == "done"
+
+
+def test_allocate_funds_updates_project_and_states(mongo_stub, monkeypatch):
+    for code in ("401010100000", "401010200000"):
+        mongo_stub.db.master_accounts.rows.append(
+            {
+                "year": 2025,
+                "code": code,
+                "description": "Cuenta detalle",
+                "group": "EGRESO",
+                "is_header": False,
+                "level": 4,
+                "parent_code": "401010000000",
+            }
+        )
+
+    project_id = ObjectId()
+    department_id = ObjectId()
+    project = {
+        "_id": project_id,
+        "nombre": "Proyecto Funding",
+        "departamento_id": department_id,
+        "balance": 0,
+        "balance_inicial": 0,
+        "status": {"actual": 1, "completado": []},
+        "fundingModel": {
+            "version": 2,
+            "status": "active",
+            "configuredAt": None,
+            "migratedAt": None,
+            "migratedBy": None,
+            "initialAssignedAmount": 0,
+            "legacyCurrentBalanceSnapshot": None,
+            "legacyInitialBalanceSnapshot": None,
+            "migrationNote": None,
+        },
+    }
+    mongo_stub.db.proyectos.rows.append(project)
+    mongo_stub.db.account_scope_state.rows.append(
+        {
+            "year": 2025,
+            "scopeType": "department",
+            "scopeId": str(department_id),
+            "accountCode": "401010100000",
+            "balance": 500.0,
+            "movementsCount": 1,
+        }
+    )
+
+    allocate = dict(
+        year=2025,
+        source_scope_type="department",
+        source_scope_id=str(department_id),
+        allocations=[
+            {
+                "fromAccountCode": "401010100000",
+                "toAccountCode": "401010200000",
+                "amount": 250.0,
+                "description": "Asignacion inicial",
+            }
+        ],
+        user={"sub": "user-1", "nombre": "Admin", "role": "admin_departamento", "departmentId": str(department_id)},
+        allow_negative=False,
+    )
+
+    # Si el ledger falla, el modelo y el paso del proyecto tampoco se escriben.
+    def failing_insert(docs, session=None):
+        raise RuntimeError("ledger no disponible")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(mongo_stub.db.ledger_movements, "insert_many", failing_insert)
+        with pytest.raises(RuntimeError):
+            ProjectFundingService.allocate_funds(project, **allocate)
+    stored = mongo_stub.db.proyectos.find_one({"_id": project_id})
+    assert stored["fundingModel"]["initialAssignedAmount"] == 0
+    assert stored["status"]["completado"] == []
+
+    result = ProjectFundingService.allocate_funds(project, **allocate)
+
+    assert result["fundingSummary"]["totals"]["currentAvailable"] == 250.0
+    assert result["fundingSummary"]["totals"]["initialAssigned"] == 250.0
+    updated_project = mongo_stub.db.proyectos.find_one({"_id": project_id})
+    assert updated_project["fundingModel"]["initialAssignedAmount"] == 25000
+    assert 1 in updated_project["status"]["completado"]
+
+    # Una cuenta titular global tampoco puede ser origen de fondos.
+    mongo_stub.db.master_accounts.rows.append(
+        {"year": 2025, "code": "401010000000", "description": "Titular", "group": "EGRESO", "is_header": True, "level": 3, "parent_code": None}
+    )
+    AccountCatalogCache.clear()
+    mongo_stub.db.account_scope_state.rows.append(
+        {"year": 2025, "scopeType": "global", "scopeId": "global", "accountCode": "401010000000", "balance": 900.0, "movementsCount": 1}
+    )
+    ledger_before = len(mongo_stub.db.ledger_movements.rows)
+    with pytest.raises(ValueError, match="cuentas titular"):
+        ProjectFundingService.allocate_funds(
+            project,
+            **{
+                **allocate,
+                "source_scope_type": "global",
+                "source_scope_id": "global",
+                "allocations": [{"fromAccountCode": "401010000000", "toAccountCode": "401010200000", "amount": 50.0}],
+                "user": {"sub": "root", "nombre": "Root", "role": "super_admin"},
+            },
+        )
+    assert len(mongo_stub.db.ledger_movements.rows) == ledger_before
+    assert mongo_stub.db.account_scope_state.find_one({"scopeType": "global", "accountCode": "401010000000"})["balance"] == 900.0
+
+
+def _states_grouped_by_scope(collection):
+    """Emula la agregación ``$group`` por ``scopeId`` de ``_batch_state_summaries``."""
+
+    def aggregate(pipeline, session=None):
+        ids = pipeline[0]["$match"]["scopeId"]["$in"]
+        grouped = {}
+        for row in collection.rows:
+            if row["scopeType"] == "project" and row["scopeId"] in ids:
+                grouped.setdefault(row["scopeId"], []).append(
+                    {"accountCode": row["accountCode"], "balance": row["balance"], "lastMovementAt": row.get("lastMovementAt")}
+                )
+        return [{"_id": key, "states": states} for key, states in grouped.items()]
+
+    return aggregate
+
+
+def test_allocate_funds_bulk_varios_proyectos_en_un_lote(mongo_stub, monkeypatch):
+    for code in ("401010100000", "401010200000"):
+        mongo_stub.db.master_accounts.rows.append(
+            {"year": 2025, "code": code, "description": "Cuenta", "group": "EGRESO", "is_header": False, "level": 4, "parent_code": None}
+        )
+    department_id = ObjectId()
+    projects = []
+    for name in ("Uno", "Dos"):
+        project = {"_id": ObjectId(), "nombre": name, "departamento_id": department_id, "status": {"actual": 1, "completado": []}}
+        mongo_stub.db.proyectos.rows.append(project)
+        projects.append(project)
+    mongo_stub.db.account_scope_state.rows.append(
+        {"year": 2025, "scopeType": "department", "scopeId": str(department_id), "accountCode": "401010100000", "balance": 500.0, "movementsCount": 1}
+    )
+    monkeypatch.setattr(
+        mongo_stub.db.account_scope_state, "aggregate", _states_grouped_by_scope(mongo_stub.db.account_scope_state)
+    )
+    user = {"sub": "user-1", "nombre": "Admin", "role": "admin_departamento", "departmentId": str(department_id)}
+
+    def allocations(first, second):
+        return {
+            str(projects[0]["_id"]): [{"fromAccountCode": "401010100000", "toAccountCode": "401010200000", "amount": first}],
+            str(projects[1]["_id"]): [{"fromAccountCode": "401010100000", "toAccountCode": "401010200000", "amount": second}],
+        }
+
+    with pytest.raises(ValueError, match="Saldo insuficiente en la cuenta origen 401010100000"):
+        ProjectFundingService.allocate_funds_bulk(
+            [dict(p) for p in projects],
+            year=2025,
+            source_scope_type="department",
+            source_scope_id=str(department_id),
+            allocations_by_project=allocations(300.0, 300.0),
+            user=user,
+            allow_negative=False,
+        )
+    assert mongo_stub.db.ledger_movements.rows == []
+    assert mongo_stub.db.logs.rows == []
+
+    result = ProjectFundingService.allocate_funds_bulk(
+        [dict(p) for p in projects],
+        year=2025,
+        source_scope_type="department",
+        source_scope_id=str(department_id),
+        allocations_by_project=allocations(200.0, 250.0),
+        user=user,
+        allow_negative=False,
+    )
+
+    assert [item["fundingSummary"]["totals"]["currentAvailable"] for item in result["projects"]] == [200.0, 250.0]
+    assert len(mongo_stub.db.ledger_movements.rows) == 4
+    assert len({row["batchId"] for row in mongo_stub.db.ledger_movements.rows}) == 1
+    source = mongo_stub.db.account_scope_state.find_one({"scopeType": "department", "accountCode": "401010100000"})
+    assert source["balance"] == 50.0
+    # Los logs se escriben en la misma transaccion que el lote, uno por partida.
+    assert len(mongo_stub.db.logs.rows) == 2
+    stored = mongo_stub.db.proyectos.find_one({"_id": projects[1]["_id"]})
+    assert stored["fundingModel"]["initialAssignedAmount"] == 25000
+    assert 1 in stored["status"]["completado"]
+
+
+def test_funding_totals_materializados_se_mantienen_con_cada_movimiento(mongo_stub):
+    for code in ("401010100000", "401010200000", "401010300000"):
+        mongo_stub.db.master_accounts.rows.append(
+            {"year": 2025, "code": code, "description": "Cuenta", "group": "EGRESO", "is_header": False, "level": 4, "parent_code": None}
+        )
+    project_id = ObjectId()
+    department_id = ObjectId()
+    mongo_stub.db.proyectos.rows.append(
+        {
+            "_id": project_id,
+            "nombre": "Proyecto",
+            "departamento_id": department_id,
+            "status": {"actual": 1, "completado": [1]},
+            "fundingModel": {"version": 2, "status": "active", "initialAssignedAmount": 0},
+        }
+    )
+    mongo_stub.db.account_scope_state.rows.append(
+        {"year": 2025, "scopeType": "department", "scopeId": str(department_id), "accountCode": "401010100000", "balance": 900.0, "movementsCount": 1}
+    )
+
+    project = mongo_stub.db.proyectos.find_one({"_id": project_id})
+    baseline = ProjectFundingService.rebuild_funding_totals(project, year=2025)
+    assert baseline["currentAvailable"] == 0
+
+    user = {"sub": "user-1", "nombre": "Admin", "role": "super_admin"}
+    ProjectFundingService.allocate_funds(
+        project,
+        year=2025,
+        source_scope_type="department",
+        source_scope_id=str(department_id),
+        allocations=[
+            {"fromAccountCode": "401010100000", "toAccountCode": "401010200000", "amount": 300.0},
+            {"fromAccountCode": "401010100000", "toAccountCode": "401010300000", "amount": 100.0},
+        ],
+        user=user,
+        allow_negative=False,
+    )
+    ProjectFundingService.consume_project_account(
+        mongo_stub.db.proyectos.find_one({"_id": project_id}),
+        year=2025,
+        account_code="401010300000",
+        amount=100.0,
+        user=user,
+        description="Consumo",
+        reference=None,
+        allow_negative=False,
+        log_message="consumo",
+    )
+    # El log del consumo va en la transacción del movimiento, no en el buffer del request.
+    assert mongo_stub.db.logs.rows[-1]["mensaje"] == "consumo"
+
+    project = mongo_stub.db.proyectos.find_one({"_id": project_id})
+    materialized = project["fundingTotals"]["2025"]
+    assert materialized["rebuiltAt"] == baseline["rebuiltAt"]
+    assert materialized["currentAvailable"] == 300.0
+    assert materialized["fundedAccountsCount"] == 1
+    assert materialized["fundingDebits"] == 400.0
+
+    totals = ProjectFundingService.build_summary(project, year=2025)["totals"]
+    assert totals["currentAvailable"] == 300.0
+    assert totals["fundedAccountsCount"] == 1
+
+    rebuilt = ProjectFundingService.rebuild_funding_totals(project, year=2025)
+    assert (rebuilt["currentAvailable"], rebuilt["fundedAccountsCount"], rebuilt["fundingDebits"]) == (300.0, 1, 400.0)
+
+
+def test_funded_accounts_count_sale_del_post_image_no_de_la_lectura_previa(mongo_stub):
+    project_id = ObjectId()
+    mongo_stub.db.proyectos.rows.append(
+        {"_id": project_id, "fundingTotals": {"2025": {"rebuiltAt": datetime(2025, 1, 1, tzinfo=timezone.utc), "fundedAccountsCount": 1, "currentAvailable": 50.0}}}
+    )
+    # Otro proceso ya fondeó la cuenta después de la lectura de saldos (que la vio en 0).
+    mongo_stub.db.account_scope_state.rows.append(
+        {"year": 2025, "scopeType": "project", "scopeId": str(project_id), "accountCode": "401010100000", "balance": 50.0, "movementsCount": 1}
+    )
+    key = ("project", str(project_id), "401010100000")
+    item = {"scopeType": key[0], "scopeId": key[1], "accountCode": key[2], "type": "debit", "amount": 20.0, "delta": 20.0, "description": "", "reference": {}}
+
+    accounting_service._persist_movements(2025, [item], {key: 0.0}, created_by="user-1", allow_negative=False, tag={})
+
+    totals = mongo_stub.db.proyectos.find_one({"_id": project_id})["fundingTotals"]["2025"]
+    assert totals["fundedAccountsCount"] == 1
+    assert totals["currentAvailable"] == 70.0
+
+
+def test_migration_requires_exact_total_and_activates_project(mongo_stub):
+    for code in ("401010100000", "401010200000"):
+        mongo_stub.db.master_accounts.rows.append(
+            {
+                "year": 2025,
+                "code": code,
+                "description": "Cuenta detalle",
+                "group": "EGRESO",
+                "is_header": False,
+                "level": 4,
+                "parent_code": "401010000000",
+            }
+        )
+
+    project_id = ObjectId()
+    department_id = ObjectId()
+    project = {
+        "_id": project_id,
+        "nombre": "Proyecto Migracion",
+        "departamento_id": department_id,
+        "balance": 100000,
+        "balance_inicial": 120000,
+        "status": {"actual": 1, "completado": []},
+        "fundingModel": {
+            "version": 2,
+            "status": "legacy",
+            "configuredAt": None,
+            "migratedAt": None,
+            "migratedBy": None,
+            "initialAssignedAmount": 0,
+            "legacyCurrentBalanceSnapshot": 100000,
+            "legacyInitialBalanceSnapshot": 120000,
+            "migrationNote": None,
+        },
+    }
+    mongo_stub.db.proyectos.rows.append(project)
+    mongo_stub.db.account_scope_state.rows.append(
+        {
+            "year": 2025,
+            "scopeType": "department",
+            "scopeId": str(department_id),
+            "accountCode": "401010100000",
+            "balance": 1200.0,
+            "movementsCount": 1,
+        }
+    )
+
+    result = ProjectFundingService.allocate_funds(
+        project,
+        year=2025,
+        source_scope_type="department",
+        source_scope_id=str(department_id),
+        allocations=[
+            {
+                "fromAccountCode": "401010100000",
+                "toAccountCode": "401010200000",
+                "amount": 1000.0,
+                "description": "Migracion saldo legacy",
+            }
+        ],
+        user={"sub": "user-1", "nombre": "Admin", "role": "admin_departamento", "departmentId": str(department_id)},
+        allow_negative=False,
+        migration=True,
+        note="Migracion manual",
+    )
+
+    updated_project = mongo_stub.db.proyectos.find_one({"_id": project_id})
+    assert updated_project["fundingModel"]["status"] == "active"
+    assert updated_project["fundingModel"]["initialAssignedAmount"] == 120000
+    assert result["fundingSummary"]["totals"]["currentAvailable"] == 1000.0
+
+
+def test_build_timeline_merges_ledger_and_legacy(mongo_stub):
+    project_id = ObjectId()
+    project = {
+        "_id": project_id,
+        "nombre": "Proyecto Timeline",
+        "balance": 50000,
+        "balance_inicial": 50000,
+        "status": {"actual": 1, "completado": []},
+        "fundingModel": {
+            "version": 2,
+            "status": "legacy",
+            "configuredAt": None,
+            "migratedAt": None,
+            "migratedBy": None,
+            "initialAssignedAmount": 0,
+            "legacyCurrentBalanceSnapshot": 50000,
+            "legacyInitialBalanceSnapshot": 50000,
+            "migrationNote": None,
+        },
+    }
+    mongo_stub.db.proyectos.rows.append(project)
+    mongo_stub.db.ledger_movements.rows.append(
+        {
+            "_id": ObjectId(),
+            "year": 2025,
+            "scopeType": "project",
+            "scopeId": str(project_id),
+            "accountCode": "401010200000",
+            "type": "debit",
+            "amount": 100.0,
+            "description": "Asignacion",
+            "reference": {"kind": "transfer", "fundingType": "funding", "title": "Asignación de fondos", "actorName": "Admin"},
+            "createdAt": datetime(2025, 1, 10, tzinfo=timezone.utc),
+        }
+    )
+    mongo_stub.db.acciones.rows.append(
+        {
+            "_id": ObjectId(),
+            "project_id": project_id,
+            "user": "Legacy User",
+            "type": "Fondeo",
+            "amount": 50000,
+            "total_amount": 50000,
+            "created_at": datetime(2025, 1, 1),
+        }
+    )
+
+    timeline = ProjectFundingService.build_timeline(project, year=2025)
+
+    assert {item["source"] for item in timeline} == {"ledger", "legacy_action"}
+    assert any(item["type"] == "funding" for item in timeline)
+
+
+def test_report_payload_agrupa_saldo_por_periodo_y_egresos_por_tipo(mongo_stub):
+    project_id = ObjectId()
+    mongo_stub.db.proyectos.rows.append(
+        {
+            "_id": project_id,
+            "nombre": "Proyecto Reporte",
+            "status": {"actual": 1, "completado": [1]},
+            "fundingModel": {"version": 2, "status": "active", "initialAssignedAmount": 100000},
+        }
+    )
+
+    def movement(day, movement_type, amount, reference):
+        mongo_stub.db.ledger_movements.rows.append(
+            {
+                "_id": ObjectId(),
+                "year": 2025,
+                "scopeType": "project",
+                "scopeId": str(project_id),
+                "accountCode": "401010200000",
+                "type": movement_type,
+                "amount": amount,
+                "reference": reference,
+                "createdAt": datetime(2025, 1, 1, tzinfo=timezone.utc) + timedelta(days=day),
+            }
+        )
+
+    movement(0, "debit", 1000.0, {"kind": "transfer", "fundingType": "funding"})
+    movement(1, "credit", 100.0, {"kind": "fixed_rule"})
+    movement(2, "credit", 50.0, {"kind": "project_expense"})
+    movement(9, "credit", 25.0, {"kind": "project_expense"})
+    movement(150, "credit", 10.0, {})
+
+    payload = ProjectFundingService.report_payload({"_id": project_id}, year=2025)
+
+    assert payload["balance_bucket"] == "week"
+    assert payload["balance_history"] == [
+        {"fecha": "2024-12-30", "saldo": 850.0},
+        {"fecha": "2025-01-06", "saldo": 825.0},
+        {"fecha": "2025-05-26", "saldo": 815.0},
+    ]
+    assert payload["egresos_tipo"] == [
+        {"tipo": "Actividades", "monto": 75.0},
+        {"tipo": "Reglas fijas", "monto": 100.0},
+        {"tipo": "Ajustes", "monto": 10.0},
+    ]
+    assert payload["resumen"]["ingresos"] == 1000.0
+    assert payload["resumen"]["egresos"] == 185.0
+
+
+def test_timeline_sellado_en_escritura_y_paginado_por_cursor(mongo_stub):
+    mongo_stub.db.master_accounts.rows.append(
+        {"year": 2025, "code": "401010200000", "description": "Cuenta", "group": "EGRESO", "is_header": False, "level": 4, "parent_code": None}
+    )
+    project_id = ObjectId()
+    project = {"_id": project_id, "nombre": "Proyecto", "status": {"actual": 1, "completado": [1]}, "fundingModel": {"version": 2, "status": "active"}}
+    mongo_stub.db.proyectos.rows.append(project)
+
+    for movement_type, amount, reference in (
+        ("debit", 100.0, {"kind": "transfer", "fundingType": "funding"}),
+        ("credit", 30.0, {"kind": "project_expense"}),
+        ("debit", 50.0, {}),
+    ):
+        AccountScopeService.create_movement(
+            year=2025,
+            scope_type="project",
+            scope_id=str(project_id),
+            account_code="401010200000",
+            movement_type=movement_type,
+            amount=amount,
+            description="",
+            reference=reference,
+            created_by="u1",
+            allow_negative=False,
+        )
+
+    rows = mongo_stub.db.ledger_movements.rows
+    assert [row["projectBalanceAfter"] for row in rows] == [100.0, 70.0, 120.0]
+    assert [row["eventType"] for row in rows] == ["funding", "expense", "funding"]
+    assert ProjectFundingService.timeline_is_stamped(str(project_id), year=2025)
+
+    first = ProjectFundingService.timeline_response(project, year=2025, limit=2)
+    assert [item["projectBalanceAfter"] for item in first["request_list"]] == [120.0, 70.0]
+    assert first["hasMore"] is True and first["count"] == 3
+    second = ProjectFundingService.timeline_response(project, year=2025, limit=2, cursor=first["nextCursor"])
+    assert [item["projectBalanceAfter"] for item in second["request_list"]] == [100.0]
+    assert second["hasMore"] is False and second["nextCursor"] is None and "count" not in second
+
+    full = ProjectFundingService.build_timeline(project, year=2025)
+    assert [item["projectBalanceAfter"] for item in full] == [120.0, 70.0, 100.0]
+
+    with pytest.raises(ValueError):
+        ProjectFundingService.timeline_response(project, year=2025, cursor="no-es-un-cursor")
+
+
+def test_stamp_project_timeline_sella_historial_previo(mongo_stub):
+    project_id = str(ObjectId())
+    for day, movement_type, amount in ((1, "debit", 200.0), (2, "credit", 50.0)):
+        mongo_stub.db.ledger_movements.rows.append(
+            {
+                "_id": ObjectId(),
+                "year": 2025,
+                "scopeType": "project",
+                "scopeId": project_id,
+                "accountCode": "401010200000",
+                "type": movement_type,
+                "amount": amount,
+                "reference": {},
+                "createdAt": datetime(2025, 1, day, tzinfo=timezone.utc),
+            }
+        )
+    assert not ProjectFundingService.timeline_is_stamped(project_id, year=2025)
+
+    result = AccountScopeService.stamp_project_timeline(2025, project_id)
+
+    assert result["stamped"] == 2 and result["balance"] == 150.0
+    assert [row["projectBalanceAfter"] for row in mongo_stub.db.ledger_movements.rows] == [200.0, 150.0]
+    assert [row["eventType"] for row in mongo_stub.db.ledger_movements.rows] == ["funding", "adjustment"]
+    assert ProjectFundingService.timeline_is_stamped(project_id, year=2025)
+
+
+def test_migrate_legacy_actions_pasa_acciones_al_ledger(mongo_stub, monkeypatch):
+    project_id = ObjectId()
+    project = {
+        "_id": project_id,
+        "nombre": "Proyecto Legacy",
+        "balance": 30000,
+        "balance_inicial": 50000,
+        "status": {"actual": 1, "completado": [1]},
+        "fundingModel": {"version": 2, "status": "legacy", "legacyCurrentBalanceSnapshot": 30000, "legacyInitialBalanceSnapshot": 50000},
+    }
+    mongo_stub.db.proyectos.rows.append(project)
+    mongo_stub.db.acciones.rows.extend(
+        [
+            {"_id": ObjectId(), "project_id": project_id, "user": "Ana", "type": "Fondeo", "amount": 50000, "total_amount": 50000, "created_at": datetime(2024, 3, 1)},
+            {"_id": ObjectId(), "proyecto_id": project_id, "user": "Ana", "type": "Retiro actividad", "amount": -20000, "total_amount": 30000, "created_at": datetime(2024, 4, 1)},
+        ]
+    )
+    before = ProjectFundingService.build_timeline(project, year=2025)
+    funding_before = ProjectFundingService._legacy_funding_total(project_id)
+
+    result = ProjectFundingService.migrate_legacy_actions(workers=2, batch_size=1)
+    assert (result["done"], result["failed"], result["migrated"]) == (1, 0, 2)
+
+    stored = mongo_stub.db.proyectos.find_one({"_id": project_id})
+    assert stored["legacyLedger"]["status"] == "done"
+    ledger = mongo_stub.db.ledger_movements.rows
+    assert [(row["type"], row["amount"], row["source"]) for row in ledger] == [("debit", 500.0, "legacy_action"), ("credit", 200.0, "legacy_action")]
+
+    def _no_acciones(*args, **kwargs):
+        raise AssertionError("acciones no debe consultarse tras la migracion")
+
+    monkeypatch.setattr(mongo_stub.db.acciones, "find", _no_acciones)
+    after = ProjectFundingService.build_timeline(stored, year=2025)
+    fields = ("id", "type", "amount", "projectBalanceAfter", "title", "source")
+    assert [{k: item[k] for k in fields} for item in after] == [{k: item[k] for k in fields} for item in before]
+    assert ProjectFundingService._legacy_funding_total(project_id, migrated=True) == funding_before == 500.0
+
+    again = ProjectFundingService.migrate_legacy_actions(project_ids=[project_id])
+    assert again["results"][0]["skipped"] is True
+    assert len(mongo_stub.db.ledger_movements.rows) == 2
+
+
+def test_descargar_movimientos_exporta_timeline_json(mongo_stub, monkeypatch):
+    monkeypatch.setattr(project_routes, "ProjectFundingService", ProjectFundingService)
+
+    project_id = ObjectId()
+    project = {
+        "_id": project_id,
+        "nombre": "Proyecto Export",
+        "balance": 0,
+        "balance_inicial": 0,
+        "status": {"actual": 1, "completado": []},
+    }
+    mongo_stub.db.proyectos.rows.append(project)
+
+    monkeypatch.setattr(
+        project_routes.ProjectFundingService,
+        "build_timeline",
+        lambda *_args, **_kwargs: [
+            {
+                "id": "mov-1",
+                "occurredAt": datetime(2025, 1, 1, tzinfo=timezone.utc),
+                "type": "funding",
+                "source": "ledger",
+                "title": "Asignación de fondos",
+                "description": "Linea 1",
+                "amount": 100.0,
+                "projectBalanceAfter": 100.0,
+                "accountCode": "401010200000",
+                "actorName": "Admin",
+                "reference": {},
+            }
+        ],
+    )
+
+    app = create_app()
+    with app.test_request_context(f"/proyecto/{project_id}/movimientos/descargar?formato=json"):
+        response = project_routes.descargar_movimientos.__wrapped__.__wrapped__({"role": "super_admin"}, str(project_id))
+
+    response.direct_passthrough = False
+    payload = response.get_data(as_text=True)
+    assert "Asignación de fondos" in payload
+    assert "projectBalanceAfter" in payload
+    assert 'filename=timeline_movimientos.json' in response.headers.get("Content-Disposition", "")
+
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+from bson import ObjectId
+
+from api import create_app
+from api.util import common
+from api.services.audit_log_service import AuditLogService
+
+
+def test_agregar_log_acumula_por_request_y_escribe_un_insert_many(mongo_stub, monkeypatch, caplog):
+    inserts = []
+    original_insert_many = mongo_stub.db.logs.insert_many
+
+    def _counting_insert_many(docs, session=None, ordered=True):
+        inserts.append(len(docs))
+        return original_insert_many(docs, session=session)
+
+    monkeypatch.setattr(mongo_stub.db.logs, "insert_many", _counting_insert_many)
+    project_id = ObjectId()
+
+    app = create_app()
+    with app.test_request_context("/"):
+        for mensaje in ("uno", "dos", "tres"):
+            common.agregar_log(project_id, mensaje)
+        assert mongo_stub.db.logs.rows == []
+    assert inserts == [3]
+    assert [row["mensaje"] for row in mongo_stub.db.logs.rows] == ["uno", "dos", "tres"]
+
+    # Un request que termina con excepcion igual escribe los logs de lo que ya hizo.
+    with pytest.raises(RuntimeError):
+        with app.test_request_context("/"):
+            common.agregar_log(project_id, "antes de fallar")
+            raise RuntimeError("falla")
+    assert inserts == [3, 1]
+
+    # Si el insert falla, se reintenta y los logs quedan en el log de la app, sin 500.
+    @app.route("/_log_prueba")
+    def _log_prueba():
+        common.agregar_log(project_id, "con respuesta")
+        return "ok"
+
+    assert app.test_client().get("/_log_prueba").status_code == 200
+    assert inserts == [3, 1, 1]
+
+    def _failing_insert_many(docs, session=None, ordered=True):
+        raise RuntimeError("logs no disponibles")
+
+    monkeypatch.setattr(mongo_stub.db.logs, "insert_many", _failing_insert_many)
+    assert app.test_client().get("/_log_prueba").status_code == 200
+    assert "log de auditoria no escrito" in caplog.text and "con respuesta" in caplog.text
+    monkeypatch.setattr(mongo_stub.db.logs, "insert_many", _counting_insert_many)
+
+    # Fuera de un request se escriben en el acto.
+    common.agregar_log(project_id, "script 1")
+    assert inserts == [3, 1, 1, 1]
+    assert mongo_stub.db.logs.rows[-1]["mensaje"] == "script 1"
+
+
+def test_logs_archivados_se_comprimen_y_la_paginacion_sigue_en_el_archivo(mongo_stub):
+    finished, active = ObjectId(), ObjectId()
+    mongo_stub.db.proyectos.rows.extend(
+        [{"_id": finished, "status": {"finished": True}}, {"_id": active, "status": {"finished": False}}]
+    )
+    now = datetime(2026, 6, 1, tzinfo=timezone.utc)
+    for project_id in (finished, active):
+        for day in range(5):
+            mongo_stub.db.logs.rows.append(
+                {
+                    "_id": ObjectId(),
+                    "id_proyecto": project_id,
+                    "fecha_creacion": datetime(2025, 1, 1 + day, tzinfo=timezone.utc),
+                    "mensaje": f"viejo {day}",
+                }
+            )
+        mongo_stub.db.logs.rows.append(
+            {"_id": ObjectId(), "id_proyecto": project_id, "fecha_creacion": now - timedelta(days=1), "mensaje": "reciente"}
+        )
+
+    result = AuditLogService.archive_finished_projects(months=12, batch_size=2, now=now)
+    assert (result["projects"], result["moved"], result["chunks"]) == (1, 5, 3)
+    assert [row["mensaje"] for row in mongo_stub.db.logs.rows if row["id_proyecto"] == finished] == ["reciente"]
+    assert len([row for row in mongo_stub.db.logs.rows if row["id_proyecto"] == active]) == 6
+    assert all(chunk["codec"] == "bson+zlib" for chunk in mongo_stub.db.logs_archive.rows)
+
+    # Re-ejecutar no mueve nada mas ni duplica bloques.
+    AuditLogService.archive_finished_projects(months=12, batch_size=2, now=now)
+    assert len(mongo_stub.db.logs_archive.rows) == 3
+    assert AuditLogService.count(finished) == 6
+
+    seen = []
+    cursor = None
+    while True:
+        page = AuditLogService.page(finished, limit=4, cursor=cursor)
+        seen.extend(row["mensaje"] for row in page["rows"])
+        if not page["hasMore"]:
+            break
+        cursor = page["nextCursor"]
+    assert seen == ["reciente", "viejo 4", "viejo 3", "viejo 2", "viejo 1", "viejo 0"]
+    assert [row["mensaje"] for row in AuditLogService.project_logs(finished)] == [
+        "viejo 0", "viejo 1", "viejo 2", "viejo 3", "viejo 4", "reciente"
+    ]
+
+    with pytest.raises(ValueError, match="cursor"):
+        AuditLogService.page(finished, cursor="no-valido")
+
+    # Logs antiguos solo con ``proyecto_id`` siguen apareciendo mientras no se normalicen.
+    mongo_stub.db.logs.rows.append(
+        {"_id": ObjectId(), "proyecto_id": active, "fecha_creacion": datetime(2024, 12, 1, tzinfo=timezone.utc), "mensaje": "legacy"}
+    )
+    assert AuditLogService.count(active) == 7
+    assert AuditLogService.project_logs(active)[0]["mensaje"] == "legacy"
+    assert AuditLogService.page(active, limit=10)["rows"][-1]["mensaje"] == "legacy"
+
@@ -0,0 +1,214 @@
+from bson import ObjectId
+from pymongo.errors import OperationFailure
+
+from api import create_app
+from api.routes import projects as project_routes
+from api.services import unit_of_work
+from api.services.project_members_service import ProjectMembersService
+
+
+def test_unit_of_work_deduplica_lecturas_por_request(mongo_stub, monkeypatch):
+    project_id = ObjectId()
+    mongo_stub.db.proyectos.rows.append({"_id": project_id, "nombre": "Proyecto UoW", "status": {"actual": 1, "completado": []}})
+
+    finds = []
+    original_find_one = mongo_stub.db.proyectos.find_one
+
+    def _counting_find_one(query, projection=None):
+        finds.append(query)
+        return original_find_one(query, projection)
+
+    monkeypatch.setattr(mongo_stub.db.proyectos, "find_one", _counting_find_one)
+
+    app = create_app()
+    with app.test_request_context("/"):
+        first = unit_of_work.load_project(project_id)
+        assert unit_of_work.load_project(project_id) is first
+        assert len(finds) == 1
+
+        unit_of_work.apply_set(first, "fundingModel.status", "active")
+        assert first["fundingModel"] == {"status": "active"}
+
+        # Un refresh relee Mongo y reemplaza la copia del request.
+        mongo_stub.db.proyectos.rows[0]["status"] = {"actual": 2, "completado": [1]}
+        refreshed = unit_of_work.load_project(project_id, refresh=True)
+        assert refreshed["status"]["actual"] == 2
+        assert unit_of_work.load_project(project_id) is refreshed
+        assert len(finds) == 2
+
+    # Fuera de un request se lee directo.
+    assert unit_of_work.load_project(project_id)["nombre"] == "Proyecto UoW"
+    assert len(finds) == 3
+
+
+def test_mostrar_proyectos_modo_listado_pagina_por_cursor(mongo_stub):
+    department_id = ObjectId()
+    project_ids = [ObjectId() for _ in range(3)]
+    for index, project_id in enumerate(project_ids):
+        mongo_stub.db.proyectos.rows.append(
+            {
+                "_id": project_id,
+                "nombre": f"Proyecto {index}",
+                "departamento_id": department_id,
+                "status": {"actual": 1, "completado": []},
+                "balance": 0,
+                "balance_inicial": 0,
+                "miembros": [{"usuario": {"nombre": "Miembro", "email": "m@example.com"}}],
+                "user": {"sub": "creador", "nombre": "Creador"},
+            }
+        )
+    mongo_stub.db.proyectos.rows.append({"_id": ObjectId(), "nombre": "Otro", "departamento_id": ObjectId(), "balance": 0})
+
+    user = {"sub": str(ObjectId()), "nombre": "Admin", "role": "admin_departamento", "departmentId": str(department_id)}
+    listar = project_routes.mostrar_proyectos.__wrapped__.__wrapped__
+    app = create_app()
+    with app.test_request_context("/mostrar_proyectos?view=list&limit=2"):
+        first = listar(user).get_json()
+    assert [row["nombre"] for row in first["request_list"]] == ["Proyecto 2", "Proyecto 1"]
+    assert all("miembros" not in row and "user" not in row for row in first["request_list"])
+    assert first["count"] == 3
+    assert first["hasMore"] is True
+
+    with app.test_request_context(f"/mostrar_proyectos?limit=2&cursor={first['nextCursor']}"):
+        second = listar(user).get_json()
+    assert [row["nombre"] for row in second["request_list"]] == ["Proyecto 0"]
+    assert second["hasMore"] is False
+    assert second["nextCursor"] is None
+    assert second["count"] is None
+
+    with app.test_request_context("/mostrar_proyectos?cursor=no-valido"):
+        response, status = listar(user)
+    assert status == 400
+
+
+def test_buscar_proyectos_filtra_y_devuelve_facetas_en_un_aggregate(mongo_stub, monkeypatch):
+    department_id = ObjectId()
+    category_id = ObjectId()
+    project_id = ObjectId()
+    pipelines = []
+
+    def _aggregate(pipeline, session=None):
+        pipelines.append(pipeline)
+        return iter(
+            [
+                {
+                    "rows": [{"_id": project_id, "nombre": "Agua potable", "departamento_id": department_id, "balance": 0}],
+                    "total": [{"count": 1}],
+                    "categorias": [{"_id": category_id, "count": 1}],
+                    "status": [{"_id": 2, "count": 1}],
+                    "departamentos": [{"_id": department_id, "count": 1}],
+                }
+            ]
+        )
+
+    monkeypatch.setattr(mongo_stub.db.proyectos, "aggregate", _aggregate)
+    monkeypatch.setattr(project_routes, "_project_indexes_ready", False)
+    monkeypatch.setattr(project_routes, "_project_text_index_ready", False)
+
+    user = {"sub": str(ObjectId()), "nombre": "Admin", "role": "admin_departamento", "departmentId": str(department_id)}
+    buscar = project_routes.buscar_proyectos.__wrapped__.__wrapped__
+    app = create_app()
+    url = f"/proyectos/search?q=agua&categoria={category_id}&status=2&finalizado=false&desde=2025-01-01&limit=5&page=1"
+    with app.test_request_context(url):
+        payload = buscar(user).get_json()
+
+    assert len(pipelines) == 1
+    match = pipelines[0][0]["$match"]
+    assert match == {
+        "departamento_id": department_id,
+        "$text": {"$search": "agua"},
+        "categoria": category_id,
+        "status.actual": 2,
+        "status.finished": {"$ne": True},
+        "fecha_inicio": {"$gte": "2025-01-01"},
+    }
+    rows_stage = pipelines[0][1]["$facet"]["rows"]
+    assert rows_stage[0]["$sort"] == {"score": {"$meta": "textScore"}, "_id": -1}
+    assert rows_stage[1:3] == [{"$skip": 5}, {"$limit": 5}]
+    assert "miembros" not in rows_stage[3]["$project"]
+
+    assert payload["count"] == 1
+    assert [row["nombre"] for row in payload["request_list"]] == ["Agua potable"]
+    assert payload["facets"] == {
+        "categorias": [{"value": str(category_id), "count": 1}],
+        "status": [{"value": 2, "count": 1}],
+        "departamentos": [{"value": str(department_id), "count": 1}],
+    }
+
+    with app.test_request_context("/proyectos/search?status=x"):
+        _, status = buscar(user)
+    assert status == 400
+
+    # Sin índice de texto la búsqueda cae a subcadena.
+    def _aggregate_sin_indice(pipeline, session=None):
+        if "$text" in pipeline[0]["$match"]:
+            raise OperationFailure("text index required for $text query", code=27)
+        return _aggregate(pipeline)
+
+    monkeypatch.setattr(mongo_stub.db.proyectos, "aggregate", _aggregate_sin_indice)
+    with app.test_request_context("/proyectos/search?q=agua+(potable"):
+        assert buscar(user).get_json()["count"] == 1
+    match = pipelines[-1][0]["$match"]
+    assert match["$or"] == [{"nombre": {"$regex": r"agua\ \(potable", "$options": "i"}}, {"descripcion": {"$regex": r"agua\ \(potable", "$options": "i"}}]
+    assert pipelines[-1][1]["$facet"]["rows"][0]["$sort"] == {"_id": -1}
+
+    # Un índice que Mongo rechaza no se silencia como si existiera.
+    def _create_index(spec, **kwargs):
+        if kwargs.get("name") == "proyectos_texto":
+            raise OperationFailure("language override unsupported", code=17262)
+
+    monkeypatch.setattr(mongo_stub.db.proyectos, "create_index", _create_index)
+    monkeypatch.setattr(project_routes, "_project_indexes_ready", False)
+    monkeypatch.setattr(project_routes, "_project_text_index_ready", True)
+    with app.test_request_context("/proyectos/search?q=agua"):
+        buscar(user)
+    assert "$text" not in pipelines[-1][0]["$match"]
+
+
+def test_project_members_migra_miembros_embebidos_y_lista_mis_proyectos(mongo_stub):
+    user_id = ObjectId()
+    other_id = ObjectId()
+    old_project, new_project, foreign_project = ObjectId(), ObjectId(), ObjectId()
+
+    def _member(member_id, role, joined):
+        return {
+            "usuario": {"_id": {"$oid": str(member_id)}, "nombre": "Ana", "email": "ana@example.com"},
+            "role": {"value": role, "label": role.title()},
+            "fecha_ingreso": joined,
+        }
+
+    mongo_stub.db.proyectos.rows.extend(
+        [
+            {"_id": old_project, "nombre": "Viejo", "balance": 0, "miembros": [_member(user_id, "miembro", "01/02/2025 10:00")]},
+            {
+                "_id": new_project,
+                "nombre": "Nuevo",
+                "balance": 0,
+                "miembros": [_member(user_id, "lider", "01/03/2025 10:00"), _member(other_id, "miembro", "02/03/2025 10:00")],
+            },
+            {"_id": foreign_project, "nombre": "Ajeno", "balance": 0, "miembros": [_member(other_id, "lider", "05/03/2025 10:00")]},
+            {"_id": ObjectId(), "nombre": "Sin miembros", "balance": 0, "miembros": []},
+        ]
+    )
+
+    result = ProjectMembersService.migrate_embedded()
+    assert result == {"projects": 3, "members": 4, "skipped": 0}
+    # Idempotente: re-ejecutar no duplica membresias.
+    ProjectMembersService.migrate_embedded()
+    assert len(mongo_stub.db.project_members.rows) == 4
+    assert ProjectMembersService.project_ids_for_user(str(user_id)) == [old_project, new_project]
+
+    listar = project_routes.mis_proyectos.__wrapped__.__wrapped__
+    app = create_app()
+    with app.test_request_context("/mis_proyectos"):
+        payload = listar({"sub": str(user_id), "nombre": "Ana", "role": "usuario"}).get_json()
+    assert payload["count"] == 2
+    assert [(row["nombre"], row["memberRole"]["value"]) for row in payload["request_list"]] == [
+        ("Nuevo", "lider"),
+        ("Viejo", "miembro"),
+    ]
+    assert all("miembros" not in row for row in payload["request_list"])
+
+    ProjectMembersService.remove_member(new_project, str(user_id))
+    assert ProjectMembersService.project_ids_for_user(user_id) == [old_project]
+